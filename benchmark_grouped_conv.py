@@ -0,0 +1,181 @@
+# Basic imports
+import time
+import argparse
+import tensorflow      as tf
+import numpy           as np
+
+# Custom imports
+from utils.layers_utils import conv_layer, conv3d_layer, set_grouped_conv
+
+
+parser = argparse.ArgumentParser()
+
+# Layer parameters
+
+parser.add_argument('--groups', nargs='+', type=int, default=[2, 4, 8, 32],
+        help = 'Numbers of groups to benchmark, each must divide --channels')
+
+parser.add_argument('--channels', action='store', type=int, default=256,
+        help = 'Number of input and output channels of the convolution')
+
+parser.add_argument('--kernelSize', action='store', type=int, default=3,
+        help = 'Height, width (and depth) of the convolution kernel')
+
+parser.add_argument('--stride', action='store', type=int, default=1,
+        help = 'Stride of the convolution in every spatial dimension')
+
+parser.add_argument('--size', action='store', type=int, default=56,
+        help = 'Height and width of the input')
+
+parser.add_argument('--frames', action='store', type=int, default=8,
+        help = 'Number of input frames, only used with --conv3d 1')
+
+parser.add_argument('--conv3d', action='store', type=int, default=0,
+        help = 'Benchmark conv3d_layer (1) or conv_layer (0)')
+
+parser.add_argument('--batchSize', action='store', type=int, default=8,
+        help = 'Number of inputs in each step')
+
+parser.add_argument('--train', action= 'store', type=int, default=0,
+        help = 'Benchmark the forward and backward pass (1) or the forward pass only (0)')
+
+# Benchmark parameters
+
+parser.add_argument('--methods', nargs='+', type=str, default=['split', 'block_diagonal', 'depthwise', 'auto'],
+        help = 'Grouped convolution implementations to compare, see grouped_convolution in utils/layers_utils.py')
+
+parser.add_argument('--numSteps', action='store', type=int, default=50,
+        help = 'Number of timed steps per implementation')
+
+parser.add_argument('--warmupSteps', action='store', type=int, default=5,
+        help = 'Number of untimed steps run before timing, excludes graph optimization and memory allocation')
+
+parser.add_argument('--gpu', action='store', default='0',
+        help = 'GPU ID to run the convolutions on')
+
+parser.add_argument('--verbose', action='store', type=int, default=1,
+        help = 'Boolean switch to display all print statements or not')
+
+
+args = parser.parse_args()
+
+if args.verbose:
+    print "Setup of current benchmark"
+    print "\n############################"
+    print args
+    print "############################ \n"
+
+# END IF
+
+
+def benchmark_grouped_conv(method, groups, input_value, kernel_size, channels, stride, is_3d, istraining, num_steps, warmup_steps, gpu):
+    """
+    Measure the time of a grouped convolution layer with the given implementation
+    Args:
+        :method:       Grouped convolution implementation passed to set_grouped_conv
+        :groups:       Number of groups of the convolution
+        :input_value:  Numpy array holding the input of the convolution
+        :kernel_size:  Height, width (and depth) of the kernel
+        :channels:     Number of output channels
+        :stride:       Stride of the convolution in every spatial dimension
+        :is_3d:        Boolean indicating whether conv3d_layer or conv_layer is benchmarked
+        :istraining:   Boolean indicating whether the backward pass is timed as well
+        :num_steps:    Number of timed steps
+        :warmup_steps: Number of untimed steps run first
+        :gpu:          GPU ID to run the convolutions on
+
+    Returns:
+        List of step times in seconds and the output of the convolution
+    """
+    set_grouped_conv(method)
+
+    with tf.Graph().as_default():
+        inputs = tf.Variable(input_value, trainable=False, name='benchmark_inputs')
+
+        with tf.device('/gpu:'+gpu):
+            # Identical kernel values for every implementation, so that their outputs can be compared
+            kernel_init = tf.random_normal_initializer(stddev=0.01, seed=1)
+
+            if is_3d:
+                output = conv3d_layer(inputs, [kernel_size, kernel_size, kernel_size, channels], 'grouped_conv', stride_dims=[stride]*3,
+                                      groups=groups, non_linear_fn=None, kernel_init=kernel_init)
+
+            else:
+                output = conv_layer(inputs, [kernel_size, kernel_size, channels], 'grouped_conv', stride_dims=[stride]*2,
+                                    groups=groups, non_linear_fn=None, kernel_init=kernel_init)
+
+            # END IF
+
+            step_op = output
+
+            if istraining:
+                step_op = tf.gradients(tf.reduce_sum(output), [inputs] + tf.trainable_variables()[:1])
+
+            # END IF
+
+        # END WITH
+
+        sess = tf.Session(config=tf.ConfigProto(allow_soft_placement=True))
+        sess.run(tf.global_variables_initializer())
+
+        output_value = sess.run(output)
+
+        for step in range(warmup_steps):
+            sess.run(step_op)
+
+        # END FOR
+
+        step_times = []
+
+        for step in range(num_steps):
+            start = time.time()
+            sess.run(step_op)
+            step_times.append(time.time() - start)
+
+        # END FOR
+
+        sess.close()
+
+    # END WITH
+
+    return step_times, output_value
+
+
+if __name__=="__main__":
+    if args.conv3d:
+        input_shape = [args.batchSize, args.frames, args.size, args.size, args.channels]
+
+    else:
+        input_shape = [args.batchSize, args.size, args.size, args.channels]
+
+    # END IF
+
+    input_value = np.random.uniform(-1., 1., input_shape).astype(np.float32)
+
+    print "%-8s %-16s %12s %12s %12s %10s %12s" % ('groups', 'method', 'p50 (ms)', 'p95 (ms)', 'inputs/s', 'speedup', 'max abs diff')
+
+    for groups in args.groups:
+        if args.channels % groups != 0:
+            print "Skipping %d groups, does not divide %d channels" % (groups, args.channels)
+            continue
+
+        # END IF
+
+        results = []
+
+        for method in args.methods:
+            step_times, output_value = benchmark_grouped_conv(method, groups, input_value, args.kernelSize, args.channels, args.stride,
+                                                              args.conv3d == 1, args.train == 1, args.numSteps, args.warmupSteps, args.gpu)
+
+            results.append((method, np.percentile(step_times, 50), np.percentile(step_times, 95), output_value))
+
+        # END FOR
+
+        # Speedup and output differences are relative to the first method
+        for method, p50, p95, output_value in results:
+            print "%-8d %-16s %12.2f %12.2f %12.2f %9.2fx %12.2e" % (groups, method, p50 * 1000, p95 * 1000, args.batchSize / p50,
+                                                                    results[0][1] / p50, np.abs(output_value - results[0][3]).max())
+
+        # END FOR
+
+    # END FOR
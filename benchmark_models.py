@@ -0,0 +1,389 @@
+# Basic imports
+import time
+import argparse
+import tensorflow      as tf
+import numpy           as np
+
+# Custom imports
+from models             import *
+from utils.layers_utils    import set_fast_batch_norm, set_fold_batch_norm, set_fused_lstm, set_data_format, set_stop_gradient, set_recompute, temporal_windows, lstm, RECOMPUTE_BOUNDARIES
+from utils.checkpoint_utils import checkpoint_dict, initialize_from_dict
+from utils.sys_utils       import set_xla, session_config, jit_scope
+from utils.recompute_utils import recompute_gradients
+
+
+parser = argparse.ArgumentParser()
+
+# Model parameters
+
+parser.add_argument('--model', action= 'store', required=True,
+        help= 'Model architecture (c3d, i3d, tsn, resnet)')
+
+parser.add_argument('--inputDims', action='store', required=True, type=int,
+        help = 'Input Dimensions (Number of frames to pass as input to the model)')
+
+parser.add_argument('--outputDims', action='store', type=int, default=101,
+        help = 'Output Dimensions (Number of classes in dataset)')
+
+parser.add_argument('--seqLength', action='store', required=True, type=int,
+        help = 'Number of output frames expected from model')
+
+parser.add_argument('--size', action='store', required=True, type=int,
+        help = 'Input frame size')
+
+parser.add_argument('--batchSize', action='store', type=int, default=1,
+        help = 'Number of clips in each step')
+
+parser.add_argument('--train', action= 'store', type=int, default=0,
+        help = 'Benchmark a training step (1) or inference (0)')
+
+parser.add_argument('--freeze', action='store', type=int, default=0,
+        help = 'Freeze weights during training of any layers within the model that are expected to be pretrained')
+
+# Benchmark parameters
+
+parser.add_argument('--compare', action='store', default='batch_norm',
+        help = 'Implementations to compare, one of: batch_norm, fold_batch_norm (inference only), lstm (resnet, also loads the checkpoint of each implementation into the other and compares their outputs), data_format (use with --cpu 1 on MKL builds), stop_gradient (training of i3d, or resnet with --freeze 0), xla, recompute (training of i3d or resnet with --freeze 1), stream (c3d inference, windows of --inputDims frames, also checks that both return the same logits for an odd and an even stride)')
+
+parser.add_argument('--streamStride', action='store', type=int, default=4,
+        help = 'Number of frames between the first frames of consecutive windows of --windowDims frames, compared by --compare stream, whose logit check also uses --streamStride + 1')
+
+parser.add_argument('--windowDims', action='store', type=int, default=16,
+        help = 'Number of frames of the windows compared by --compare stream')
+
+parser.add_argument('--numSteps', action='store', type=int, default=50,
+        help = 'Number of timed steps per implementation')
+
+parser.add_argument('--warmupSteps', action='store', type=int, default=5,
+        help = 'Number of untimed steps run before timing, excludes graph optimization and memory allocation')
+
+parser.add_argument('--gpu', action='store', default='0',
+        help = 'GPU ID to run the model on')
+
+parser.add_argument('--cpu', action='store', type=int, default=0,
+        help = 'Boolean indicating whether to run the model on the CPU only, hiding every GPU')
+
+parser.add_argument('--verbose', action='store', type=int, default=1,
+        help = 'Boolean switch to display all print statements or not')
+
+
+args = parser.parse_args()
+
+if args.verbose:
+    print "Setup of current benchmark"
+    print "\n############################"
+    print args
+    print "############################ \n"
+
+# END IF
+
+
+def window_inference(model, inputs, istraining, input_dims, output_dims, seq_length, scope):
+    """
+    Return: Logits of the windows of --windowDims frames starting every --streamStride frames of inputs, each window run through model.inference
+    """
+    batch_size  = inputs.get_shape().as_list()[0]
+    num_windows = (input_dims - args.windowDims) // args.streamStride + 1
+    windows     = temporal_windows(inputs, num_windows, args.streamStride, 0, args.windowDims)
+    logits      = model.inference(windows, istraining, args.windowDims, output_dims, 1, scope)[0]
+
+    return [tf.reshape(logits, [batch_size, num_windows, output_dims])]
+
+
+def streaming_inference(model, inputs, istraining, input_dims, output_dims, seq_length, scope):
+    """
+    Return: Logits of the same windows as window_inference, sharing the early layers of overlapping windows (see C3D.streaming_inference)
+    """
+    return [model.streaming_inference(inputs, output_dims, args.streamStride, scope, args.windowDims)]
+
+
+# Implementations compared by --compare, each a list of (name, function configuring the graph to be built next and returning
+# the inference function of the model to use, None for model.inference)
+COMPARISONS = {'batch_norm':      [('unfused',  lambda: set_fast_batch_norm(False)),
+                                   ('fused',    lambda: set_fast_batch_norm(True))],
+               'fold_batch_norm': [('separate', lambda: set_fold_batch_norm(False)),
+                                   ('folded',   lambda: set_fold_batch_norm(True))],
+               'lstm':            [('dynamic',  lambda: set_fused_lstm(False)),
+                                   ('fused',    lambda: set_fused_lstm(True))],
+               'data_format':     [('NDHWC',    lambda: set_data_format('channels_last')),
+                                   ('NCDHW',    lambda: set_data_format('channels_first'))],
+               'stop_gradient':   [('full',     lambda: set_stop_gradient(False)),
+                                   ('cut',      lambda: set_stop_gradient(True))],
+               'xla':             [('none',     lambda: set_xla('none')),
+                                   ('global',   lambda: set_xla('global')),
+                                   ('scoped',   lambda: set_xla('scoped'))],
+               'recompute':       [('stored',   lambda: set_recompute(False)),
+                                   ('recomputed', lambda: set_recompute(True))],
+               'stream':          [('windows',  lambda: window_inference),
+                                   ('streaming', lambda: streaming_inference)]}
+
+
+def benchmark_step(model, configure, input_dims, output_dims, seq_length, size, batch_size, istraining, num_steps, warmup_steps, gpu, cpu=False):
+    """
+    Measure the time of a model's inference (or training) step on random inputs held in a variable, so that no input pipeline is timed
+    Args:
+        :model:        tf-activity-recognition framework model object
+        :configure:    Function called before the graph is built, selecting the implementation being timed and returning the inference function to
+                       time, None for model.inference
+        :input_dims:   Number of frames used in input
+        :output_dims:  Integer number of classes in current dataset
+        :seq_length:   Length of output sequence expected from LSTM
+        :size:         List detailing height and width of frame
+        :batch_size:   Number of clips in each step
+        :istraining:   Boolean indicating whether a training step (forward, backward and update) or an inference step is timed
+        :num_steps:    Number of timed steps
+        :warmup_steps: Number of untimed steps run first, including the XLA compilation
+        :gpu:          GPU ID to run the model on
+        :cpu:          Boolean indicating whether to run the model on the CPU only
+
+    Returns:
+        List of step times in seconds and peak memory in bytes allocated on the GPU (None on the CPU)
+    """
+    inference = configure() or (lambda model, *inference_args: model.inference(*inference_args))
+
+    with tf.Graph().as_default():
+        inputs = tf.Variable(tf.random_uniform([batch_size, input_dims, size[0], size[1], 3], -1., 1.), trainable=False, name='benchmark_inputs')
+        labels = tf.Variable(tf.random_uniform([batch_size, seq_length], 0, output_dims, dtype=tf.int32), trainable=False, name='benchmark_labels')
+
+        with tf.device('/cpu:0' if cpu else '/gpu:'+gpu):
+            with tf.name_scope("my_scope") as scope, jit_scope():
+                logits = inference(model, inputs, istraining, input_dims, output_dims, seq_length, scope)[0]
+
+            # END WITH
+
+            step_op = logits
+
+            if istraining:
+                variables = tf.trainable_variables()
+
+                if len(variables) == 0:
+                    print "No trainable variables (see --freeze), timing the forward pass only"
+
+                else:
+                    # Batch normalization moving statistics are updated with every step
+                    loss = model.loss(logits, labels, 'full_loss')
+
+                    if len(tf.get_collection(RECOMPUTE_BOUNDARIES)) > 0:
+                        gradients = recompute_gradients(loss, variables, tf.get_collection(RECOMPUTE_BOUNDARIES))
+
+                    else:
+                        gradients = tf.train.GradientDescentOptimizer(0.001).compute_gradients(loss, var_list=variables)
+
+                    # END IF
+
+                    with tf.control_dependencies(tf.get_collection(tf.GraphKeys.UPDATE_OPS)):
+                        step_op = tf.train.GradientDescentOptimizer(0.001).apply_gradients(gradients)
+
+                    # END WITH
+
+                # END IF
+
+            # END IF
+
+            peak_memory = None if cpu else tf.contrib.memory_stats.MaxBytesInUse()
+
+        # END WITH
+
+        sess = tf.Session(config=session_config(allow_soft_placement=True, device_count={'GPU': 0} if cpu else {}))
+        sess.run(tf.global_variables_initializer())
+
+        for step in range(warmup_steps):
+            sess.run(step_op)
+
+        # END FOR
+
+        step_times = []
+
+        for step in range(num_steps):
+            start = time.time()
+            sess.run(step_op)
+            step_times.append(time.time() - start)
+
+        # END FOR
+
+        peak_bytes = None if peak_memory is None else sess.run(peak_memory)
+
+        sess.close()
+
+    # END WITH
+
+    return step_times, peak_bytes
+
+
+def lstm_checkpoint_check(seq_length, batch_size, gpu, cpu=False, feat_size=2048, cell_size=512):
+    """
+    Check that checkpoints load into either lstm implementation: the variables of one are saved as a checkpoint dictionary and loaded into the other,
+    both run on the same random inputs
+    Args:
+        :seq_length: Length of output sequence expected from LSTM
+        :batch_size: Number of clips in each step
+        :gpu:        GPU ID to run the LSTM on
+        :cpu:        Boolean indicating whether to run the LSTM on the CPU only
+        :feat_size:  Size of input to LSTM (resnet)
+        :cell_size:  Size of internal cell (resnet)
+
+    Returns:
+        List of (saved implementation, loaded implementation, largest absolute difference of their outputs)
+    """
+    inputs  = np.random.RandomState(0).uniform(-1., 1., [batch_size * seq_length, feat_size]).astype(np.float32)
+    names   = {False: 'dynamic', True: 'fused'}
+    results = []
+
+    for source, target in [(False, True), (True, False)]:
+        ckpt    = None
+        outputs = []
+
+        for fused in [source, target]:
+            set_fused_lstm(fused)
+
+            with tf.Graph().as_default():
+                with tf.device('/cpu:0' if cpu else '/gpu:'+gpu):
+                    output = lstm(tf.constant(inputs), seq_length, feat_size, cell_size)
+
+                # END WITH
+
+                sess = tf.Session(config=session_config(allow_soft_placement=True, device_count={'GPU': 0} if cpu else {}))
+                sess.run(tf.global_variables_initializer())
+
+                if ckpt is None:
+                    ckpt = checkpoint_dict(sess)
+
+                else:
+                    # Prints a notice for every checkpoint value the graph has no variable for
+                    initialize_from_dict(sess, np.array(ckpt), 'lstm')
+
+                # END IF
+
+                outputs.append(sess.run(output))
+                sess.close()
+
+            # END WITH
+
+        # END FOR
+
+        results.append((names[source], names[target], np.abs(outputs[0] - outputs[1]).max()))
+
+    # END FOR
+
+    set_fused_lstm(True)
+
+    return results
+
+
+def streaming_check(model, input_dims, output_dims, size, batch_size, window_dims, strides, gpu, cpu=False):
+    """
+    Check that C3D.streaming_inference returns the logits of inference on each window: both are built in one graph, sharing the variables of the model,
+    and run on the same random frames
+    Args:
+        :model:       C3D model object
+        :input_dims:  Number of frames the windows are taken from
+        :output_dims: Integer number of classes in current dataset
+        :size:        List detailing height and width of frame
+        :batch_size:  Number of clips in each step
+        :window_dims: Number of frames of each window
+        :strides:     List of numbers of frames between the first frames of consecutive windows, the layers shared by windows depend on its parity
+        :gpu:         GPU ID to run the model on
+        :cpu:         Boolean indicating whether to run the model on the CPU only
+
+    Returns:
+        List of (stride, largest absolute difference of the logits, largest absolute logit of inference)
+    """
+    frames  = np.random.RandomState(0).uniform(-1., 1., [batch_size, input_dims, size[0], size[1], 3]).astype(np.float32)
+    results = []
+
+    for stride in strides:
+        num_windows = (input_dims - window_dims) // stride + 1
+
+        with tf.Graph().as_default():
+            inputs = tf.constant(frames)
+
+            with tf.device('/cpu:0' if cpu else '/gpu:'+gpu):
+                windows       = temporal_windows(inputs, num_windows, stride, 0, window_dims)
+                window_logits = tf.reshape(model.inference(windows, False, window_dims, output_dims, 1, 'windows')[0], [batch_size, num_windows, output_dims])
+
+                with tf.variable_scope(tf.get_variable_scope(), reuse=True):
+                    stream_logits = model.streaming_inference(inputs, output_dims, stride, 'streaming', window_dims)
+
+                # END WITH
+
+            # END WITH
+
+            sess = tf.Session(config=session_config(allow_soft_placement=True, device_count={'GPU': 0} if cpu else {}))
+            sess.run(tf.global_variables_initializer())
+
+            window_values, stream_values = sess.run([window_logits, stream_logits])
+
+            sess.close()
+
+        # END WITH
+
+        results.append((stride, np.abs(window_values - stream_values).max(), np.abs(window_values).max()))
+
+    # END FOR
+
+    return results
+
+
+if __name__=="__main__":
+    model = create_model_object(modelName = args.model,
+                                inputAlpha = 1.0,
+                                clipLength = -1,
+                                numVids = 1,
+                                batchSize = args.batchSize,
+                                numClips = -1,
+                                train = args.train,
+                                expName = 'benchmark_models',
+                                outputDims = args.outputDims,
+                                inputDims = args.inputDims,
+                                freeze = args.freeze,
+                                verbose = args.verbose)
+
+    size    = [args.size, args.size]
+    results = []
+
+    for name, configure in COMPARISONS[args.compare]:
+        step_times, peak_bytes = benchmark_step(model, configure, args.inputDims, args.outputDims, args.seqLength, size, args.batchSize, args.train == 1,
+                                                args.numSteps, args.warmupSteps, args.gpu, args.cpu == 1)
+
+        results.append((name, np.percentile(step_times, 50), np.percentile(step_times, 95), float('nan') if peak_bytes is None else peak_bytes / 2.**20))
+
+    # END FOR
+
+    print "%-12s %12s %12s %12s %10s %14s" % ('variant', 'p50 (ms)', 'p95 (ms)', 'clips/s', 'speedup', 'peak GPU (MB)')
+
+    for name, p50, p95, peak_mb in results:
+        print "%-12s %12.2f %12.2f %12.2f %9.2fx %14.1f" % (name, p50 * 1000, p95 * 1000, args.batchSize / p50, results[0][1] / p50, peak_mb)
+
+    # END FOR
+
+    if args.compare == 'lstm':
+        print "\n%-12s %-12s %22s" % ('saved', 'loaded', 'max output difference')
+
+        for source, target, difference in lstm_checkpoint_check(args.seqLength, args.batchSize, args.gpu, args.cpu == 1):
+            print "%-12s %-12s %22.3g" % (source, target, difference)
+
+        # END FOR
+
+    # END IF
+
+    if args.compare == 'stream':
+        print "\n%-8s %22s %18s" % ('stride', 'max logit difference', 'max |logit|')
+
+        mismatch = False
+
+        for stride, difference, largest in streaming_check(model, args.inputDims, args.outputDims, size, args.batchSize, args.windowDims,
+                                                           [args.streamStride, args.streamStride + 1], args.gpu, args.cpu == 1):
+            print "%-8d %22.3g %18.3g" % (stride, difference, largest)
+
+            # float32 rounding only, relative to the largest logit
+            mismatch = mismatch or difference > 1e-4 * max(largest, 1.)
+
+        # END FOR
+
+        if mismatch:
+            print "Streaming and per window logits differ"
+            exit(1)
+
+        # END IF
+
+    # END IF
@@ -0,0 +1,574 @@
+# Basic imports
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import collections
+import tensorflow      as tf
+import numpy           as np
+
+from tensorflow.python.training import queue_runner_impl
+
+# Custom imports
+from models                          import *
+from utils.load_dataset_tfrecords    import load_dataset, _parse_example, _decode_video, _reduce_fps, _extract_clips, _preprocess_clips
+from utils.load_dataset_numpy        import read_tfrecords
+from utils.numpy_preprocessing_utils import extract_clips, reduce_fps
+from utils.sampling_utils            import set_deterministic_draws
+
+
+parser = argparse.ArgumentParser()
+
+# Model parameters
+
+parser.add_argument('--model', action= 'store', required=True,
+        help= 'Model architecture (c3d, i3d, tsn, resnet)')
+
+parser.add_argument('--inputDims', action='store', required=True, type=int,
+        help = 'Input Dimensions (Number of frames to pass as input to the model)')
+
+parser.add_argument('--outputDims', action='store', type=int, default=101,
+        help = 'Output Dimensions (Number of classes in dataset)')
+
+parser.add_argument('--seqLength', action='store', required=True, type=int,
+        help = 'Number of output frames expected from model')
+
+parser.add_argument('--size', action='store', required=True, type=int,
+        help = 'Input frame size')
+
+parser.add_argument('--inputAlpha', action='store', type=float, default=1.,
+        help = 'Resampling factor for constant value resampling and alpha initialization')
+
+parser.add_argument('--preprocMethod', action='store', default='default',
+        help = 'Which preprocessing method to use')
+
+# Data parameters
+
+parser.add_argument('--dataset', action= 'store', default='UCF101',
+        help= 'Dataset name, used to decide whether frame rates are reduced (HMDB51, MIT)')
+
+parser.add_argument('--baseDataPath', action='store', default='',
+        help = 'Directory containing tfrecords to benchmark on, synthetic tfrecords are generated when empty')
+
+parser.add_argument('--numVids', action='store', type=int, default=16,
+        help = 'Number of synthetic videos to generate')
+
+parser.add_argument('--frames', action='store', type=int, default=250,
+        help = 'Number of frames of each synthetic video')
+
+parser.add_argument('--height', action='store', type=int, default=240,
+        help = 'Frame height of each synthetic video')
+
+parser.add_argument('--width', action='store', type=int, default=320,
+        help = 'Frame width of each synthetic video')
+
+parser.add_argument('--train', action= 'store', type=int, default=0,
+        help = 'Benchmark the training (1) or testing (0) preprocessing')
+
+parser.add_argument('--clipLength', action='store', type=int, default=-1,
+        help = 'Length of clips to cut video into, -1 indicates using the entire video as one clip')
+
+parser.add_argument('--videoOffset', action='store', default='none',
+        help = '(none or random) indicating where to begin selecting video clips assuming clipOffset is none')
+
+parser.add_argument('--clipOffset', action='store', default='none',
+        help = '(none or random) indicating if clips are selected sequentially or randomly')
+
+parser.add_argument('--clipStride', action='store', type=int, default=0,
+        help = 'Number of frames that overlap between clips, 0 indicates no overlap and negative values indicate a gap of frames between clips')
+
+parser.add_argument('--numClips', action='store', type=int, default=-1,
+        help = 'Number of clips to break video into, -1 indicates breaking the video into the maximum number of clips based on clipLength, clipOffset')
+
+parser.add_argument('--batchSize', action='store', type=int, default=1,
+        help = 'Number of clips to dequeue each step')
+
+# Benchmark parameters
+
+parser.add_argument('--backends', nargs='+', type=str, default=['tf', 'numpy'],
+        help = 'Preprocessing backends to benchmark (tf, numpy)')
+
+parser.add_argument('--threadCounts', nargs='+', type=int, default=[1],
+        help = 'Numbers of loading threads (tf backend) or preprocessing processes (numpy backend) to measure throughput with')
+
+parser.add_argument('--stageTiming', action='store', type=int, default=1,
+        help = 'Time each stage of the tf input pipeline (read, parse, decode, reduce fps, clip extraction, preprocess) separately (Default 1)')
+
+parser.add_argument('--numBatches', action='store', type=int, default=50,
+        help = 'Number of batches dequeued per backend')
+
+parser.add_argument('--checkParity', action='store', type=int, default=1,
+        help = 'Compare the clips of the tensorflow and NumPy backends in both phases, with deterministic random draws, before benchmarking. Exits with status 1 on a mismatch (Default 1)')
+
+parser.add_argument('--tolerance', action='store', type=float, default=1e-3,
+        help = 'Largest absolute difference allowed between the tensorflow and NumPy preprocessing')
+
+parser.add_argument('--verbose', action='store', type=int, default=1,
+        help = 'Boolean switch to display all print statements or not')
+
+
+args = parser.parse_args()
+
+if args.verbose:
+    print "Setup of current benchmark"
+    print "\n############################"
+    print args
+    print "############################ \n"
+
+# END IF
+
+
+def _int64(value):
+    return tf.train.Feature(int64_list=tf.train.Int64List(value=[value]))
+
+def _bytes(value):
+    return tf.train.Feature(bytes_list=tf.train.BytesList(value=[value]))
+
+
+def write_synthetic_tfrecords(save_dir, num_vids, frames, height, width, output_dims, static=False):
+    """
+    Write random videos as tfrecords using the same features as utils/generate_tfrecords_dataset.py
+    Args:
+        :save_dir:    Directory to save tfrecords files to
+        :num_vids:    Number of videos to generate
+        :frames:      Number of frames of each video
+        :height:      Frame height
+        :width:       Frame width
+        :output_dims: Number of classes labels are drawn from
+        :static:      Repeat a single random frame, making the preprocessed output independent of random temporal offsets
+
+    Returns:
+        List of tfrecords file names
+    """
+    filenames = []
+
+    for vid in range(num_vids):
+        if static:
+            data = np.tile(np.random.randint(0, 256, [1, height, width, 3]).astype(np.uint8), [frames, 1, 1, 1])
+
+        else:
+            data = np.random.randint(0, 256, [frames, height, width, 3]).astype(np.uint8)
+
+        # END IF
+
+        vidname  = 'synthetic_' + str(vid)
+        filename = os.path.join(save_dir, vidname + '.tfrecords')
+        writer   = tf.python_io.TFRecordWriter(filename)
+
+        features             = {}
+        features['Label']    = _int64(vid % output_dims)
+        features['Data']     = _bytes(data.tostring())
+        features['Frames']   = _int64(frames)
+        features['Height']   = _int64(height)
+        features['Width']    = _int64(width)
+        features['Channels'] = _int64(3)
+        features['Name']     = _bytes(vidname)
+
+        example = tf.train.Example(features=tf.train.Features(feature=features))
+
+        writer.write(example.SerializeToString())
+        writer.close()
+
+        filenames.append(filename)
+
+    # END FOR
+
+    return filenames
+
+
+def check_parity(model, filenames, input_dims, output_dims, seq_length, size, dataset, istraining, clip_length, video_offset, clip_offset, num_clips, clip_stride, tolerance, verbose):
+    """
+    Compare the clips extracted and preprocessed by the tensorflow and NumPy backends from the same videos.
+    Random draws (video and clip offsets, temporal offsets, segment indices, crops and flips) take the lowest value of their range
+    in both backends (see set_deterministic_draws), so that moving videos and the training phase are compared as well
+    Args:
+        :model:       tf-activity-recognition framework model object, with a NumPy preprocessing function
+        :filenames:   List of tfrecords files
+        :tolerance:   Largest absolute difference allowed
+        (remaining arguments as in load_dataset)
+
+    Returns:
+        Boolean indicating whether both backends agree on every video
+    """
+    preprocess_fn, preprocess_kwargs = model.numpy_preprocessing()
+    phase                            = "training" if istraining else "testing"
+    max_diff                         = 0.0
+    passed                           = True
+
+    set_deterministic_draws(True)
+
+    try:
+        with tf.Graph().as_default():
+            video_ph      = tf.placeholder(tf.uint8, [None, None, None, None])
+            frames_ph     = tf.placeholder(tf.int32, [])
+            dims_ph       = [tf.placeholder(tf.int32, []) for dim in range(3)]
+            reduce_fps_op = _reduce_fps(video_ph, frames_ph)[:2]
+
+            if clip_length <= 0:
+                extract_op = tf.to_int32([video_ph])
+
+            else:
+                extract_op = _extract_clips(video_ph, frames_ph, num_clips, clip_offset, clip_length, video_offset, clip_stride, dims_ph[0], dims_ph[1], dims_ph[2])
+
+            # END IF
+
+            # Preprocessing requires a static number of clips, one graph is built for each number of clips encountered
+            label_ph       = tf.placeholder(tf.int32, [])
+            video_step     = tf.Variable(1.0, name='video_step', trainable=False)
+            preprocess_ops = {}
+
+            sess = tf.Session()
+            sess.run(tf.global_variables_initializer())
+
+            for filename in filenames:
+                for features in read_tfrecords(filename):
+                    frames, height, width, channel = int(features['Frames']), int(features['Height']), int(features['Width']), int(features['Channels'])
+                    label                          = int(features['Label'])
+
+                    # BGR to RGB, as done by the NumPy loader
+                    video = np.frombuffer(features['Data'], dtype=np.uint8).reshape(frames, height, width, channel)[...,::-1]
+
+                    # NumPy preprocessing always takes RGB, the tensorflow preprocessing takes the order given by the model
+                    tf_video  = video[...,::-1] if model.input_channel_order() == 'BGR' else video
+                    tf_frames = frames
+
+                    if ('HMDB51' in dataset) or ('MIT' in dataset):
+                        tf_video, tf_frames = sess.run(reduce_fps_op, feed_dict={video_ph: tf_video, frames_ph: frames})
+                        video, frames       = reduce_fps(video, frames)
+
+                    # END IF
+
+                    tf_clips = sess.run(extract_op, feed_dict=dict(zip([video_ph, frames_ph] + dims_ph, [tf_video, tf_frames, height, width, channel])))
+
+                    if clip_length <= 0:
+                        np_clips = video[np.newaxis]
+
+                    else:
+                        np_clips = extract_clips(video, frames, num_clips, clip_offset, clip_length, video_offset, clip_stride)
+
+                    # END IF
+
+                    if tf_clips.shape[0] not in preprocess_ops:
+                        clips_ph = tf.placeholder(tf.int32, [tf_clips.shape[0], None, None, None, None])
+                        preprocess_ops[tf_clips.shape[0]] = (clips_ph, _preprocess_clips(model, clips_ph, dims_ph[0], dims_ph[1], dims_ph[2], input_dims, output_dims, seq_length, size, label_ph, istraining, video_step)[0])
+
+                    # END IF
+
+                    clips_ph, preprocess_op = preprocess_ops[tf_clips.shape[0]]
+
+                    tf_output = sess.run(preprocess_op, feed_dict=dict(zip([clips_ph, label_ph] + dims_ph, [tf_clips, label, height, width, channel])))
+                    np_output = np.stack([preprocess_fn(clip, clip.shape[0], height, width, channel, input_dims, output_dims, seq_length, size, label, istraining, **preprocess_kwargs) for clip in np_clips])
+
+                    if tf_output.shape != np_output.shape:
+                        print "Shape mismatch for " + filename + " (" + phase + "): tf " + str(tf_output.shape) + ", numpy " + str(np_output.shape)
+                        passed = False
+                        continue
+
+                    # END IF
+
+                    diff     = float(np.abs(tf_output - np_output).max())
+                    max_diff = max(max_diff, diff)
+
+                    if diff > tolerance:
+                        print "Output mismatch for " + filename + " (" + phase + "): max abs difference " + str(diff)
+                        passed = False
+
+                    # END IF
+
+                # END FOR
+
+            # END FOR
+
+            sess.close()
+
+        # END WITH
+
+    finally:
+        set_deterministic_draws(False)
+
+    # END TRY
+
+    if verbose:
+        print "Parity check (" + phase + ") " + ("passed" if passed else "FAILED") + ", max abs difference: " + str(max_diff)
+
+    # END IF
+
+    return passed
+
+
+def benchmark_backend(model, backend, data_path, input_dims, output_dims, seq_length, size, dataset, istraining, clip_length, video_offset, clip_offset, num_clips, clip_stride, batch_size, num_batches, num_threads, verbose):
+    """
+    Measure the number of preprocessed clips per second delivered by the clip queue of a preprocessing backend
+    Args:
+        :backend:     'tf' or 'numpy', see load_dataset
+        :num_batches: Number of batches dequeued after a warm up batch
+        :num_threads: Number of loading threads (tf backend) or preprocessing processes (numpy backend)
+        (remaining arguments as in load_dataset)
+
+    Returns:
+        Clips per second
+    """
+    with tf.Graph().as_default():
+        video_step = tf.Variable(1.0, name='video_step', trainable=False)
+
+        # Clip cache disabled, testing clips would otherwise be read back instead of preprocessed
+        input_data_tensor, labels_tensor, names_tensor = load_dataset(model, 1, batch_size, output_dims, input_dims, seq_length, size, data_path, dataset, istraining, clip_length, video_offset, clip_offset, num_clips, clip_stride, video_step, 0, 0, verbose, backend, num_threads, '', num_threads)
+
+        sess = tf.Session(config=tf.ConfigProto(allow_soft_placement=True))
+        sess.run([tf.global_variables_initializer(), tf.local_variables_initializer()])
+
+        coord   = tf.train.Coordinator()
+        threads = queue_runner_impl.start_queue_runners(sess=sess, coord=coord)
+
+        # Warm up batch, excludes pool startup and graph initialization
+        sess.run(input_data_tensor)
+
+        start = time.time()
+
+        for batch in range(num_batches):
+            sess.run(input_data_tensor)
+
+        # END FOR
+
+        elapsed = time.time() - start
+
+        coord.request_stop()
+        coord.join(threads, stop_grace_period_secs=10, ignore_live_threads=True)
+        sess.close()
+
+    # END WITH
+
+    clips_per_sec = num_batches * batch_size / elapsed
+
+    if verbose:
+        print backend + " backend, " + str(num_threads) + " thread(s): " + str(num_batches * batch_size) + " clips in " + str(round(elapsed, 2)) + "s, " + str(round(clips_per_sec, 2)) + " clips/s"
+
+    # END IF
+
+    return clips_per_sec
+
+
+def time_stages(model, filenames, input_dims, output_dims, seq_length, size, dataset, istraining, clip_length, video_offset, clip_offset, num_clips, clip_stride):
+    """
+    Time every stage of the tf input pipeline (_load_video in utils/load_dataset_tfrecords.py) separately on each video.
+    Each stage is a separate session call fed with the output of the previous one, its time includes copying that input into the session.
+    Args:
+        :filenames: List of tfrecords files
+        (remaining arguments as in load_dataset)
+
+    Returns:
+        Ordered dictionary of per video times (seconds) of each stage and the total number of clips produced
+    """
+    stages = collections.OrderedDict((stage, []) for stage in ['read', 'parse', 'decode', 'reduce_fps', 'extract_clips', 'preprocess'])
+    clips  = 0
+
+    with tf.Graph().as_default():
+        tf.set_random_seed(0)
+
+        # Files are fed one at a time so that reading a record is timed on its own
+        filename_ph  = tf.placeholder(tf.string, [])
+        file_q       = tf.FIFOQueue(1, [tf.string])
+        enqueue_file = file_q.enqueue(filename_ph)
+        _, read_op   = tf.TFRecordReader().read(file_q)
+
+        serialized_ph = tf.placeholder(tf.string, [])
+        parse_op      = _parse_example(serialized_ph)
+
+        data_ph   = tf.placeholder(tf.string, [])
+        dims_ph   = [tf.placeholder(tf.int32, []) for dim in range(4)]
+        decode_op = _decode_video(data_ph, *dims_ph, channel_order=model.input_channel_order())
+
+        video_ph      = tf.placeholder(tf.uint8, [None, None, None, None])
+        frames_ph     = tf.placeholder(tf.int32, [])
+        reduce_fps_op = _reduce_fps(video_ph, frames_ph)[:2]
+
+        if clip_length <= 0:
+            extract_op = tf.to_int32([video_ph])
+
+        else:
+            extract_op = _extract_clips(video_ph, frames_ph, num_clips, clip_offset, clip_length, video_offset, clip_stride, dims_ph[1], dims_ph[2], dims_ph[3])
+
+        # END IF
+
+        # Preprocessing requires a static number of clips, one graph is built for each number of clips encountered
+        label_ph       = tf.placeholder(tf.int32, [])
+        video_step     = tf.Variable(1.0, name='video_step', trainable=False)
+        preprocess_ops = {}
+
+        sess = tf.Session(config=tf.ConfigProto(allow_soft_placement=True))
+        sess.run(tf.global_variables_initializer())
+
+        for filename in filenames:
+            sess.run(enqueue_file, feed_dict={filename_ph: filename})
+
+            start      = time.time()
+            serialized = sess.run(read_op)
+            stages['read'].append(time.time() - start)
+
+            start    = time.time()
+            features = sess.run(parse_op, feed_dict={serialized_ph: serialized})
+            stages['parse'].append(time.time() - start)
+
+            dims = [int(features['Frames']), int(features['Height']), int(features['Width']), int(features['Channels'])]
+
+            start = time.time()
+            video = sess.run(decode_op, feed_dict=dict(zip([data_ph] + dims_ph, [features['Data']] + dims)))
+            stages['decode'].append(time.time() - start)
+
+            frames = dims[0]
+
+            # Reduction in fps to 25 is only applied to HMDB51 and MIT
+            if ('HMDB51' in dataset) or ('MIT' in dataset):
+                start         = time.time()
+                video, frames = sess.run(reduce_fps_op, feed_dict={video_ph: video, frames_ph: frames})
+                stages['reduce_fps'].append(time.time() - start)
+
+            # END IF
+
+            start       = time.time()
+            video_clips = sess.run(extract_op, feed_dict=dict(zip([video_ph, frames_ph] + dims_ph, [video, frames] + dims)))
+            stages['extract_clips'].append(time.time() - start)
+
+            if video_clips.shape[0] not in preprocess_ops:
+                clips_ph = tf.placeholder(tf.int32, [video_clips.shape[0], None, None, None, None])
+                preprocess_ops[video_clips.shape[0]] = (clips_ph, _preprocess_clips(model, clips_ph, dims_ph[1], dims_ph[2], dims_ph[3], input_dims, output_dims, seq_length, size, label_ph, istraining, video_step)[0])
+
+            # END IF
+
+            clips_ph, preprocess_op = preprocess_ops[video_clips.shape[0]]
+
+            start = time.time()
+            sess.run(preprocess_op, feed_dict=dict(zip([clips_ph, label_ph] + dims_ph[1:], [video_clips, int(features['Label'])] + dims[1:])))
+            stages['preprocess'].append(time.time() - start)
+
+            clips += video_clips.shape[0]
+
+        # END FOR
+
+        sess.close()
+
+    # END WITH
+
+    return stages, clips
+
+
+def print_stage_times(stages, clips, num_vids):
+    """
+    Print the p50 and p95 per video time of each stage, its share of the total and the clips/s a single thread would sustain if it were the only stage
+    Args:
+        :stages:   Ordered dictionary of per video times returned by time_stages
+        :clips:    Total number of clips produced
+        :num_vids: Number of timed videos
+    """
+    total = sum([sum(times) for times in stages.values()])
+
+    print "%-14s %10s %10s %8s %12s" % ('stage', 'p50 (ms)', 'p95 (ms)', 'share', 'clips/s')
+
+    for stage, times in stages.items():
+        if len(times) == 0:
+            print "%-14s %10s %10s %8s %12s" % (stage, '-', '-', '-', '-')
+            continue
+
+        # END IF
+
+        print "%-14s %10.2f %10.2f %7.1f%% %12.2f" % (stage, np.percentile(times, 50) * 1000, np.percentile(times, 95) * 1000, 100. * sum(times) / total, clips / sum(times))
+
+    # END FOR
+
+    print "%-14s %10s %10s %8s %12.2f" % ('total', '', '', '', clips / total)
+    print str(num_vids) + " videos, " + str(clips) + " clips"
+
+
+if __name__=="__main__":
+    model = create_model_object(modelName = args.model,
+                                inputAlpha = args.inputAlpha,
+                                clipLength = args.clipLength,
+                                numVids = args.numVids,
+                                batchSize = args.batchSize,
+                                numClips = args.numClips,
+                                train = args.train,
+                                expName = 'benchmark_preprocessing',
+                                outputDims = args.outputDims,
+                                inputDims = args.inputDims,
+                                preprocMethod = args.preprocMethod,
+                                verbose = args.verbose)
+
+    size     = [args.size, args.size]
+    temp_dir = tempfile.mkdtemp()
+
+    try:
+        if args.checkParity:
+            if model.numpy_preprocessing() is None:
+                print "Parity check skipped: " + args.model + " has no NumPy preprocessing for preprocMethod " + args.preprocMethod
+
+            else:
+                # Moving videos, static videos and short videos that are looped to fill the temporal footprint of the model
+                parity_dir = os.path.join(temp_dir, 'parity')
+                filenames  = []
+
+                for subset, frames, static in [('moving', args.frames, False), ('static', args.frames, True), ('short', max(args.frames/4, 1), False)]:
+                    subset_dir = os.path.join(parity_dir, subset)
+                    os.makedirs(subset_dir)
+                    filenames += write_synthetic_tfrecords(subset_dir, 2, frames, args.height, args.width, args.outputDims, static=static)
+
+                # END FOR
+
+                # Both phases are compared whatever --train
+                passed = [check_parity(model, filenames, args.inputDims, args.outputDims, args.seqLength, size, args.dataset, istraining, args.clipLength,
+                                       args.videoOffset, args.clipOffset, args.numClips, args.clipStride, args.tolerance, args.verbose) for istraining in [False, True]]
+
+                if not all(passed):
+                    print "Parity check failed: the tensorflow and NumPy preprocessing disagree"
+                    sys.exit(1)
+
+                # END IF
+
+            # END IF
+
+        # END IF
+
+        if args.baseDataPath == '':
+            data_path = os.path.join(temp_dir, 'throughput')
+            os.makedirs(data_path)
+            write_synthetic_tfrecords(data_path, args.numVids, args.frames, args.height, args.width, args.outputDims)
+
+        else:
+            data_path = args.baseDataPath
+
+        # END IF
+
+        if args.stageTiming:
+            filenames     = sorted([os.path.join(data_path, f) for f in os.listdir(data_path)])[:args.numVids]
+            stages, clips = time_stages(model, filenames, args.inputDims, args.outputDims, args.seqLength, size, args.dataset, args.train == 1,
+                                        args.clipLength, args.videoOffset, args.clipOffset, args.numClips, args.clipStride)
+
+            print_stage_times(stages, clips, len(filenames))
+
+        # END IF
+
+        results = {}
+
+        for backend in args.backends:
+            for num_threads in args.threadCounts:
+                results[(backend, num_threads)] = benchmark_backend(model, backend, data_path, args.inputDims, args.outputDims, args.seqLength, size, args.dataset, args.train == 1,
+                                                                    args.clipLength, args.videoOffset, args.clipOffset, args.numClips, args.clipStride, args.batchSize, args.numBatches,
+                                                                    num_threads, args.verbose)
+
+            # END FOR
+
+        # END FOR
+
+        for num_threads in args.threadCounts:
+            if (('tf', num_threads) in results) and (('numpy', num_threads) in results):
+                print "NumPy backend speedup over tf backend with " + str(num_threads) + " thread(s): " + str(round(results[('numpy', num_threads)] / results[('tf', num_threads)], 2)) + "x"
+
+            # END IF
+
+        # END FOR
+
+    finally:
+        shutil.rmtree(temp_dir)
+
+    # END TRY
@@ -0,0 +1,186 @@
+# Basic imports
+import os
+import argparse
+import tensorflow      as tf
+import numpy           as np
+
+# Custom imports
+from models                       import *
+from utils                        import initialize_from_dict, load_checkpoint, fold_batch_norms
+from utils.export_utils           import build_inference_graph, freeze_graph, write_graph
+from utils.frozen_model           import FrozenModel, OUTPUT_SCOPE
+
+
+parser = argparse.ArgumentParser()
+
+# Model parameters
+
+parser.add_argument('--model', action= 'store', required=True,
+        help= 'Model architecture (c3d, i3d, tsn, resnet)')
+
+parser.add_argument('--inputDims', action='store', required=True, type=int,
+        help = 'Input Dimensions (Number of frames to pass as input to the model)')
+
+parser.add_argument('--outputDims', action='store', required=True, type=int,
+        help = 'Output Dimensions (Number of classes in dataset)')
+
+parser.add_argument('--seqLength', action='store', required=True, type=int,
+        help = 'Number of output frames expected from model')
+
+parser.add_argument('--size', action='store', required=True, type=int,
+        help = 'Input frame size')
+
+parser.add_argument('--inputAlpha', action='store', type=float, default=1.,
+        help = 'Resampling factor for constant value resampling of input video')
+
+parser.add_argument('--returnLayer', nargs='+',type=str, default=['logits'],
+        help = 'Model layers exported as outputs of the graph')
+
+parser.add_argument('--loadWeights', action='store', type=str, default='default',
+        help = 'String which can be used to specify the default weights to load.')
+
+parser.add_argument('--preprocMethod', action='store', default='default',
+        help = 'Which preprocessing method to embed in the graph (default, cvr, rr, sr are options for existing models)')
+
+# Checkpoint parameters
+
+parser.add_argument('--load', action='store', type=int, default=1,
+        help = 'Whether to export a saved checkpoint of the experiment (1) or the default weights of the model (0)')
+
+parser.add_argument('--loadedDataset', action= 'store', required=True,
+        help= 'Dataset (UCF101, HMDB51) the checkpoint was trained on')
+
+parser.add_argument('--expName', action='store', required=True,
+        help = 'Name of the experiment whose checkpoint is exported')
+
+parser.add_argument('--loadedCheckpoint', action='store', type=int, default=-1,
+        help = 'Step of the saved checkpoint to export. Defaults to most recent checkpoint.')
+
+# Input parameters
+
+parser.add_argument('--numClips', action='store', type=int, default=1,
+        help = 'Number of clips in each input of the exported graph')
+
+parser.add_argument('--clipLength', action='store', type=int, default=-1,
+        help = 'Number of frames of each input clip, -1 uses inputDims. The frame rate reduction of HMDB51 is not part of the graph')
+
+parser.add_argument('--frameHeight', action='store', type=int, default=240,
+        help = 'Height of the input frames, resized or cropped by the preprocessing embedded in the graph')
+
+parser.add_argument('--frameWidth', action='store', type=int, default=320,
+        help = 'Width of the input frames, resized or cropped by the preprocessing embedded in the graph')
+
+# Export parameters
+
+parser.add_argument('--outputPath', action='store', default='',
+        help = 'Path of the frozen graph file, defaults to results/<model>/<loadedDataset>/<preprocMethod>/<expName>/frozen/<model>_frozen.pb')
+
+parser.add_argument('--verify', action='store', type=int, default=1,
+        help = 'Boolean indicating whether to compare the outputs of the frozen graph and of the model on random clips')
+
+parser.add_argument('--verbose', action='store', type=int, default=1,
+        help = 'Boolean switch to display all print statements or not')
+
+
+args = parser.parse_args()
+
+if args.verbose:
+    print "Setup of current export"
+    print "\n############################"
+    print args
+    print "############################ \n"
+
+# END IF
+
+
+def export(model, input_dims, output_dims, seq_length, size, return_layer, load_model, loaded_dataset, experiment_name, loaded_checkpoint, preproc_method,
+           num_clips, clip_length, frame_height, frame_width, output_path, verify, verbose):
+    """
+    Export a model and its weights as a single frozen inference graph, read back by utils/frozen_model.py
+    Args:
+        (arguments as in build_inference_graph of utils/export_utils.py)
+        :load_model:        Boolean variable indicating whether to load from a checkpoint or the default weights of the model
+        :loaded_dataset:    Name of dataset which was used to train the current model
+        :experiment_name:   Name of the experiment of the checkpoint
+        :loaded_checkpoint: Step of the checkpoint, -1 for the most recent one
+        :preproc_method:    The preprocessing method embedded in the graph
+        :output_path:       Path of the frozen graph file
+        :verify:            Boolean indicating whether to compare the outputs of the frozen graph and of the model
+        :verbose:           Boolean to indicate if all print statement should be procesed or not
+
+    Returns:
+        Does not return anything
+    """
+    if load_model:
+        ckpt = load_checkpoint(model.name, loaded_dataset, experiment_name, loaded_checkpoint, preproc_method)[0]
+
+    else:
+        ckpt = model.load_default_weights()
+
+    # END IF
+
+    with tf.Graph().as_default():
+        clips, output_names = build_inference_graph(model, input_dims, output_dims, seq_length, size, return_layer, num_clips, clip_length, frame_height, frame_width)
+
+        sess = tf.Session(config=tf.ConfigProto(allow_soft_placement=True))
+        sess.run(tf.global_variables_initializer())
+
+        if ckpt is None:
+            print "Caution: Model weights are not being loaded, exporting a random initialization."
+
+            # Folded batch normalizations keep their default statistics
+            fold_batch_norms(sess)
+
+        else:
+            initialize_from_dict(sess, ckpt, model.name)
+
+        # END IF
+
+        graph_def = freeze_graph(sess, output_names, verbose)
+        write_graph(graph_def, output_path, verbose)
+
+        if verify:
+            input_value = np.random.randint(0, 256, clips.get_shape().as_list()).astype(np.uint8)
+            expected    = sess.run(output_names, feed_dict={clips: input_value})
+
+            frozen = FrozenModel(output_path)
+            actual = frozen.run(input_value)
+            frozen.close()
+
+            for name, value in zip(output_names, expected):
+                print "%-30s max abs diff %.2e" % (name, np.abs(actual[name[len(OUTPUT_SCOPE)+1:]] - value).max())
+
+            # END FOR
+
+        # END IF
+
+        sess.close()
+
+    # END WITH
+
+
+if __name__=="__main__":
+    model = models_import.create_model_object(modelName = args.model,
+                                              inputAlpha = args.inputAlpha,
+                                              clipLength = args.clipLength,
+                                              numVids = 1,
+                                              batchSize = args.numClips,
+                                              numClips = args.numClips,
+                                              train = 0,
+                                              expName = args.expName,
+                                              outputDims = args.outputDims,
+                                              inputDims = args.inputDims,
+                                              preprocMethod = args.preprocMethod,
+                                              loadWeights = args.loadWeights,
+                                              verbose = args.verbose)
+
+    output_path = args.outputPath
+
+    if output_path == '':
+        output_path = os.path.join('results', model.name, args.loadedDataset, args.preprocMethod, args.expName, 'frozen', model.name+'_frozen.pb')
+
+    # END IF
+
+    export(model, args.inputDims, args.outputDims, args.seqLength, [args.size, args.size], args.returnLayer, args.load, args.loadedDataset, args.expName,
+           args.loadedCheckpoint, args.preprocMethod, args.numClips, args.clipLength if args.clipLength > 0 else args.inputDims, args.frameHeight, args.frameWidth,
+           output_path, args.verify, args.verbose)
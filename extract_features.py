@@ -0,0 +1,304 @@
+# Basic imports
+import os
+import argparse
+import tensorflow      as tf
+import numpy           as np
+
+# Tensorflow ops imports
+from tensorflow.python.training import queue_runner_impl
+
+# Custom imports
+from models                       import *
+from utils                        import initialize_from_dict, load_checkpoint, fold_batch_norms
+from utils.sys_utils              import session_config
+from utils.feature_store          import LayerFeatureWriter
+from utils.load_dataset_tfrecords import load_dataset
+
+
+parser = argparse.ArgumentParser()
+
+# Model parameters
+
+parser.add_argument('--model', action= 'store', required=True,
+        help= 'Model architecture (c3d, i3d, tsn, resnet)')
+
+parser.add_argument('--inputDims', action='store', required=True, type=int,
+        help = 'Input Dimensions (Number of frames to pass as input to the model)')
+
+parser.add_argument('--outputDims', action='store', required=True, type=int,
+        help = 'Output Dimensions (Number of classes in dataset)')
+
+parser.add_argument('--seqLength', action='store', required=True, type=int,
+        help = 'Number of output frames expected from model')
+
+parser.add_argument('--size', action='store', required=True, type=int,
+        help = 'Input frame size')
+
+parser.add_argument('--inputAlpha', action='store', type=float, default=1.,
+        help = 'Resampling factor for constant value resampling of input video')
+
+parser.add_argument('--loadWeights', action='store', type=str, default='default',
+        help = 'String which can be used to specify the default weights to load.')
+
+parser.add_argument('--preprocMethod', action='store', default='default',
+        help = 'Which preprocessing method to use (default, cvr, rr, sr are options for existing models)')
+
+parser.add_argument('--returnLayer', nargs='+', type=str, required=True,
+        help = 'Names of the layers whose outputs are extracted, all computed in one forward pass')
+
+# Checkpoint parameters
+
+parser.add_argument('--load', action='store', type=int, default=1,
+        help = 'Whether to extract features with a saved checkpoint of the experiment (1) or the default weights of the model (0)')
+
+parser.add_argument('--loadedDataset', action= 'store', required=True,
+        help= 'Dataset (UCF101, HMDB51) the checkpoint was trained on')
+
+parser.add_argument('--expName', action='store', required=True,
+        help = 'Name of the experiment whose checkpoint is used')
+
+parser.add_argument('--loadedCheckpoint', action='store', type=int, default=-1,
+        help = 'Step of the saved checkpoint to use. Defaults to most recent checkpoint.')
+
+parser.add_argument('--randomInit', action='store', type=int, default=0,
+        help = 'Randomly initialize model weights, not loading from any files (default False)')
+
+# Data parameters
+
+parser.add_argument('--dataset', action= 'store', required=True,
+        help= 'Dataset (UCF101, HMDB51) whose clips are extracted')
+
+parser.add_argument('--numVids', action='store', required=True, type=int,
+        help = 'Number of videos to extract the features of')
+
+parser.add_argument('--split', action='store', type=int, default=1,
+        help = 'Dataset split to use')
+
+parser.add_argument('--baseDataPath', action='store', default='/z/dat',
+        help = 'Path to datasets')
+
+parser.add_argument('--fName', action='store', default='testlist',
+        help = 'Which dataset list to extract (trainlist, testlist, vallist)')
+
+parser.add_argument('--clipLength', action='store', type=int, default=-1,
+        help = 'Length of clips to cut video into, -1 indicates using the entire video as one clip')
+
+parser.add_argument('--videoOffset', action='store', default='none',
+        help = '(none or random) indicating where to begin selecting video clips assuming clipOffset is none')
+
+parser.add_argument('--clipOffset', action='store', default='none',
+        help = '(none or random) indicating if clips are selected sequentially or randomly')
+
+parser.add_argument('--clipStride', action='store', type=int, default=0,
+        help = 'Number of frames that overlap between clips, 0 indicates no overlap and negative values indicate a gap of frames between clips')
+
+parser.add_argument('--numClips', action='store', type=int, default=-1,
+        help = 'Number of clips to break video into, -1 indicates breaking the video into the maximum number of clips based on clipLength, clipStride, and clipOffset')
+
+parser.add_argument('--batchSize', action='store', type=int, default=1,
+        help = 'Number of clips to load into the model each step')
+
+parser.add_argument('--clipCacheDir', action='store', default='clip_cache',
+        help = 'Directory caching preprocessed testing clips, shared with test.py, not used for random clips (videoOffset or clipOffset random, preprocMethod rr), empty string disables the cache (Default clip_cache)')
+
+# Store parameters
+
+parser.add_argument('--outputPath', action='store', default='',
+        help = 'Path of the HDF5 feature file, defaults to results/<model>/<loadedDataset>/<preprocMethod>/<expName>/features/<dataset>_<fName>_split<split>.hdf5')
+
+parser.add_argument('--chunkSize', action='store', type=int, default=64,
+        help = 'Number of clips written at a time, and largest number of clips in each HDF5 chunk (Default 64)')
+
+parser.add_argument('--compression', action='store', default='gzip',
+        help = 'Compression of the stored features: gzip, lzf (faster, larger files) or none (Default gzip)')
+
+parser.add_argument('--gpu', action='store', default='0',
+        help = 'GPU ID to run the model on')
+
+parser.add_argument('--verbose', action='store', type=int, default=1,
+        help = 'Boolean switch to display all print statements or not')
+
+
+args = parser.parse_args()
+
+if args.verbose:
+    print "Setup of current extraction"
+    print "\n############################"
+    print args
+    print "############################ \n"
+
+# END IF
+
+
+def extract(model, input_dims, output_dims, seq_length, size, return_layer, load_model, loaded_dataset, experiment_name, loaded_checkpoint, random_init, preproc_method,
+            dataset, num_vids, split, base_data_path, f_name, clip_length, video_offset, clip_offset, num_clips, clip_stride, batch_size, clip_cache_dir, output_path,
+            chunk_size, compression, gpu, verbose):
+    """
+    Store the outputs of every requested layer for every testing clip of num_vids videos, computed in one forward pass per batch (see LayerFeatureWriter)
+    Args:
+        :model:             tf-activity-recognition framework model object
+        :input_dims:        Number of frames used in input
+        :output_dims:       Integer number of classes in current dataset
+        :seq_length:        Length of output sequence expected from LSTM
+        :size:              List detailing height and width of frame
+        :return_layer:      List of names of the layers whose outputs are stored
+        :load_model:        Boolean variable indicating whether to load from a checkpoint or the default weights of the model
+        :loaded_dataset:    Name of dataset which was used to train the current model
+        :experiment_name:   Name of the experiment of the checkpoint
+        :loaded_checkpoint: Step of the checkpoint, -1 for the most recent one
+        :random_init:       Randomly initialize model weights, not loading from any files
+        :preproc_method:    The preprocessing method to use, default, cvr, rr, sr, or any other custom preprocessing
+        :dataset:           Name of dataset being extracted
+        :num_vids:          Number of videos to extract the features of
+        :split:             Split of dataset being used
+        :base_data_path:    Full path to root directory containing datasets
+        :f_name:            Specific video directory within a chosen split of a dataset
+        :clip_length:       Length of clips to cut video into, -1 indicates using the entire video as one clip
+        :video_offset:      String indicating where to begin selecting video clips (provided clipOffset is None)
+        :clip_offset:       "none" or "random" indicating where to begin selecting video clips
+        :num_clips:         Number of clips to break video into
+        :clip_stride:       Number of frames that overlap between clips, 0 indicates no overlap and negative values indicate a gap of frames between clips
+        :batch_size:        Number of clips to load into the model each step
+        :clip_cache_dir:    Directory caching preprocessed testing clips, '' disables the cache
+        :output_path:       Path of the HDF5 feature file
+        :chunk_size:        Number of clips written at a time, and largest number of clips in each HDF5 chunk
+        :compression:       Compression of the stored features, gzip, lzf or none
+        :gpu:               GPU ID to run the model on
+        :verbose:           Boolean to indicate if all print statement should be procesed or not
+
+    Returns:
+        Does not return anything
+    """
+    if load_model:
+        ckpt = load_checkpoint(model.name, loaded_dataset, experiment_name, loaded_checkpoint, preproc_method)[0]
+
+    else:
+        ckpt = model.load_default_weights()
+
+    # END IF
+
+    data_path = os.path.join(base_data_path, 'tfrecords_'+dataset, 'Split'+str(split), f_name)
+
+    with tf.Graph().as_default():
+        video_step = tf.Variable(1.0, name='video_step', trainable=False)
+        sess       = tf.Session(config=session_config(allow_soft_placement=True))
+
+        input_data_tensor, labels_tensor, names_tensor = load_dataset(model, 1, batch_size, output_dims, input_dims, seq_length, size, data_path, dataset, False, clip_length, video_offset,
+                                                                      clip_offset, num_clips, clip_stride, video_step, 0, 0, verbose, 'tf', 0, clip_cache_dir)
+
+        with tf.device('/gpu:'+gpu):
+            with tf.name_scope("my_scope") as scope:
+                # Built up to the deepest requested layer only
+                layer_tensors = model.inference(input_data_tensor[0:batch_size,:,:,:,:], False, input_dims, output_dims, seq_length, scope, return_layer=return_layer)
+
+            # END WITH
+
+        # END WITH
+
+        sess.run(tf.global_variables_initializer())
+
+        if ((ckpt is None) or (random_init)):
+            print "Caution: Model weights are not being loaded, extracting features of a random initialization."
+
+            # Folded batch normalizations keep their default statistics
+            fold_batch_norms(sess)
+
+        else:
+            initialize_from_dict(sess, ckpt, model.name)
+
+        # END IF
+
+        del ckpt
+
+        coord   = tf.train.Coordinator()
+        threads = queue_runner_impl.start_queue_runners(sess=sess, coord=coord)
+
+        config = {'model': model.name, 'load_weights': model.load_weights, 'loaded_dataset': loaded_dataset, 'experiment_name': experiment_name,
+                  'loaded_checkpoint': loaded_checkpoint, 'random_init': random_init, 'preproc_method': preproc_method, 'dataset': dataset, 'split': split,
+                  'f_name': f_name, 'input_dims': input_dims, 'seq_length': seq_length, 'size': size, 'clip_length': clip_length, 'clip_offset': clip_offset,
+                  'num_clips': num_clips, 'clip_stride': clip_stride, 'layers': return_layer}
+
+        writer            = LayerFeatureWriter(output_path, return_layer, config, chunk_size, compression)
+        previous_vid_name = ''
+        videos_loaded     = 0
+        clips_stored      = 0
+
+        while videos_loaded <= num_vids:
+            outputs = sess.run(layer_tensors + [labels_tensor, names_tensor])
+            labels  = outputs[-2]
+            names   = outputs[-1]
+
+            # Rows of each layer output belonging to each clip (e.g. TSN segments or ResNet frames)
+            features = [np.reshape(output, [len(names), -1] + list(output.shape[1:])) for output in outputs[:-2]]
+
+            for batch_idx in range(len(names)):
+                if names[batch_idx] != previous_vid_name:
+                    previous_vid_name = names[batch_idx]
+                    videos_loaded    += 1
+
+                    if verbose:
+                        print "Number of videos loaded: ", videos_loaded
+
+                    # END IF
+
+                # END IF
+
+                # Remaining clips of the batch belong to the video after the last one
+                if videos_loaded > num_vids:
+                    break
+
+                # END IF
+
+                writer.add(dict((layer, output[batch_idx]) for layer, output in zip(return_layer, features)), labels[batch_idx][0], names[batch_idx])
+                clips_stored += 1
+
+            # END FOR
+
+        # END WHILE
+
+        writer.close()
+        coord.request_stop()
+        coord.join(threads)
+        sess.close()
+
+    # END WITH
+
+    if verbose:
+        print "Features of %d clips of %d videos written to %s" % (clips_stored, num_vids, output_path)
+
+    # END IF
+
+
+if __name__=="__main__":
+    model = models_import.create_model_object(modelName = args.model,
+                                              inputAlpha = args.inputAlpha,
+                                              clipLength = args.clipLength,
+                                              numVids = args.numVids,
+                                              batchSize = args.batchSize,
+                                              numClips = args.numClips,
+                                              train = 0,
+                                              expName = args.expName,
+                                              outputDims = args.outputDims,
+                                              inputDims = args.inputDims,
+                                              preprocMethod = args.preprocMethod,
+                                              loadWeights = args.loadWeights,
+                                              verbose = args.verbose)
+
+    output_path = args.outputPath
+
+    if output_path == '':
+        output_dir = os.path.join('results', model.name, args.loadedDataset, args.preprocMethod, args.expName, 'features')
+
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+
+        # END IF
+
+        output_path = os.path.join(output_dir, '%s_%s_split%d.hdf5' % (args.dataset, args.fName, args.split))
+
+    # END IF
+
+    extract(model, args.inputDims, args.outputDims, args.seqLength, [args.size, args.size], args.returnLayer, args.load, args.loadedDataset, args.expName,
+            args.loadedCheckpoint, args.randomInit, args.preprocMethod, args.dataset, args.numVids, args.split, args.baseDataPath, args.fName, args.clipLength,
+            args.videoOffset, args.clipOffset, args.numClips, args.clipStride, args.batchSize, args.clipCacheDir, output_path, args.chunkSize, args.compression,
+            args.gpu, args.verbose)
@@ -12,6 +12,14 @@ from utils.layers_utils          import *
 
 from default_preprocessing         import preprocess
 from tf_version_HMDB51_preprocessing import preprocess as tf_HMDB51_preprocess
+from numpy_preprocessing           import preprocess as numpy_preprocess
+
+# Convolutional trunk: (layer name, scope, output channels of a 3x3x3 convolution or temporal size and stride of a 2x2 max pooling)
+TRUNK = [('conv1',  'c1',    64),  ('pool1', 'pool1', 1),
+         ('conv2',  'c2',    128), ('pool2', 'pool2', 2),
+         ('conv3a', 'c3a',   256), ('conv3b', 'c3b',  256), ('pool3', 'pool3', 2),
+         ('conv4a', 'c4a',   512), ('conv4b', 'c4b',  512), ('pool4', 'pool4', 2),
+         ('conv5a', 'c5a',   512), ('conv5b', 'c5b',  512), ('pool5', 'pool5', 2)]
 
 class C3D(Abstract_Model_Class):
 
@@ -27,7 +35,7 @@ class C3D(Abstract_Model_Class):
     def inference(self, inputs, is_training, input_dims, output_dims, seq_length, scope, dropout_rate = 0.5, return_layer=['logits'], weight_decay=0.0):
         """
         Args:
-            :inputs:       Input to model of shape [Frames x Height x Width x Channels]
+            :inputs:       Input to model of shape [BatchSize x Frames x Height x Width x Channels], channels last in every data format
             :is_training:  Boolean variable indicating phase (TRAIN OR TEST)
             :input_dims:   Length of input sequence
             :output_dims:  Integer indicating total number of classes in final prediction
@@ -50,92 +58,239 @@ class C3D(Abstract_Model_Class):
 
         # END IF
 
-        with tf.name_scope(scope, 'c3d', [inputs]):
-            layers = {}
-
-            layers['conv1'] = conv3d_layer(input_tensor=inputs,
-                    filter_dims=[3, 3, 3, 64],
-                    name='c1',
-                    weight_decay = weight_decay, non_linear_fn=tf.nn.relu)
-
-            layers['pool1'] = max_pool3d_layer(layers['conv1'],
-                                                 filter_dims=[1,2,2], stride_dims=[1,2,2],
-                                                 name='pool1')
-
-            layers['conv2'] = conv3d_layer(input_tensor=layers['pool1'],
-                    filter_dims=[3, 3, 3, 128],
-                    name='c2',
-                    weight_decay = weight_decay, non_linear_fn=tf.nn.relu)
-
-            layers['pool2'] = max_pool3d_layer(layers['conv2'],
-                                                 filter_dims=[2,2,2], stride_dims=[2,2,2],
-                                                 name='pool2')
-
-            layers['conv3a'] = conv3d_layer(input_tensor=layers['pool2'],
-                    filter_dims=[3, 3, 3, 256],
-                    name='c3a',
-                    weight_decay = weight_decay, non_linear_fn=tf.nn.relu)
-
-            layers['conv3b'] = conv3d_layer(input_tensor=layers['conv3a'],
-                    filter_dims=[3, 3, 3, 256],
-                    name='c3b',
-                    weight_decay = weight_decay, non_linear_fn=tf.nn.relu)
-
-            layers['pool3'] = max_pool3d_layer(layers['conv3b'],
-                                                 filter_dims=[2,2,2], stride_dims=[2,2,2],
-                                                 name='pool3')
-
-            layers['conv4a'] = conv3d_layer(input_tensor=layers['pool3'],
-                    filter_dims=[3, 3, 3, 512],
-                    name='c4a',
-                    weight_decay = weight_decay, non_linear_fn=tf.nn.relu)
-
-            layers['conv4b'] = conv3d_layer(input_tensor=layers['conv4a'],
-                    filter_dims=[3, 3, 3, 512],
-                    name='c4b',
-                    weight_decay = weight_decay, non_linear_fn=tf.nn.relu)
-
-            layers['pool4'] = max_pool3d_layer(layers['conv4b'],
-                                                 filter_dims=[2,2,2], stride_dims=[2,2,2],
-                                                 name='pool4')
-
-            layers['conv5a'] = conv3d_layer(input_tensor=layers['pool4'],
-                    filter_dims=[3, 3, 3, 512],
-                    name='c5a',
-                    weight_decay = weight_decay, non_linear_fn=tf.nn.relu)
-
-            layers['conv5b'] = conv3d_layer(input_tensor=layers['conv5a'],
-                    filter_dims=[3, 3, 3, 512],
-                    name='c5b',
-                    weight_decay = weight_decay, non_linear_fn=tf.nn.relu)
-
-            layers['pool5'] = max_pool3d_layer(layers['conv5b'],
-                                                 filter_dims=[2,2,2], stride_dims=[2,2,2],
-                                                 name='pool5')
+        with tf.name_scope(scope, 'c3d', [inputs]), LayerDict(return_layer, self.freeze_boundary(), self.recompute_boundaries()) as layers:
+
+            input_tensor = to_data_format(inputs)
+
+            for layer in TRUNK[:-1]:
+                layers[layer[0]] = self._trunk_layer(layer, input_tensor, weight_decay)
+                input_tensor     = layers[layer[0]]
+
+            # END FOR
+
+            pool5 = self._trunk_layer(TRUNK[-1], layers['conv5b'], weight_decay)
 
             if self.load_weights == 'Sports1M_finetune_UCF101':
                 # Uncomment to use sports1m_finetuned_ucf101.model (aka c3d_Sports1M_finetune_UCF101.npy)
-                layers['pool5'] = tf.transpose(layers['pool5'], perm=[0,1,4,2,3], name='transpose')
+                pool5 = tf.transpose(pool5, perm=[0,1,4,2,3] if get_data_format() == 'channels_last' else [0,2,1,3,4], name='transpose')
 
-            layers['reshape'] = tf.reshape(layers['pool5'], shape=[tf.shape(inputs)[0], 8192], name='reshape')
+            # END IF
 
-            layers['dense1'] = fully_connected_layer(input_tensor=layers['reshape'],
-                                                     out_dim=4096, non_linear_fn=tf.nn.relu,
-                                                     name='d1', weight_decay=weight_decay)
+            # Assigned once, construction stops here when only pool5 is requested
+            layers['pool5'] = pool5
 
-            layers['dropout1'] = dropout(layers['dense1'], training=is_training, rate=dropout_rate)
+            self._head(layers, is_training, output_dims, dropout_rate, weight_decay)
 
-            layers['dense2'] = fully_connected_layer(input_tensor=layers['dropout1'],
-                                                     out_dim=4096, non_linear_fn=tf.nn.relu,
-                                                     name='d2', weight_decay=weight_decay)
+        # END WITH
 
-            layers['dropout2'] = dropout(layers['dense2'], training=is_training, rate=dropout_rate)
+        return [layers[x] for x in return_layer]
 
-            layers['logits'] = tf.expand_dims(fully_connected_layer(input_tensor=layers['dropout2'],
-                                                     out_dim=output_dims, non_linear_fn=None,
-                                                     name='out', weight_decay=weight_decay), 1)
+    def _trunk_layer(self, layer, input_tensor, weight_decay, padding='SAME'):
+        """
+        Args:
+            :layer:        Entry of TRUNK
+            :input_tensor: Output of the previous layer
+            :weight_decay: Double value of weight decay
+            :padding:      Padding type definition (VALID or SAME)
 
-        return [layers[x] for x in return_layer]
+        Return:
+            Output of the layer
+        """
+        name, scope, dims = layer
+
+        if name.startswith('pool'):
+            return max_pool3d_layer(input_tensor, filter_dims=[dims,2,2], stride_dims=[dims,2,2], name=scope, padding=padding)
+
+        # END IF
+
+        return conv3d_layer(input_tensor=input_tensor,
+                filter_dims=[3, 3, 3, dims],
+                name=scope, padding=padding,
+                weight_decay = weight_decay, non_linear_fn=tf.nn.relu)
+
+    def _streamed_layers(self, window_dims, stride):
+        """
+        Trunk layers computed once over all frames by streaming_inference: the first layers whose output in a window of window_dims frames is aligned with
+        their output over all frames (stride is a multiple of their temporal resolution) and equal to it at some positions. Positions within edge of either
+        end of a window depend on the zero padding of the window, through the temporal receptive field of the layer.
+        Args:
+            :window_dims: Number of frames of each window
+            :stride:      Number of frames between the first frames of consecutive windows
+
+        Return:
+            List of (layer, edge, length, resolution): entry of TRUNK, number of positions at each end of a window depending on its padding, number of
+            positions of a window and number of frames per position of the layer's output
+        """
+        streamed                 = []
+        edge, length, resolution = 0, window_dims, 1
+
+        for layer in TRUNK:
+            if layer[0].startswith('pool'):
+                if length % layer[2] != 0:
+                    break
+
+                # END IF
+
+                edge, length, resolution = -(-edge // layer[2]), length // layer[2], resolution * layer[2]
+
+            else:
+                edge += 1
+
+            # END IF
+
+            if stride % resolution != 0 or 2 * edge >= length:
+                break
+
+            # END IF
+
+            streamed.append((layer, edge, length, resolution))
+
+        # END FOR
+
+        return streamed
+
+    def streaming_inference(self, inputs, output_dims, stride, scope, window_dims=16):
+        """
+        Logits of the windows of window_dims frames starting every stride frames of inputs, equal to the logits of inference (testing phase) on each window.
+        The first trunk layers (see _streamed_layers, conv1 to conv2 for any stride and conv3a, conv3b for even strides) are computed once over all frames
+        and shared by overlapping windows. Only the positions at the ends of each window that depend on its zero padding are computed again per window,
+        from the previous layer, the remaining layers run on each window.
+        Args:
+            :inputs:      Consecutive preprocessed frames [BatchSize x Frames x Height x Width x Channels], in the channels_last data format only.
+                          Preprocessing must not depend on the position of a frame in its window
+            :output_dims: Integer indicating total number of classes in final prediction
+            :stride:      Number of frames between the first frames of consecutive windows
+            :scope:       Scope name for current model instance
+            :window_dims: Number of frames of each window, the input_dims of inference
+
+        Return:
+            Logits [BatchSize x Windows x output_dims], with Windows = (Frames - window_dims) / stride + 1
+        """
+        assert(get_data_format() == 'channels_last')
+
+        batch_size, frames = inputs.get_shape().as_list()[:2]
+        num_windows        = (frames - window_dims) // stride + 1
+        streamed           = self._streamed_layers(window_dims, stride)
+
+        # (layer, edge, length, resolution) and output over all frames of the frames and of each streamed layer
+        specs   = [(None, 0, window_dims, 1)] + streamed
+        streams = [inputs]
+        ends    = {}
+
+        def window_positions(idx, start, stop):
+            """ Return: Positions [start, stop) of the output of specs[idx] in every window """
+            layer, edge, length, resolution = specs[idx]
+            pieces                          = []
+
+            if start < edge:
+                pieces.append(window_ends(idx, 'left')[:, start:min(stop, edge)])
+
+            # END IF
+
+            if max(start, edge) < min(stop, length - edge):
+                pieces.append(temporal_windows(streams[idx], num_windows, stride // resolution, max(start, edge), min(stop, length - edge)))
+
+            # END IF
+
+            if stop > length - edge:
+                pieces.append(window_ends(idx, 'right')[:, max(start, length - edge) - (length - edge):stop - (length - edge)])
+
+            # END IF
+
+            return pieces[0] if len(pieces) == 1 else tf.concat(pieces, 1)
+
+        def window_ends(idx, side):
+            """ Return: The edge positions of the output of specs[idx] at side of every window, computed from the window of the previous layer """
+            if (idx, side) not in ends:
+                layer, edge, length, resolution = specs[idx]
+                input_length                    = specs[idx-1][2]
+
+                if layer[0].startswith('pool'):
+                    # Windows have a multiple of the temporal size of the pooling positions, it is not padded
+                    start             = 0 if side == 'left' else input_length - edge * layer[2]
+                    ends[(idx, side)] = self._trunk_layer(layer, window_positions(idx-1, start, start + edge * layer[2]), 0.0)
+
+                else:
+                    # Zero padding of the window end only, the spatial padding of SAME
+                    start             = 0 if side == 'left' else input_length - edge - 1
+                    paddings          = [[0, 0], [1, 0] if side == 'left' else [0, 1], [1, 1], [1, 1], [0, 0]]
+                    ends[(idx, side)] = self._trunk_layer(layer, tf.pad(window_positions(idx-1, start, start + edge + 1), paddings), 0.0, padding='VALID')
+
+                # END IF
+
+            # END IF
+
+            return ends[(idx, side)]
+
+        with tf.name_scope(scope, 'c3d', [inputs]):
+            for layer, edge, length, resolution in streamed:
+                streams.append(self._trunk_layer(layer, streams[-1], 0.0))
+
+            # END FOR
+
+            with tf.variable_scope(tf.get_variable_scope(), reuse=True):
+                output = window_positions(len(streamed), 0, specs[-1][2])
+
+            # END WITH
+
+            for layer in TRUNK[len(streamed):]:
+                output = self._trunk_layer(layer, output, 0.0)
+
+            # END FOR
+
+            if self.load_weights == 'Sports1M_finetune_UCF101':
+                output = tf.transpose(output, perm=[0,1,4,2,3], name='transpose')
+
+            # END IF
+
+            layers = {'pool5': output}
+            self._head(layers, False, output_dims, 0.0, 0.0)
+
+        # END WITH
+
+        return tf.reshape(layers['logits'], [batch_size, num_windows, output_dims])
+
+    def _head(self, layers, is_training, output_dims, dropout_rate, weight_decay):
+        """
+        Add the fully connected layers on top of layers['pool5'] to layers
+        Args:
+            :layers:       Dictionary of layers holding at least 'pool5'
+            :is_training:  Boolean variable indicating phase (TRAIN OR TEST)
+            :output_dims:  Integer indicating total number of classes in final prediction
+            :dropout_rate: Value indicating proability of keep inputs
+            :weight_decay: Double value of weight decay
+        """
+        if get_data_format() == 'channels_first' and self.load_weights != 'Sports1M_finetune_UCF101':
+            # Flattened by d1 in the channels first order, its kernel rows are reordered when loaded
+            layers['reshape'] = layers['pool5']
+
+        else:
+            # -1 keeps the static batch size of pool5, needed by XLA
+            layers['reshape'] = tf.reshape(layers['pool5'], shape=[-1, 8192], name='reshape')
+
+        # END IF
+
+        layers['dense1'] = fully_connected_layer(input_tensor=layers['reshape'],
+                                                 out_dim=4096, non_linear_fn=tf.nn.relu,
+                                                 name='d1', weight_decay=weight_decay)
+
+        layers['dropout1'] = dropout(layers['dense1'], training=is_training, rate=dropout_rate)
+
+        layers['dense2'] = fully_connected_layer(input_tensor=layers['dropout1'],
+                                                 out_dim=4096, non_linear_fn=tf.nn.relu,
+                                                 name='d2', weight_decay=weight_decay)
+
+        layers['dropout2'] = dropout(layers['dense2'], training=is_training, rate=dropout_rate)
+
+        layers['logits'] = tf.expand_dims(fully_connected_layer(input_tensor=layers['dropout2'],
+                                                 out_dim=output_dims, non_linear_fn=None,
+                                                 name='out', weight_decay=weight_decay), 1)
+
+    def feature_layer(self):
+        """
+        Return: None, the convolutional trunk is trained along with the fully connected layers (no --freeze option) and its output cannot be stored
+        """
+        return None
 
     def load_default_weights(self):
         """
@@ -174,6 +329,47 @@ class C3D(Abstract_Model_Class):
 
         # END IF
 
+    def preprocess_tfrecords_batch(self, clips, frames, height, width, channel, input_dims, output_dims, seq_length, size, label, istraining, video_step):
+        """
+        Args:
+            :clips:      All clips of a video, shape [num_clips, frames, height, width, channels]
+            :frames:     Number of frames in each clip
+            (remaining arguments as in preprocess_tfrecords)
+
+        Return:
+            Preprocessed clips [num_clips, input_dims, size[0], size[1], channels] of the default preprocessing pipeline, None for other preprocessing methods
+        """
+        if self.preproc_method == 'tf_version_HMDB51':
+            return None
+
+        # END IF
+
+        return preprocess(clips, frames, height, width, channel, input_dims, output_dims, seq_length, size, label, istraining, self.input_alpha, batched=True)
+
+    def input_channel_order(self):
+        """
+        Return:
+            Channel order expected by preprocess_tfrecords, the default preprocessing pipeline takes the BGR frames stored in the tfrecords
+        """
+        if self.preproc_method == 'tf_version_HMDB51':
+            return 'RGB'
+
+        # END IF
+
+        return 'BGR'
+
+    def numpy_preprocessing(self):
+        """
+        Return:
+            NumPy version of the default preprocessing function and its keyword arguments, None for other preprocessing methods
+        """
+        if self.preproc_method == 'default':
+            return numpy_preprocess, {'input_alpha': self.input_alpha}
+
+        # END IF
+
+        return None
+
 
     """ Function to return loss calculated on given network """
     def loss(self, logits, labels, loss_type):
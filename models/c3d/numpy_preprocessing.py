@@ -0,0 +1,59 @@
+" NUMPY VERSION OF THE C3D DEFAULT PREPROCESSING, USED BY THE PROCESS POOL PREPROCESSING BACKEND "
+
+import numpy as np
+
+from utils.numpy_preprocessing_utils import *
+
+# Mean clip loaded once per worker process
+_MEAN_IMAGE = []
+
+
+def _mean_image():
+    """
+    Return: Sports1M mean clip ([frames, height, width, channels], BGR) used by the original authors
+    """
+    if len(_MEAN_IMAGE) == 0:
+        _MEAN_IMAGE.append(np.load('models/weights/sport1m_train16_128_mean.npy')[0].transpose(1,2,3,0))
+
+    # END IF
+
+    return _MEAN_IMAGE[0]
+
+
+def preprocess(input_data, frames, height, width, channel, input_dims, output_dims, seq_length, size, label, istraining, input_alpha=1.0):
+    """
+    Preprocessing function corresponding to default_preprocessing.preprocess, operating on numpy arrays
+    Args:
+        :input_data:        Raw input data [frames x height x width x channels]
+        :frames:            Total number of frames
+        :height:            Height of frame
+        :width:             Width of frame
+        :channel:           Total number of color channels
+        :input_dims:        Number of frames to be provided as input to model
+        :output_dims:       Total number of labels
+        :seq_length:        Number of frames expected as output of model
+        :size:              Output size of preprocessed frames
+        :label:             Label of current sample
+        :istraining:        Boolean indicating training or testing phase
+        :input_alpha:       Alpha value to resample input_data (independent of model)
+
+    Return:
+        Preprocessed float32 clip
+    """
+    # Convert to BGR as used by the original authors
+    input_data = input_data[...,::-1]
+
+    input_data = temporal_resample(input_data, frames, frames, input_alpha)
+    input_data = resize(input_data, 128, 171)
+    input_data = normalize_clip(input_data, _mean_image()[...,::-1])
+
+    if istraining:
+        input_data = random_crop_clip(input_data, size[0], size[1])
+        input_data = random_flip_left_right_clip(input_data)
+
+    else:
+        input_data = central_crop_clip(input_data, size[0], size[1])
+
+    # END IF
+
+    return input_data
@@ -87,7 +87,7 @@ def preprocess(input_data_tensor, frames, height, width, channel, input_dims, ou
     input_data_tensor = input_data_tensor[...,::-1]
 
     input_data_tensor = tf.cast(input_data_tensor, tf.float32)
-    input_data_tensor = resample_input(input_data_tensor, frames, frames, input_alpha)
+    input_data_tensor, _ = temporal_resample(input_data_tensor, frames, frames, input_alpha)
 
 
     input_data_tensor = tf.map_fn(lambda img: preprocess_image(img, size[0], size[1], is_training=istraining), input_data_tensor)
@@ -12,6 +12,7 @@ from models.models_abstract import Abstract_Model_Class
 from utils.layers_utils     import *
 
 from default_preprocessing import preprocess
+from numpy_preprocessing   import preprocess as numpy_preprocess
 
 class I3D(Abstract_Model_Class):
 
@@ -34,6 +35,7 @@ class I3D(Abstract_Model_Class):
             :use_batch_norm:  Boolean indicating the use of batch normalization
             :use_bias:        Boolean indication the use of bias
             :name:            Name of 3d convolution unit
+            :freeze:          Boolean indicating whether the unit is trained, units of the inception trunk are also trained with --freeze 1
 
         Return:
             :layers:        Stack of layers
@@ -41,12 +43,13 @@ class I3D(Abstract_Model_Class):
 
         # BIAS IS NOT USED BUT OUR LAYER UTILS DOES NOT OFFER THE OPTION TO AVOID BIAS!!
 
-        layers = {}
+        layers    = {}
+        trainable = freeze or self.freeze
 
-        layers[layer_numbers[0]] = conv3d_layer(input_tensor = input_layer, filter_dims = kernel_size, name = 'RGB/inception_i3d/' + name + '/conv_3d', stride_dims = stride, non_linear_fn = None, use_bias=use_bias, trainable=freeze)
+        layers[layer_numbers[0]] = conv3d_layer(input_tensor = input_layer, filter_dims = kernel_size, name = 'RGB/inception_i3d/' + name + '/conv_3d', stride_dims = stride, non_linear_fn = None, use_bias=use_bias, trainable=trainable)
 
         if use_batch_norm:
-            layers[layer_numbers[1]] = batch_normalization(layers[layer_numbers[0]], training = is_training, name = 'RGB/inception_i3d/' + name + '/batch_norm', trainable=freeze)
+            layers[layer_numbers[1]] = batch_normalization(layers[layer_numbers[0]], training = is_training, name = 'RGB/inception_i3d/' + name + '/batch_norm', trainable=trainable)
 
             if activation_fn is not None:
                 layers[layer_numbers[2]] = activation_fn(layers[layer_numbers[1]])
@@ -67,7 +70,7 @@ class I3D(Abstract_Model_Class):
     def inference(self, inputs, is_training, input_dims, output_dims, seq_length, scope, dropout_rate = 0.7, return_layer=['logits'], weight_decay=0.0):
         """
         Args:
-            :inputs:       Input to model of shape [Frames x Height x Width x Channels]
+            :inputs:       Input to model of shape [BatchSize x Frames x Height x Width x Channels], channels last in every data format
             :is_training:  Boolean variable indicating phase (TRAIN OR TEST)
             :input_dims:   Length of input sequence
             :output_dims:  Integer indicating total number of classes in final prediction
@@ -91,11 +94,9 @@ class I3D(Abstract_Model_Class):
         # END IF
 
 
-        with tf.name_scope(scope, 'i3d', [inputs]):
+        with tf.name_scope(scope, 'i3d', [inputs]), LayerDict(return_layer, self.freeze_boundary(), self.recompute_boundaries()) as layers:
 
-            layers = {}
-
-            layers.update(self._unit_3d(layer_numbers=['1','2','3'], input_layer=inputs, kernel_size=[7,7,7,64], stride=[2,2,2], name='Conv3d_1a_7x7', is_training=False))
+            layers.update(self._unit_3d(layer_numbers=['1','2','3'], input_layer=to_data_format(inputs), kernel_size=[7,7,7,64], stride=[2,2,2], name='Conv3d_1a_7x7', is_training=False))
 
             layers['4'] = max_pool3d_layer(layers['3'], filter_dims=[1,1,3,3,1], stride_dims=[1,1,2,2,1], padding='SAME', name='RGB/inception_i3d/MaxPool3d_2a_3x3')
 
@@ -121,7 +122,7 @@ class I3D(Abstract_Model_Class):
 
             layers.update(self._unit_3d(layer_numbers=['26','27','28'], input_layer=layers['25'], kernel_size=[1,1,1,32], name='Mixed_3b/Branch_3/Conv3d_0b_1x1', is_training=False))
 
-            layers['29'] = tf.concat([layers['13'], layers['19'], layers['24'], layers['28']], 4)
+            layers['29'] = tf.concat([layers['13'], layers['19'], layers['24'], layers['28']], channel_axis(inputs))
 
             #### END OF MIXED_3b ####
 
@@ -141,7 +142,7 @@ class I3D(Abstract_Model_Class):
 
             layers.update(self._unit_3d(layer_numbers=['46','47','48'], input_layer=layers['45'], kernel_size=[1,1,1,64], name='Mixed_3c/Branch_3/Conv3d_0b_1x1', is_training=False))
 
-            layers['49'] = tf.concat([layers['32'], layers['38'], layers['44'], layers['48']], 4)
+            layers['49'] = tf.concat([layers['32'], layers['38'], layers['44'], layers['48']], channel_axis(inputs))
 
             #### END OF MIXED_3c ####
 
@@ -163,7 +164,7 @@ class I3D(Abstract_Model_Class):
 
             layers.update(self._unit_3d(layer_numbers=['67','68','69'], input_layer=layers['66'], kernel_size=[1,1,1,64], name='Mixed_4b/Branch_3/Conv3d_0b_1x1', is_training=False))
 
-            layers['70'] = tf.concat([layers['53'], layers['59'], layers['65'], layers['69']], 4)
+            layers['70'] = tf.concat([layers['53'], layers['59'], layers['65'], layers['69']], channel_axis(inputs))
 
             #### END OF MIXED_4b ####
 
@@ -183,7 +184,7 @@ class I3D(Abstract_Model_Class):
 
             layers.update(self._unit_3d(layer_numbers=['87','88','89'], input_layer=layers['86'], kernel_size=[1,1,1,64], name='Mixed_4c/Branch_3/Conv3d_0b_1x1', is_training=False))
 
-            layers['90'] = tf.concat([layers['73'], layers['79'], layers['85'], layers['89']], 4)
+            layers['90'] = tf.concat([layers['73'], layers['79'], layers['85'], layers['89']], channel_axis(inputs))
 
             #### END OF MIXED_4c ####
 
@@ -216,7 +217,7 @@ class I3D(Abstract_Model_Class):
 
                 # END WITH
 
-            layers['110'] = tf.concat([layers['93'], layers['99'], layers['105'], layers['109']], 4)
+            layers['110'] = tf.concat([layers['93'], layers['99'], layers['105'], layers['109']], channel_axis(inputs))
 
             # END WITH
 
@@ -238,7 +239,7 @@ class I3D(Abstract_Model_Class):
 
             layers.update(self._unit_3d(layer_numbers=['127','128','129'], input_layer=layers['126'], kernel_size=[1,1,1,64], name='Mixed_4e/Branch_3/Conv3d_0b_1x1', is_training=False))
 
-            layers['130'] = tf.concat([layers['113'], layers['119'], layers['125'], layers['129']], 4)
+            layers['130'] = tf.concat([layers['113'], layers['119'], layers['125'], layers['129']], channel_axis(inputs))
 
             #### END OF MIXED_4e ####
 
@@ -258,7 +259,7 @@ class I3D(Abstract_Model_Class):
 
             layers.update(self._unit_3d(layer_numbers=['147','148','149'], input_layer=layers['146'], kernel_size=[1,1,1,128], name='Mixed_4f/Branch_3/Conv3d_0b_1x1', is_training=False))
 
-            layers['150'] = tf.concat([layers['133'], layers['139'], layers['145'], layers['149']], 4)
+            layers['150'] = tf.concat([layers['133'], layers['139'], layers['145'], layers['149']], channel_axis(inputs))
 
             #### END OF MIXED_4f ####
 
@@ -280,7 +281,7 @@ class I3D(Abstract_Model_Class):
 
             layers.update(self._unit_3d(layer_numbers=['168','169','170'], input_layer=layers['167'], kernel_size=[1,1,1,128], name='Mixed_5b/Branch_3/Conv3d_0b_1x1', is_training=False))
 
-            layers['171'] = tf.concat([layers['154'], layers['160'], layers['166'], layers['170']], 4)
+            layers['171'] = tf.concat([layers['154'], layers['160'], layers['166'], layers['170']], channel_axis(inputs))
 
             #### END OF MIXED_5b ####
 
@@ -300,22 +301,75 @@ class I3D(Abstract_Model_Class):
 
             layers.update(self._unit_3d(layer_numbers=['188','189','190'], input_layer=layers['187'], kernel_size=[1,1,1,128], name='Mixed_5c/Branch_3/Conv3d_0b_1x1', is_training=False))
 
-            layers['191'] = tf.concat([layers['174'], layers['180'], layers['186'], layers['190']], 4)
+            layers['191'] = tf.concat([layers['174'], layers['180'], layers['186'], layers['190']], channel_axis(inputs))
 
             #### END OF MIXED_5c ####
 
-            layers['192'] = tf.expand_dims(tf.reduce_mean(avg_pool3d_layer(layers['191'], filter_dims=[1,2,7,7,1], stride_dims=[1,1,1,1,1], padding='VALID', name='RGB/inception_i3d/avg_pooling'), axis=1), 1)
-
-            layers['193'] = dropout(layers['192'], rate=dropout_rate, training=is_training)
+            depth_axis = spatial_axes(layers['191'])[0]
 
-            layers.update(self._unit_3d(layer_numbers=['logits_pre'], input_layer=layers['193'], kernel_size=[1,1,1,output_dims], name='RGB/inception_i3d/Logits/Conv3d_0c_1x1', is_training=is_training, activation_fn=None, use_batch_norm=False, freeze=True))
+            layers['192'] = tf.expand_dims(tf.reduce_mean(avg_pool3d_layer(layers['191'], filter_dims=[1,2,7,7,1], stride_dims=[1,1,1,1,1], padding='VALID', name='RGB/inception_i3d/avg_pooling'), axis=depth_axis), depth_axis)
 
-            layers['logits'] = tf.expand_dims(tf.reduce_mean(tf.squeeze(layers['logits_pre'], [2, 3]), axis=1), 1)
+            self._head(layers, is_training, output_dims, dropout_rate)
 
         # END WITH
 
         return [layers[x] for x in return_layer]
 
+    def _head(self, layers, is_training, output_dims, dropout_rate):
+        """
+        Add the logits layers on top of layers['192'] to layers
+        Args:
+            :layers:       Dictionary of layers holding at least '192'
+            :is_training:  Boolean variable indicating phase (TRAIN OR TEST)
+            :output_dims:  Integer indicating total number of classes in final prediction
+            :dropout_rate: Value indicating proability of keep inputs
+        """
+        layers['193'] = dropout(layers['192'], rate=dropout_rate, training=is_training)
+
+        layers.update(self._unit_3d(layer_numbers=['logits_pre'], input_layer=layers['193'], kernel_size=[1,1,1,output_dims], name='RGB/inception_i3d/Logits/Conv3d_0c_1x1', is_training=is_training, activation_fn=None, use_batch_norm=False, freeze=True))
+
+        layers['logits'] = tf.expand_dims(tf.reduce_mean(tf.squeeze(from_data_format(layers['logits_pre']), [2, 3]), axis=1), 1)
+
+    def freeze_boundary(self):
+        """
+        Return: Name of the average pooled output of the inception trunk when it is frozen (--freeze 0), None otherwise
+        """
+        if self.freeze:
+            return None
+
+        # END IF
+
+        return '192'
+
+    def recompute_boundaries(self):
+        """
+        Return: Names of the outputs of the stem and of each inception block, only useful when the trunk is trained (--freeze 1)
+        """
+        return ['11_inp', '29', '49', '70', '90', '110', '130', '150', '171', '191']
+
+    def feature_layer(self):
+        """
+        Return: Name of the average pooled output of the inception trunk, None when the trunk is trained (see --freeze)
+        """
+        return self.freeze_boundary()
+
+    def inference_head(self, features, is_training, input_dims, output_dims, seq_length, scope, dropout_rate = 0.7, weight_decay=0.0):
+        """
+        Args:
+            :features:     Output of layer '192', as returned by inference
+            (remaining arguments as in inference)
+
+        Return:
+            Logits of the model computed from features
+        """
+        with tf.name_scope(scope, 'i3d', [features]):
+            layers = {'192': features}
+            self._head(layers, is_training, output_dims, dropout_rate)
+
+        # END WITH
+
+        return layers['logits']
+
     def load_default_weights(self):
         """
         return: Numpy dictionary containing the names and values of the weight tensors used to initialize this model
@@ -340,6 +394,38 @@ class I3D(Abstract_Model_Class):
         """
         return preprocess(input_data_tensor, frames, height, width, channel, input_dims, output_dims, seq_length, size, label, istraining, self.input_alpha)
 
+    def preprocess_tfrecords_batch(self, clips, frames, height, width, channel, input_dims, output_dims, seq_length, size, label, istraining, video_step):
+        """
+        Args:
+            :clips:      All clips of a video, shape [num_clips, frames, height, width, channels]
+            :frames:     Number of frames in each clip
+            (remaining arguments as in preprocess_tfrecords)
+
+        Return:
+            Preprocessed clips [num_clips, input_dims, size[0], size[1], channels] of the default preprocessing pipeline, which, as in
+            preprocess_tfrecords, is applied whatever the preprocessing method since it is the only one of this model
+        """
+        return preprocess(clips, frames, height, width, channel, input_dims, output_dims, seq_length, size, label, istraining, self.input_alpha, batched=True)
+
+    def input_channel_order(self):
+        """
+        Return:
+            Channel order expected by preprocess_tfrecords, the default preprocessing pipeline takes the BGR frames stored in the tfrecords
+        """
+        return 'BGR'
+
+    def numpy_preprocessing(self):
+        """
+        Return:
+            NumPy version of the default preprocessing function and its keyword arguments, None for other preprocessing methods
+        """
+        if self.preproc_method == 'default':
+            return numpy_preprocess, {'input_alpha': self.input_alpha}
+
+        # END IF
+
+        return None
+
 
     """ Function to return loss calculated on given network """
     def loss(self, logits, labels, loss_type='full_loss'):
@@ -0,0 +1,74 @@
+" NUMPY VERSION OF THE I3D DEFAULT PREPROCESSING, USED BY THE PROCESS POOL PREPROCESSING BACKEND "
+
+import numpy as np
+
+from utils.numpy_preprocessing_utils import *
+
+_RESIZE_SIDE_MIN = 256
+
+
+def preprocess(input_data, frames, height, width, channel, input_dims, output_dims, seq_length, size, label, istraining, input_alpha=1.0):
+    """
+    Preprocessing function corresponding to default_preprocessing.preprocess, operating on numpy arrays
+    Args:
+        :input_data:        Raw input data [frames x height x width x channels]
+        :frames:            Total number of frames
+        :height:            Height of frame
+        :width:             Width of frame
+        :channel:           Total number of color channels
+        :input_dims:        Number of frames to be provided as input to model
+        :output_dims:       Total number of labels
+        :seq_length:        Number of frames expected as output of model
+        :size:              Output size of preprocessed frames
+        :label:             Label of current sample
+        :istraining:        Boolean indicating training or testing phase
+        :input_alpha:       Alpha value to resample input_data (independent of model)
+
+    Return:
+        Preprocessed float32 clip
+    """
+    # Setup different temporal footprints for training and testing phase
+    if istraining:
+        footprint   = input_dims
+        sample_dims = input_dims
+
+    else:
+        footprint   = 250
+        sample_dims = input_dims
+
+    # END IF
+
+    # Ensure that sufficient frames exist in input to extract 250 frames (assuming a 5 sec temporal footprint)
+    if frames < footprint:
+        input_data = loop_video_with_offset(input_data, input_data, frames, frames, footprint)
+
+    else:
+        temporal_offset = random_integer(0, frames - footprint + 1)
+        input_data      = input_data[temporal_offset:temporal_offset + footprint]
+
+    # END IF
+
+    input_data = temporal_resample(input_data[:footprint], sample_dims, footprint)
+    input_data = aspect_preserving_resize(input_data, _RESIZE_SIDE_MIN)
+
+    # Rescale the entire clip to [-1, 1], equivalent to (image/255.) * 2. - 1.
+    input_data = normalize_clip(input_data, [127.5, 127.5, 127.5], [127.5, 127.5, 127.5])
+
+    if istraining:
+        # Random crop for draws below 0.5, as in PreprocessingPipeline.random_crop
+        if random_fraction() < 0.5:
+            input_data = random_crop_clip(input_data, size[0], size[1])
+
+        else:
+            input_data = central_crop_clip(input_data, size[0], size[1])
+
+        # END IF
+
+        input_data = random_flip_left_right_clip(input_data)
+
+    else:
+        input_data = central_crop_clip(input_data, size[0], size[1])
+
+    # END IF
+
+    return input_data
@@ -48,6 +48,34 @@ class Abstract_Model_Class(ABC):
     def inference(self):
         raise NotImplementedError('Method not implemented in the specified model: inference')
 
+    def freeze_boundary(self):
+        """
+        Name of the last frozen layer of the model, every layer it depends on being frozen, None when the model has no such layer.
+        Backpropagation stops at its output (see LayerDict in utils/layers_utils.py).
+        """
+        return None
+
+    def recompute_boundaries(self):
+        """
+        Names of the layers whose outputs are the only activations kept for backpropagation with train.py --recompute, the layers between them
+        are run again during backpropagation (see set_recompute in utils/layers_utils.py). Empty when the model has none.
+        """
+        return []
+
+    def feature_layer(self):
+        """
+        Name of the layer separating the pretrained trunk of the model from the head trained on top of it, None when the model has no such boundary.
+        The output of this layer can be stored once with train.py --featureCache and the head trained from it with inference_head.
+        """
+        return None
+
+    def inference_head(self):
+        """
+        Build only the layers after feature_layer, taking the output of feature_layer as input, and return the logits as inference does.
+        Same arguments as inference, with the features in place of the inputs and without return_layer.
+        """
+        raise NotImplementedError('Method not implemented in the specified model: inference_head')
+
     def load_default_weights(self):
         #raise NotImplementedError('Method not implemented in the specified model: load_default_weights')
         return None
@@ -55,6 +83,35 @@ class Abstract_Model_Class(ABC):
     def preprocess_tfrecords(self):
         raise NotImplementedError('Method not implemented in the specified model: preprocess_tfrecords')
 
+    def preprocessed_input_dims(self, input_dims, istraining):
+        """
+        Number of frames in each clip returned by preprocess_tfrecords, used to shape the clip queue.
+        Override when a model's preprocessing emits a different number of frames than input_dims in some phase.
+        """
+        return input_dims
+
+    def preprocess_tfrecords_batch(self, clips, frames, height, width, channel, input_dims, output_dims, seq_length, size, label, istraining, video_step):
+        """
+        Batched version of preprocess_tfrecords processing every clip of a video [num_clips, frames, height, width, channels] with vectorized ops.
+        Returns None when the model has no batched preprocessing, in which case preprocess_tfrecords is applied to each clip with tf.map_fn.
+        """
+        return None
+
+    def input_channel_order(self):
+        """
+        Channel order ('RGB' or 'BGR') expected by preprocess_tfrecords. Frames are stored as BGR in the tfrecords, 'RGB' makes the loader convert them first.
+        Pipelines declared with utils/preprocessing_pipeline.py take 'BGR' so that the conversion can cancel out with their own channel flips.
+        """
+        return 'RGB'
+
+    def numpy_preprocessing(self):
+        """
+        NumPy version of preprocess_tfrecords used by the process pool preprocessing backend (utils/load_dataset_numpy.py).
+        Returns a module level function with the signature (input_data, frames, height, width, channel, input_dims, output_dims, seq_length, size, label, istraining, **kwargs)
+        and the keyword arguments it is called with, or None when the current preprocessing method has no NumPy version.
+        """
+        return None
+
     def add_track_variables(self, variable_name, variable):
         self.track_variables[variable_name] = variable
 
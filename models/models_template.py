@@ -57,16 +57,19 @@ class MODELNAME(Abstract_Model_Class):
 
         # END IF
 
-        with tf.name_scope(scope, 'MODELNAME', [inputs]):
-            layers = {}
+        with tf.name_scope(scope, 'MODELNAME', [inputs]), LayerDict(return_layer, self.freeze_boundary(), self.recompute_boundaries()) as layers:
 
             ########################################################################################
             #        TODO: Add any desired layers from layers_utils to this layers dictionary      #
             #                                                                                      #
-            #       EX: layers['conv1'] = conv3d_layer(input_tensor=inputs,                        #
+            #       EX: layers['conv1'] = conv3d_layer(input_tensor=to_data_format(inputs),        #
             #           filter_dims=[dim1, dim2, dim3, dim4],                                      #
             #           name=NAME,                                                                 #
             #           weight_decay = wd)                                                         #
+            #                                                                                      #
+            #  inputs are channels last, to_data_format transposes them to the layout selected     #
+            #  by set_data_format. Use channel_axis/spatial_axes instead of fixed axes in concat,  #
+            #  reduce_mean, etc. and from_data_format before layout specific reshapes              #
             ########################################################################################
 
 
@@ -78,9 +81,10 @@ class MODELNAME(Abstract_Model_Class):
             #                                         name='out', weight_decay=weight_decay)]      #
             ########################################################################################
 
-            layers['logits'] = # TODO Every model must return a layer named 'logits'
+            logits = # TODO Every model must return a layer named 'logits'
 
-            layers['logits'] = tf.reshape(layers['logits'], [batch_size, seq_length, output_dims])
+            # Every layer is assigned once: construction stops as soon as all of return_layer are in layers (see LayerDict)
+            layers['logits'] = tf.reshape(logits, [batch_size, seq_length, output_dims])
 
         # END WITH
 
@@ -105,6 +109,72 @@ class MODELNAME(Abstract_Model_Class):
 
 
 
+    # def freeze_boundary(self):
+    #     """
+    #     return: Name of the last frozen layer, backpropagation stops at its output during training
+    #     """
+    #
+    #     ############################################################################
+    #     # TODO: Return the name of the layer whose dependencies are all frozen     #
+    #     #       (trainable=False), None when any of them is trained                #
+    #     #                          ( OPTIONAL )                                    #
+    #     #                                                                          #
+    #     # EX: return 'pool5'                                                       #
+    #     #                                                                          #
+    #     ############################################################################
+
+
+
+
+    # def recompute_boundaries(self):
+    #     """
+    #     return: Names of the layers whose outputs are kept for backpropagation with train.py --recompute
+    #     """
+    #
+    #     ############################################################################
+    #     # TODO: Return the names of the outputs of the blocks of the model, the    #
+    #     #       layers between them are run again during backpropagation          #
+    #     #                          ( OPTIONAL )                                    #
+    #     #                                                                          #
+    #     # EX: return ['pool1', 'pool2', 'pool3', 'pool4']                          #
+    #     #                                                                          #
+    #     ############################################################################
+
+
+
+
+    # def feature_layer(self):
+    #     """
+    #     return: Name of the layer separating the pretrained trunk of the model from the head trained on top of it
+    #     """
+    #
+    #     ############################################################################
+    #     # TODO: Return the name of the last frozen layer, required to train the    #
+    #     #       head only with train.py --featureCache, along with inference_head  #
+    #     #                          ( OPTIONAL )                                    #
+    #     #                                                                          #
+    #     # EX: return 'pool5'                                                       #
+    #     #                                                                          #
+    #     ############################################################################
+
+
+
+
+    # def inference_head(self, features, is_training, input_dims, output_dims, seq_length, scope, dropout_rate = 0.5, weight_decay=0.0):
+    #     """
+    #     return: Logits of the model computed from the output of feature_layer, building only the layers after it
+    #     """
+    #
+    #     ############################################################################
+    #     # TODO: Build the layers after feature_layer on top of features, sharing   #
+    #     #       their construction with inference                                  #
+    #     #                          ( OPTIONAL )                                    #
+    #     #                                                                          #
+    #     ############################################################################
+
+
+
+
     def preprocess_tfrecords(self, input_data_tensor, frames, height, width, channel, input_dims, output_dims, seq_length, size, label, istraining, video_step):
         """
         Args:
@@ -129,6 +199,16 @@ class MODELNAME(Abstract_Model_Class):
         return preprocess(input_data_tensor, frames, height, width, channel, input_dims, output_dims, seq_length, size, label, istraining, video_step, self.input_alpha)
 
 
+    """ Batched version of preprocess_tfrecords applied to all clips [num_clips, frames, height, width, channels] of a video at once, return None to preprocess each clip separately """
+    def preprocess_tfrecords_batch(self, clips, frames, height, width, channel, input_dims, output_dims, seq_length, size, label, istraining, video_step):
+        return preprocess(clips, frames, height, width, channel, input_dims, output_dims, seq_length, size, label, istraining, video_step, self.input_alpha, batched=True)
+
+
+    """ Channel order expected by preprocess_tfrecords, the template preprocessing pipeline takes the BGR frames stored in the tfrecords """
+    def input_channel_order(self):
+        return 'BGR'
+
+
 
     """ Function to return loss calculated on given network """
     def loss(self, logits, labels, loss_type):
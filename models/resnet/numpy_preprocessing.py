@@ -0,0 +1,66 @@
+" NUMPY VERSION OF THE RESNET DEFAULT PREPROCESSING, USED BY THE PROCESS POOL PREPROCESSING BACKEND "
+
+import numpy as np
+
+from utils.numpy_preprocessing_utils import *
+
+_R_MEAN = 123.68
+_G_MEAN = 116.78
+_B_MEAN = 103.94
+
+_RESIZE_SIDE_MIN = 256
+
+
+def preprocess(input_data, frames, height, width, channel, input_dims, output_dims, seq_length, size, label, istraining, input_alpha=1.0):
+    """
+    Preprocessing function corresponding to default_preprocessing.preprocess, operating on numpy arrays
+    Args:
+        :input_data:        Raw input data [frames x height x width x channels]
+        :frames:            Total number of frames
+        :height:            Height of frame
+        :width:             Width of frame
+        :channel:           Total number of color channels
+        :input_dims:        Number of frames to be provided as input to model
+        :output_dims:       Total number of labels
+        :seq_length:        Number of frames expected as output of model
+        :size:              Output size of preprocessed frames
+        :label:             Label of current sample
+        :istraining:        Boolean indicating training or testing phase
+        :input_alpha:       Alpha value to resample input_data (independent of model)
+
+    Return:
+        Preprocessed float32 clip (input_dims/2 frames during training, input_dims frames during testing)
+    """
+    # Fixed temporal footprint assuming 25 fps input
+    if istraining:
+        footprint   = 125
+        sample_dims = input_dims/2
+
+    else:
+        footprint   = 250
+        sample_dims = input_dims
+
+    # END IF
+
+    # Selecting a random temporal offset
+    temporal_offset = random_integer(0, frames)
+    input_data      = loop_video_with_offset(input_data[temporal_offset:], input_data, frames-temporal_offset, frames, footprint)
+
+    input_data = temporal_resample(input_data[:footprint], sample_dims, footprint)
+    input_data = aspect_preserving_resize(input_data, _RESIZE_SIDE_MIN)
+
+    if not istraining:
+        input_data = central_crop_clip(input_data, size[0], size[1])
+
+    # END IF
+
+    # Mean subtraction applied once over the entire clip
+    input_data = normalize_clip(input_data, [_R_MEAN, _G_MEAN, _B_MEAN])
+
+    if istraining:
+        input_data = random_crop_clip(input_data, size[0], size[1])
+        input_data = random_flip_left_right_clip(input_data)
+
+    # END IF
+
+    return input_data
@@ -9,6 +9,7 @@ from models.models_abstract import Abstract_Model_Class
 from utils.layers_utils     import *
 
 from default_preprocessing import preprocess
+from numpy_preprocessing   import preprocess as numpy_preprocess
 
 class ResNet(Abstract_Model_Class):
 
@@ -141,7 +142,7 @@ class ResNet(Abstract_Model_Class):
     def inference(self, inputs, is_training, input_dims, output_dims, seq_length, scope, dropout_rate = 0.5, return_layer=['logits'], weight_decay=0.0):
         """
         Args:
-            :inputs:       Input to model of shape [Frames x Height x Width x Channels]
+            :inputs:       Input to model of shape [BatchSize x Frames x Height x Width x Channels], channels last in every data format
             :is_training:  Boolean variable indicating phase (TRAIN OR TEST)
             :input_dims:   Length of input sequence
             :output_dims:  Integer indicating total number of classes in final prediction
@@ -164,12 +165,16 @@ class ResNet(Abstract_Model_Class):
 
         # END IF
 
-        inputs = inputs[0]
+        # Frames of every clip are processed together by the convolutional layers: [(BatchSize x Frames) x Height x Width x Channels]
+        input_shape = inputs.get_shape().as_list()
+        inputs      = tf.reshape(inputs, [-1] + input_shape[2:])
 
-        with tf.name_scope(scope, 'resnet', [inputs]):
-            layers = {}
+        # Training clips only carry the sampled half of the frames, so the LSTM is unrolled over that many steps
+        lstm_length = self.preprocessed_input_dims(seq_length, is_training)
 
-            layers['1'] = conv_layer(input_tensor=inputs,
+        with tf.name_scope(scope, 'resnet', [inputs]), LayerDict(return_layer, self.freeze_boundary(), self.recompute_boundaries()) as layers:
+
+            layers['1'] = conv_layer(input_tensor=to_data_format(inputs),
                     filter_dims=[7, 7, 64], stride_dims=[2,2],
                     padding = 'VALID',
                     name='conv1',
@@ -234,17 +239,71 @@ class ResNet(Abstract_Model_Class):
             layers.update(self._identity_block([512,512,2048], kernel_size=3, name='5c', layer_numbers=['117','118','119','120','121','122','123'],
                             input_layer=layers['116'], is_training=False))
 
-            layers['124'] = tf.reduce_mean(layers['123'], reduction_indices=[1,2], name='avg_pool')
+            layers['124'] = tf.reduce_mean(layers['123'], reduction_indices=spatial_axes(layers['123']), name='avg_pool')
+
+            self._head(layers, is_training, lstm_length, output_dims, dropout_rate, weight_decay)
+
+        # END WITH
+
+        return [layers[x] for x in return_layer]
+
+    def _head(self, layers, is_training, lstm_length, output_dims, dropout_rate, weight_decay):
+        """
+        Add the LSTM and logits layers on top of layers['124'] to layers
+        Args:
+            :layers:       Dictionary of layers holding at least '124', the frames of every clip flattened into the batch
+            :is_training:  Boolean variable indicating phase (TRAIN OR TEST)
+            :lstm_length:  Number of frames of every clip the LSTM is unrolled over
+            :output_dims:  Integer indicating total number of classes in final prediction
+            :dropout_rate: Value indicating proability of keep inputs
+            :weight_decay: Double value of weight decay
+        """
+        layers['125'] = lstm(layers['124'], lstm_length, feat_size=2048, cell_size=512)
+
+        layers['126'] = dropout(layers['125'], training=is_training, rate=dropout_rate)
+
+        layers['logits'] = tf.reshape(fully_connected_layer(input_tensor=layers['126'], out_dim=output_dims, non_linear_fn=None, name='logits', weight_decay=weight_decay),
+                                      [-1, lstm_length, output_dims])
+
+    def freeze_boundary(self):
+        """
+        Return: Name of the average pooled output of the ResNet50 trunk when it is frozen (--freeze 0), None otherwise
+        """
+        if self.freeze:
+            return None
+
+        # END IF
+
+        return '124'
 
-            layers['125'] = lstm(layers['124'], seq_length, feat_size=2048, cell_size=512)
+    def recompute_boundaries(self):
+        """
+        Return: Names of the outputs of the stem and of each residual block, only useful when the trunk is trained (--freeze 1)
+        """
+        return ['3', '12', '19', '26', '35', '42', '49', '56', '65', '72', '79', '86', '93', '100', '109', '116', '123']
 
-            layers['126'] = dropout(layers['125'], training=is_training, rate=dropout_rate)
+    def feature_layer(self):
+        """
+        Return: Name of the average pooled output of the ResNet50 trunk, None when the trunk is trained (see --freeze)
+        """
+        return self.freeze_boundary()
+
+    def inference_head(self, features, is_training, input_dims, output_dims, seq_length, scope, dropout_rate = 0.5, weight_decay=0.0):
+        """
+        Args:
+            :features:     Output of layer '124', as returned by inference
+            (remaining arguments as in inference)
 
-            layers['logits'] = tf.expand_dims(fully_connected_layer(input_tensor=layers['126'], out_dim=output_dims, non_linear_fn=None, name='logits', weight_decay=weight_decay), 0)
+        Return:
+            Logits of the model computed from features
+        """
+        with tf.name_scope(scope, 'resnet', [features]):
+            layers = {'124': features}
+            self._head(layers, is_training, self.preprocessed_input_dims(seq_length, is_training), output_dims, dropout_rate, weight_decay)
 
         # END WITH
 
-        return [layers[x] for x in return_layer]
+        return layers['logits']
 
     def load_default_weights(self):
         """
@@ -252,6 +311,18 @@ class ResNet(Abstract_Model_Class):
         """
         return np.load('models/weights/resnet50_rgb_imagenet.npy')
 
+    def preprocessed_input_dims(self, input_dims, istraining):
+        """
+        Training clips are sampled at half of input_dims (see default_preprocessing.py) and are no longer zero padded
+        """
+        if istraining:
+            return input_dims/2
+
+        else:
+            return input_dims
+
+        # END IF
+
     def preprocess_tfrecords(self, input_data_tensor, frames, height, width, channel, input_dims, output_dims, seq_length, size, label, istraining, video_step):
         """
         Args:
@@ -273,6 +344,38 @@ class ResNet(Abstract_Model_Class):
         """
         return preprocess(input_data_tensor, frames, height, width, channel, input_dims, output_dims, seq_length, size, label, self.input_alpha, istraining)
 
+    def preprocess_tfrecords_batch(self, clips, frames, height, width, channel, input_dims, output_dims, seq_length, size, label, istraining, video_step):
+        """
+        Args:
+            :clips:      All clips of a video, shape [num_clips, frames, height, width, channels]
+            :frames:     Number of frames in each clip
+            (remaining arguments as in preprocess_tfrecords)
+
+        Return:
+            Preprocessed clips [num_clips, input_dims, size[0], size[1], channels] of the default preprocessing pipeline, which, as in
+            preprocess_tfrecords, is applied whatever the preprocessing method since it is the only one of this model
+        """
+        return preprocess(clips, frames, height, width, channel, input_dims, output_dims, seq_length, size, label, self.input_alpha, istraining, batched=True)
+
+    def input_channel_order(self):
+        """
+        Return:
+            Channel order expected by preprocess_tfrecords, the default preprocessing pipeline takes the BGR frames stored in the tfrecords
+        """
+        return 'BGR'
+
+    def numpy_preprocessing(self):
+        """
+        Return:
+            NumPy version of the default preprocessing function and its keyword arguments, None for other preprocessing methods
+        """
+        if self.preproc_method == 'default':
+            return numpy_preprocess, {'input_alpha': self.input_alpha}
+
+        # END IF
+
+        return None
+
     """ Function to return loss calculated on half the outputs of a given network """
     def half_loss(self, logits, labels):
         """
@@ -286,8 +389,9 @@ class ResNet(Abstract_Model_Class):
 
         labels = tf.cast(labels, tf.int64)
 
+        # During training logits already only cover the first half of the sequence
         cross_entropy_loss = tf.losses.sparse_softmax_cross_entropy(labels=labels[:,:labels.shape[1].value/2],
-                                                                  logits=logits[:,:logits.shape[1].value/2,:])
+                                                                  logits=logits[:,:labels.shape[1].value/2,:])
         return cross_entropy_loss
 
     """ Function to return loss calculated on all the outputs of a given network """
@@ -302,7 +406,8 @@ class ResNet(Abstract_Model_Class):
         """
         labels = tf.cast(labels, tf.int64)
 
-        cross_entropy_loss = tf.losses.sparse_softmax_cross_entropy(labels=labels,
+        # Training logits are shorter than seq_length, only compare against the frames that were sampled
+        cross_entropy_loss = tf.losses.sparse_softmax_cross_entropy(labels=labels[:,:logits.shape[1].value],
                                                                   logits=logits)
         return cross_entropy_loss
 
@@ -1,68 +1,83 @@
 import tensorflow as tf
 import numpy      as np
 
-from utils.preprocessing_utils import *
+from utils.preprocessing_utils    import *
+from utils.preprocessing_pipeline import PreprocessingPipeline
+from utils.sampling_utils         import random_draw
 
+# Multi-scale crop parameters, frames are resized to _RESIZE_HEIGHT x _RESIZE_WIDTH before a window is selected
+_RESIZE_HEIGHT     = 256
+_RESIZE_WIDTH      = 340
+_SCALES            = [1., 0.875, 0.75, 0.66]
+_CROP_COMBINATIONS = [[0,0],[0,1],[1,0],[1,1],[1,2],[2,1],[2,2],[2,3],[3,2],[3,3]]
 
-def preprocess_for_train(image, output_height, output_width, resize_side):
-    """Preprocesses the given image for training.
+
+def multi_scale_crop_boxes(resize_height=_RESIZE_HEIGHT, resize_width=_RESIZE_WIDTH):
+    """
+    Every crop window used by the TSN multi-scale crop, expressed as crop_and_resize boxes of the original frame.
+    A window (offset_height, offset_width, crop_height, crop_width) of a frame resized to resize_height x resize_width (align_corners)
+    samples the same points of the original frame as the box [offset_height, offset_width, offset_height+crop_height-1, offset_width+crop_width-1]
+    divided by [resize_height-1, resize_width-1], independently of the original frame size.
     Args:
-    image: A `Tensor` representing an image of arbitrary size.
-    output_height: The height of the image after preprocessing.
-    output_width: The width of the image after preprocessing.
-    resize_side: The smallest side of the image for aspect-preserving resizing.
-    Returns:
-    A preprocessed image.
+        :resize_height: Height frames are resized to before cropping
+        :resize_width:  Width frames are resized to before cropping
+
+    Return:
+        Float32 array of shape [len(_CROP_COMBINATIONS)*13, 4], each (scale pair, offset) combination appears once
     """
+    crop_sizes = np.asarray(_SCALES, dtype=np.float32) * np.float32(min(resize_height, resize_width))
+    boxes      = []
 
-    image = resize(image, output_height, output_width)
-    return image
+    for pair_inds in _CROP_COMBINATIONS:
+        crop_h = crop_sizes[pair_inds[0]]
+        crop_w = crop_sizes[pair_inds[1]]
 
+        h_step = int((np.float32(resize_height) - crop_h) / np.float32(4.))
+        w_step = int((np.float32(resize_width) - crop_w) / np.float32(4.))
 
-def preprocess_for_eval(image, output_height, output_width, resize_side):
-    """Preprocesses the given image for evaluation.
-    Args:
-    image: A `Tensor` representing an image of arbitrary size.
-    output_height: The height of the image after preprocessing.
-    output_width: The width of the image after preprocessing.
-    resize_side: The smallest side of the image for aspect-preserving resizing.
-    Returns:
-    A preprocessed image.
+        # Corners and center, followed by the additional fixed crops (center left/right, upper/lower center and quarters)
+        offsets = [(0, 0), (4 * h_step, 0), (0, 4 * w_step), (4 * h_step, 4 * w_step), (2 * h_step, 2 * w_step),
+                   (0, 2 * w_step), (4 * h_step, 2 * w_step), (2 * h_step, 4 * w_step), (2 * h_step, 0 * w_step),
+                   (1 * h_step, 1 * w_step), (3 * h_step, 1 * w_step), (1 * h_step, 3 * w_step), (3 * h_step, 3 * w_step)]
+
+        for offset_height, offset_width in offsets:
+            boxes.append([offset_height / float(resize_height - 1),
+                          offset_width / float(resize_width - 1),
+                          (offset_height + int(crop_h) - 1) / float(resize_height - 1),
+                          (offset_width + int(crop_w) - 1) / float(resize_width - 1)])
+
+        # END FOR
+
+    # END FOR
+
+    return np.asarray(boxes, dtype=np.float32)
+
+
+def multi_scale_crop_and_resize(clip, output_height, output_width):
     """
-    image = tf.gather(image, 0)
-    image = tf.reshape(resize(image, 256, 340), [256,340,3])
-    image = mean_image_subtraction(image, [123, 117, 104])
-    images = oversample(tf.convert_to_tensor([image]), [output_height, output_width])
-    return images
-
-def preprocess_image(image, output_height, output_width, is_training=False,
-                     resize_side_min=RESIZE_SIDE_MIN):
-    """Preprocesses the given image.
+    Randomly pick one multi-scale crop window (uniform over scale pairs and offsets), mirror it with a 50% likelihood
+    and extract it from every frame of the clip with a single crop_and_resize
     Args:
-    image: A `Tensor` representing an image of arbitrary size.
-    output_height: The height of the image after preprocessing.
-    output_width: The width of the image after preprocessing.
-    is_training: `True` if we're preprocessing the image for training and
-      `False` otherwise.
-    resize_side_min: The lower bound for the smallest side of the image for
-      aspect-preserving resizing. If `is_training` is `False`, then this value
-      is used for rescaling.
-    Returns:
-    A preprocessed image.
+        :clip:          Float32 clip of shape [frames, height, width, channels]
+        :output_height: Height of the output frames
+        :output_width:  Width of the output frames
+
+    Return:
+        Clip of shape [frames, output_height, output_width, channels]
     """
-    if is_training:
-      return preprocess_for_train(image, output_height, output_width,
-                             resize_side_min)
+    boxes = tf.constant(multi_scale_crop_boxes())
+    box   = tf.gather(boxes, random_draw([], 0, boxes.shape[0].value, dtype=tf.int32))
 
-    else:
-      return preprocess_for_eval(image, output_height, output_width,
-                             resize_side_min)
+    # A mirrored crop is obtained by swapping the horizontal box coordinates around the center of the frame
+    to_flip = random_draw([], 0, 1)
+    box     = tf.cond(tf.greater_equal(to_flip, 0.5), lambda: tf.stack([box[0], 1. - box[1], box[2], 1. - box[3]]), lambda: box)
 
-    # END IF
+    num_frames = tf.shape(clip)[0]
 
+    return tf.image.crop_and_resize(clip, tf.tile([box], [num_frames, 1]), tf.range(num_frames), [output_height, output_width])
 
 
-def preprocess(input_data_tensor, frames, height, width, channel, input_dims, output_dims, seq_length, size, label, istraining, video_step, num_segs = 3, input_alpha=1.0):
+def preprocess(input_data_tensor, frames, height, width, channel, input_dims, output_dims, seq_length, size, label, istraining, video_step, num_segs = 3, input_alpha=1.0, batched=False):
     """
     Preprocessing function corresponding to the chosen model
     Args:
@@ -78,17 +93,18 @@ def preprocess(input_data_tensor, frames, height, width, channel, input_dims, ou
         :label:             Label of current sample
         :istraining:        Boolean indicating training or testing phase
         :num_segs:          Number of segments to evenly divice the video into
+        :batched:           input_data_tensor holds a batch of clips [num_clips, frames, height, width, channels] preprocessed together, frames is the length of each clip
 
     Return:
         Preprocessing input data and labels tensor
     """
 
-    # CV2 uses BGR so convert from RGB
-    #input_data_tensor = input_data_tensor[...,::-1]
+    # Frames arrive in the BGR order stored in the tfrecords (see TSN.input_channel_order)
+    pipeline = PreprocessingPipeline(input_order='BGR')
+    pipeline.cast(tf.float32)
 
     # Allow for resampling of input during testing for evaluation of the model's stability over video speeds
-    input_data_tensor = tf.cast(input_data_tensor, tf.float32)
-    input_data_tensor = resample_input(input_data_tensor, frames, frames, input_alpha)
+    pipeline.custom(lambda clip: temporal_resample(clip, frames, frames, input_alpha)[0], channel_agnostic=True, float_input=False)
 
     # During training, segment video into input_dims/seq_length segments, then randomly extract a seq_length snippet from each segment
     if istraining:
@@ -97,106 +113,68 @@ def preprocess(input_data_tensor, frames, height, width, channel, input_dims, ou
 
         num_segs       = combined_snippet_len/snippet_length
 
-        # Ensure enough frames to extract snippet_length number of frames from each of num_segs segments that the video is split into
-        input_data_tensor = tf.cond(tf.less(frames, snippet_length * num_segs),
-                                    lambda: loop_video_with_offset(input_data_tensor, input_data_tensor, 0, frames, height, width, channel, snippet_length * num_segs),
-                                    lambda: input_data_tensor)
+        def _segment_snippets(clip):
+            # Ensure enough frames to extract snippet_length number of frames from each of num_segs segments that the video is split into
+            clip = tf.cond(tf.less(frames, snippet_length * num_segs),
+                           lambda: loop_video_with_offset(clip, clip, 0, frames, height, width, channel, snippet_length * num_segs),
+                           lambda: clip)
 
-        frames = tf.shape(input_data_tensor)[0]
-        segment_length = frames/num_segs
+            segment_length = tf.shape(clip)[0]/num_segs
 
-        input_data_tensor_temp = []
+            snippets = []
 
-        # For each segment the video is split into, randomly extract 'snippet_length' number of sequential frames within that segment
-        for seg in range(num_segs):
-            random_extract_index = tf.random_uniform(dtype=tf.int32, minval=seg * segment_length, maxval= (seg+1)*segment_length - snippet_length, shape=np.asarray([1]))[0]
-            input_data_tensor_temp.append(tf.gather(input_data_tensor, tf.range(random_extract_index, random_extract_index+snippet_length)))
+            # For each segment the video is split into, randomly extract 'snippet_length' number of sequential frames within that segment
+            for seg in range(num_segs):
+                random_extract_index = random_draw(np.asarray([1]), seg * segment_length, (seg+1)*segment_length - snippet_length, dtype=tf.int32)[0]
+                snippets.append(tf.gather(clip, tf.range(random_extract_index, random_extract_index+snippet_length)))
 
-        # END FOR
-
-        input_data_tensor = tf.concat(input_data_tensor_temp, axis=0)
-
-        input_data_tensor = tf.map_fn(lambda img: resize(img, 256, 340), input_data_tensor)
-
-
-        # Now that num_seg snippets have been extracted, each frame must be preprocessed (cropping and flipping)
-        scales = [1., 0.875, 0.75, 0.66]
-
-        im_shape = tf.shape(input_data_tensor)
-        im_h = tf.cast(im_shape[1], tf.float32)
-        im_w = tf.cast(im_shape[2], tf.float32)
-
-        base_size = tf.minimum(im_h, im_w)
-        crop_sizes = tf.convert_to_tensor(scales)*tf.cast(base_size, tf.float32)
-
-        crop_combinations = [[0,0],[0,1],[1,0],[1,1],[1,2],[2,1],[2,2],[2,3],[3,2],[3,3]]
+            # END FOR
 
-        pair_inds = tf.gather(crop_combinations, tf.random_uniform(dtype=tf.int32, minval=0, maxval=len(crop_combinations), shape=[]))
-        crop_h = tf.gather(crop_sizes, pair_inds[0])
-        crop_w = tf.gather(crop_sizes, pair_inds[1])
+            return tf.concat(snippets, axis=0)
 
-        h_step = tf.cast((im_h - crop_h) / 4., tf.int32)
-        w_step = tf.cast((im_w - crop_w) / 4., tf.int32)
+        # END DEF
 
-        more_fix_crop = True
-        ret = list()
-        ret.append((0, 0))  # upper left
-        ret.append((4 * h_step, 0))  # upper right
-        ret.append((0, 4 * w_step))  # lower left
-        ret.append((4 * h_step, 4 * w_step))  # lower right
-        ret.append((2 * h_step, 2 * w_step))  # center
+        pipeline.custom(_segment_snippets, channel_agnostic=True, float_input=False)
 
-        if more_fix_crop:
-            ret.append((0, 2 * w_step))  # center left
-            ret.append((4 * h_step, 2 * w_step))  # center right
-            ret.append((2 * h_step, 4 * w_step))  # lower center
-            ret.append((2 * h_step, 0 * w_step))  # upper center
-
-            ret.append((1 * h_step, 1 * w_step))  # upper left quarter
-            ret.append((3 * h_step, 1 * w_step))  # upper right quarter
-            ret.append((1 * h_step, 3 * w_step))  # lower left quarter
-            ret.append((3 * h_step, 3 * w_step))  # lower righ quarter
-
-        # END IF
-
-        offset_ind = tf.random_uniform(dtype=tf.int32, minval=0, maxval=len(ret), shape=[])
-        offset = tf.gather(ret, offset_ind)
-        offset_height = offset[0]
-        offset_width = offset[1]
-
-        input_data_tensor = random_flip_left_right_clip(input_data_tensor)
-        input_data_tensor = crop_clip(input_data_tensor, tf.cast(offset_height, tf.int32), tf.cast(offset_width, tf.int32), tf.cast(crop_h, tf.int32), tf.cast(crop_w, tf.int32))
+        # Multi-scale crop (resize to 256x340, random scale pair and fixed offset, random flip, resize to size) fused into one crop_and_resize over the clip
+        pipeline.custom(lambda clip: multi_scale_crop_and_resize(clip, size[0], size[1]), channel_agnostic=True, float_input=False, float_output=True)
 
     # During testing, resample video down to seq_length/10 number of frames, then oversample (each frame x10 crops and mirrors) to seq_length frames
     else:
         snippet_length = input_dims/10 # Equivalent to seq_length/10
 
-        # Ensure enough frames to extract snippet_length number of frames from each video
-        input_data_tensor = tf.cond(tf.less(frames, snippet_length),
-                                    lambda: loop_video_with_offset(input_data_tensor, input_data_tensor, 0, frames, height, width, channel, snippet_length),
-                                    lambda: input_data_tensor)
+        def _uniform_snippet(clip):
+            # Ensure enough frames to extract snippet_length number of frames from each video
+            clip = tf.cond(tf.less(frames, snippet_length),
+                           lambda: loop_video_with_offset(clip, clip, 0, frames, height, width, channel, snippet_length),
+                           lambda: clip)
 
-        frames_after_loop = tf.shape(input_data_tensor)[0]
+            # Uniformly resample video down to snippet_length number of frames
+            return temporal_resample(clip, snippet_length, tf.shape(clip)[0])[0]
 
-        # Uniformly resample video down to snippet_length number of frames
-        input_data_tensor = resample_input(input_data_tensor, snippet_length, frames_after_loop, 1.0)
+        # END DEF
 
-        # Prepare input_data_tensor for oversampling which will result in 10x the number of output frames per frame
-        # Pad the current output tensor since tf.map_fn requires identical dimension for input and output
-        input_data_tensor = tf.pad(tf.expand_dims(input_data_tensor, axis=1), [[0,0],[0,9],[0,0],[0,0],[0,0]])
+        pipeline.custom(_uniform_snippet, channel_agnostic=True, float_input=False)
+        pipeline.resize(_RESIZE_HEIGHT, _RESIZE_WIDTH)
 
-    # END IF
+        # Each frame results in 10 output frames (four corners and center, and their mirrored versions)
+        pipeline.custom(lambda clip: oversample_clip(clip, size[0], size[1]), channel_agnostic=True, float_input=False)
+
+        # Mean subtraction of the oversampled test crops applied once over the entire clip
+        pipeline.normalize([123, 117, 104])
 
-    # Apply preprocessing related to individual frames (cropping, flipping, resize, etc.... )
-    input_data_tensor = tf.map_fn(lambda img: preprocess_image(img, size[0], size[1], is_training=istraining, resize_side_min=size[0]), input_data_tensor)
+    # END IF
 
     # Ensure that the final output is the correct dimensionality, for testing this will result in [combined_snippet_len*10, out_H, out_W, chan]
-    input_data_tensor = tf.reshape(input_data_tensor, [input_dims, size[0], size[1], 3])
+    # and rotate every frame by 90 degrees (equivalent to tf.image.rot90(img, 1))
+    pipeline.custom(lambda clip: tf.transpose(tf.reshape(clip, [input_dims, size[0], size[1], 3])[:,:,::-1,:], [0, 2, 1, 3]), channel_agnostic=True, float_input=False)
 
-    input_data_tensor = tf.map_fn(lambda img: tf.image.rot90(img, 1), input_data_tensor)
+    # CV2 uses BGR so convert from RGB (cancels out with the BGR to RGB conversion when compiled)
+    pipeline.channel_flip()
 
-    # CV2 uses BGR so convert from RGB
-    input_data_tensor = input_data_tensor[...,::-1]
+    if batched:
+        return pipeline.batch(input_data_tensor)
 
+    # END IF
 
-    return input_data_tensor
+    return pipeline(input_data_tensor)
@@ -0,0 +1,111 @@
+" NUMPY VERSION OF THE TSN DEFAULT PREPROCESSING, USED BY THE PROCESS POOL PREPROCESSING BACKEND "
+
+import numpy as np
+
+from utils.numpy_preprocessing_utils import *
+
+from default_preprocessing import multi_scale_crop_boxes
+
+# Crop windows are identical for every video, computed once per worker process
+_BOXES = []
+
+
+def _multi_scale_crop_boxes():
+    """
+    Return: Memoized output of default_preprocessing.multi_scale_crop_boxes
+    """
+    if len(_BOXES) == 0:
+        _BOXES.append(multi_scale_crop_boxes())
+
+    # END IF
+
+    return _BOXES[0]
+
+
+def _multi_scale_crop_and_resize(input_data, output_height, output_width):
+    """
+    Random multi-scale crop window (uniform over scale pairs and offsets), mirrored with a 50% likelihood, identical for every frame of the clip
+    Args:
+        :input_data:    Clip of shape [frames, height, width, channels]
+        :output_height: Height of the output frames
+        :output_width:  Width of the output frames
+
+    Return:
+        Cropped and resized clip
+    """
+    boxes = _multi_scale_crop_boxes()
+    box   = boxes[random_integer(0, boxes.shape[0])]
+
+    if random_fraction() >= 0.5:
+        box = [box[0], 1. - box[1], box[2], 1. - box[3]]
+
+    # END IF
+
+    return crop_and_resize(input_data, box, output_height, output_width)
+
+
+def preprocess(input_data, frames, height, width, channel, input_dims, output_dims, seq_length, size, label, istraining, num_segs=3, input_alpha=1.0):
+    """
+    Preprocessing function corresponding to default_preprocessing.preprocess, operating on numpy arrays
+    Args:
+        :input_data:        Raw input data [frames x height x width x channels]
+        :frames:            Total number of frames
+        :height:            Height of frame
+        :width:             Width of frame
+        :channel:           Total number of color channels
+        :input_dims:        Number of frames to be provided as input to model
+        :output_dims:       Total number of labels
+        :seq_length:        Number of frames expected as output of model
+        :size:              Output size of preprocessed frames
+        :label:             Label of current sample
+        :istraining:        Boolean indicating training or testing phase
+        :num_segs:          Number of segments to evenly divide the video into
+        :input_alpha:       Alpha value to resample input_data (independent of model)
+
+    Return:
+        Preprocessed float32 clip
+    """
+    input_data = temporal_resample(input_data, frames, frames, input_alpha)
+
+    # During training, segment video into input_dims/seq_length segments, then randomly extract a seq_length snippet from each segment
+    if istraining:
+        snippet_length = seq_length
+        num_segs       = input_dims/snippet_length
+
+        if frames < snippet_length * num_segs:
+            input_data = loop_video_with_offset(input_data, input_data, 0, frames, snippet_length * num_segs)
+
+        # END IF
+
+        segment_length = input_data.shape[0]/num_segs
+        snippets       = []
+
+        for seg in range(num_segs):
+            random_extract_index = random_integer(seg * segment_length, (seg+1) * segment_length - snippet_length)
+            snippets.append(input_data[random_extract_index:random_extract_index+snippet_length])
+
+        # END FOR
+
+        input_data = _multi_scale_crop_and_resize(np.concatenate(snippets, axis=0), size[0], size[1])
+
+    # During testing, resample video down to input_dims/10 frames, then oversample (each frame x10 crops and mirrors) to input_dims frames
+    else:
+        snippet_length = input_dims/10
+
+        if frames < snippet_length:
+            input_data = loop_video_with_offset(input_data, input_data, 0, frames, snippet_length)
+
+        # END IF
+
+        input_data = temporal_resample(input_data, snippet_length, input_data.shape[0])
+        input_data = resize(input_data, 256, 340)
+        input_data = np.concatenate([oversample(frame, size[0], size[1]) for frame in input_data], axis=0)
+        input_data = normalize_clip(input_data, [123, 117, 104])
+
+    # END IF
+
+    input_data = np.asarray(input_data, dtype=np.float32).reshape([input_dims, size[0], size[1], 3])
+    input_data = np.rot90(input_data, 1, axes=(1, 2))
+
+    # CV2 uses BGR so convert from RGB
+    return np.ascontiguousarray(input_data[...,::-1])
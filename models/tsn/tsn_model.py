@@ -18,6 +18,7 @@ except:
 # END TRY
 
 from default_preprocessing       import preprocess
+from numpy_preprocessing         import preprocess as numpy_preprocess
 
 class TSN(Abstract_Model_Class):
 
@@ -60,7 +61,7 @@ class TSN(Abstract_Model_Class):
         layers[scope+'_pool_proj'] = conv_layer(input_tensor=layers[scope+'_pool'], filter_dims=[1,1,filter_list[6]], stride_dims=[1,1], non_linear_fn=None, padding='VALID', weight_decay=weight_decay, name=scope+'/pool_proj')
         layers[scope+'_pool_proj_bn'] = tf.nn.relu(batch_normalization(input_tensor=layers[scope+'_pool_proj'], training=False, trainable=False, name=scope+'/pool_proj_bn'))
 
-        layers[scope+'_output'] = tf.concat([layers[scope+'_1_bn'], layers[scope+'_2_bn'], layers[scope+'_double_2_bn'], layers[scope+'_pool_proj_bn']], axis=3, name=scope+'/output')
+        layers[scope+'_output'] = tf.concat([layers[scope+'_1_bn'], layers[scope+'_2_bn'], layers[scope+'_double_2_bn'], layers[scope+'_pool_proj_bn']], axis=channel_axis(inputs), name=scope+'/output')
 
         return layers
 
@@ -81,7 +82,7 @@ class TSN(Abstract_Model_Class):
 
         layers[scope+'_pool'] = max_pool_layer(input_tensor=inputs, filter_dims=[3,3], stride_dims=[2,2], padding='SAME', name=scope+'/pool')
 
-        layers[scope+'_output'] = tf.concat([layers[scope+'_1_bn'], layers[scope+'_double_2_bn'], layers[scope+'_pool']], axis=3, name=scope+'/output')
+        layers[scope+'_output'] = tf.concat([layers[scope+'_1_bn'], layers[scope+'_double_2_bn'], layers[scope+'_pool']], axis=channel_axis(inputs), name=scope+'/output')
 
         return layers
 
@@ -106,7 +107,7 @@ class TSN(Abstract_Model_Class):
     def inference(self, inputs, is_training, input_dims, output_dims, seq_length, scope, dropout_rate = 0.2, return_layer=['logits'], weight_decay=0.0):
         """
         Args:
-            :inputs:       Input to model of shape [BatchSize x Frames x Height x Width x Channels]
+            :inputs:       Input to model of shape [BatchSize x Frames x Height x Width x Channels], channels last in every data format
             :is_training:  Boolean variable indicating phase (TRAIN OR TEST)
             :input_dims:   Length of input sequence
             :output_dims:  Integer indicating total number of classes in final prediction
@@ -132,10 +133,9 @@ class TSN(Abstract_Model_Class):
 
         inputs = self.flatten_batch(inputs)
 
-        with tf.name_scope(scope, 'TSN', [inputs]):
-            layers = {}
+        with tf.name_scope(scope, 'TSN', [inputs]), LayerDict(return_layer, self.freeze_boundary(), self.recompute_boundaries()) as layers:
 
-            layers['conv1'] = conv_layer(input_tensor=inputs, filter_dims=[7,7,64], stride_dims=[2,2], non_linear_fn=None, name='conv1/7x7_s2', weight_decay=weight_decay)
+            layers['conv1'] = conv_layer(input_tensor=to_data_format(inputs), filter_dims=[7,7,64], stride_dims=[2,2], non_linear_fn=None, name='conv1/7x7_s2', weight_decay=weight_decay)
             layers['conv1_bn'] = tf.nn.relu(batch_normalization(input_tensor=layers['conv1'], training=is_training, trainable=False, name='conv1/7x7_s2_bn'))
             layers['pool1'] = max_pool_layer(input_tensor=layers['conv1_bn'], filter_dims=[3,3], stride_dims=[2,2], name='pool1/3x3_s2')
 
@@ -160,16 +160,33 @@ class TSN(Abstract_Model_Class):
 
             layers['global_pool'] = avg_pool_layer(input_tensor=layers['inception_5b_output'], filter_dims=[7,7], stride_dims=[1,1], name='global_pool', padding='VALID')
 
-            layers['dropout'] = dropout(input_tensor=layers['global_pool'], training=is_training, rate=dropout_rate)
-
-            layers['logits'] = fully_connected_layer(input_tensor=layers['dropout'], out_dim=output_dims, name='fc-action', non_linear_fn=None, weight_init=tf.truncated_normal_initializer(stddev=0.001), weight_decay=weight_decay)
+            self._head(layers, is_training, output_dims, dropout_rate, weight_decay)
 
         # END WITH
 
-        layers['logits'] = self.extend_batch(layers['logits'], self.batch_size)
-
         return [layers[x] for x in return_layer]
 
+    def _head(self, layers, is_training, output_dims, dropout_rate, weight_decay):
+        """
+        Add the fully connected layer on top of layers['global_pool'] to layers
+        Args:
+            :layers:       Dictionary of layers holding at least 'global_pool', the segments of every clip flattened into the batch
+            :is_training:  Boolean variable indicating phase (TRAIN OR TEST)
+            :output_dims:  Integer indicating total number of classes in final prediction
+            :dropout_rate: Value indicating proability of keep inputs
+            :weight_decay: Double value of weight decay
+        """
+        layers['dropout'] = dropout(input_tensor=layers['global_pool'], training=is_training, rate=dropout_rate)
+
+        layers['logits'] = self.extend_batch(fully_connected_layer(input_tensor=layers['dropout'], out_dim=output_dims, name='fc-action', non_linear_fn=None, weight_init=tf.truncated_normal_initializer(stddev=0.001), weight_decay=weight_decay),
+                                             self.batch_size)
+
+    def feature_layer(self):
+        """
+        Return: None, the convolutions of the BN-Inception trunk are trained along with the fully connected layer and its output cannot be stored
+        """
+        return None
+
 
 
 
@@ -208,6 +225,38 @@ class TSN(Abstract_Model_Class):
         """
         return preprocess(input_data_tensor, frames, height, width, channel, input_dims, output_dims, seq_length, size, label, istraining, video_step, self.num_segs, self.input_alpha)
 
+    def preprocess_tfrecords_batch(self, clips, frames, height, width, channel, input_dims, output_dims, seq_length, size, label, istraining, video_step):
+        """
+        Args:
+            :clips:      All clips of a video, shape [num_clips, frames, height, width, channels]
+            :frames:     Number of frames in each clip
+            (remaining arguments as in preprocess_tfrecords)
+
+        Return:
+            Preprocessed clips [num_clips, input_dims, size[0], size[1], channels] of the default preprocessing pipeline, which, as in
+            preprocess_tfrecords, is applied whatever the preprocessing method since it is the only one of this model
+        """
+        return preprocess(clips, frames, height, width, channel, input_dims, output_dims, seq_length, size, label, istraining, video_step, self.num_segs, self.input_alpha, batched=True)
+
+    def input_channel_order(self):
+        """
+        Return:
+            Channel order expected by preprocess_tfrecords, the default preprocessing pipeline takes the BGR frames stored in the tfrecords
+        """
+        return 'BGR'
+
+    def numpy_preprocessing(self):
+        """
+        Return:
+            NumPy version of the default preprocessing function and its keyword arguments, None for other preprocessing methods
+        """
+        if self.preproc_method == 'default':
+            return numpy_preprocess, {'num_segs': self.num_segs, 'input_alpha': self.input_alpha}
+
+        # END IF
+
+        return None
+
 
 
     """ Function to return loss calculated on given network """
@@ -0,0 +1,175 @@
+# Basic imports
+import os
+import argparse
+import tensorflow      as tf
+
+# Custom imports
+from models                 import *
+from utils.layers_utils     import set_record_layers, set_fold_batch_norm, set_data_format
+from utils.sys_utils        import make_dir
+from utils.profile_utils    import profile_layers, timing_ops, time_layers, print_profiles, write_profiles
+
+
+parser = argparse.ArgumentParser()
+
+# Model parameters
+
+parser.add_argument('--model', action= 'store', required=True,
+        help= 'Model architecture (c3d, i3d, tsn, resnet)')
+
+parser.add_argument('--inputDims', action='store', required=True, type=int,
+        help = 'Input Dimensions (Number of frames to pass as input to the model)')
+
+parser.add_argument('--outputDims', action='store', type=int, default=101,
+        help = 'Output Dimensions (Number of classes in dataset)')
+
+parser.add_argument('--seqLength', action='store', required=True, type=int,
+        help = 'Number of output frames expected from model')
+
+parser.add_argument('--size', action='store', required=True, type=int,
+        help = 'Input frame size')
+
+parser.add_argument('--batchSize', action='store', type=int, default=1,
+        help = 'Number of clips in the input')
+
+parser.add_argument('--train', action= 'store', type=int, default=0,
+        help = 'Profile the training graph (1), including the backward times of the trained layers, or the inference graph (0)')
+
+parser.add_argument('--freeze', action='store', type=int, default=0,
+        help = 'Freeze weights during training of any layers within the model that are expected to be pretrained')
+
+parser.add_argument('--foldBatchNorm', action='store', type=int, default=0,
+        help = 'Boolean indicating whether to fold batch normalizations into convolutions, as in exported graphs (inference only)')
+
+parser.add_argument('--dataFormat', action='store', default='channels_last',
+        help = 'Layout of the activations inside the model, channels_last or channels_first')
+
+# Profiling parameters
+
+parser.add_argument('--time', action='store', type=int, default=0,
+        help = 'Boolean indicating whether to measure the forward (and backward with --train 1) time of every layer')
+
+parser.add_argument('--numSteps', action='store', type=int, default=20,
+        help = 'Number of timed runs per layer')
+
+parser.add_argument('--warmupSteps', action='store', type=int, default=3,
+        help = 'Number of untimed runs per layer before timing')
+
+parser.add_argument('--outputFile', action='store', default='',
+        help = 'Path of the JSON profile, defaults to results/profiles/<model>_<inputDims>x<size>x<size>_b<batchSize>_<train|test>.json')
+
+parser.add_argument('--gpu', action='store', default='0',
+        help = 'GPU ID to run the model on')
+
+parser.add_argument('--cpu', action='store', type=int, default=0,
+        help = 'Boolean indicating whether to run the model on the CPU only, hiding every GPU')
+
+parser.add_argument('--verbose', action='store', type=int, default=1,
+        help = 'Boolean switch to display all print statements or not')
+
+
+args = parser.parse_args()
+
+if args.verbose:
+    print "Setup of current profile"
+    print "\n############################"
+    print args
+    print "############################ \n"
+
+# END IF
+
+
+def profile(model, input_dims, output_dims, seq_length, size, batch_size, istraining, timed, num_steps, warmup_steps, gpu, cpu=False):
+    """
+    Build a model on random inputs held in a variable and profile each layer of its layers dictionary
+    Args:
+        :model:         tf-activity-recognition framework model object
+        :input_dims:    Number of frames used in input
+        :output_dims:   Integer number of classes in current dataset
+        :seq_length:    Length of output sequence expected from LSTM
+        :size:          List detailing height and width of frame
+        :batch_size:    Number of clips in the input
+        :istraining:    Boolean indicating whether the training graph is profiled
+        :timed:         Boolean indicating whether to measure the forward and backward time of every layer
+        :num_steps:     Number of timed runs per layer
+        :warmup_steps:  Number of untimed runs per layer before timing
+        :gpu:           GPU ID to run the model on
+        :cpu:           Boolean indicating whether to run the model on the CPU only
+
+    Returns:
+        List of layer profiles (see utils/profile_utils.py)
+    """
+    set_record_layers(True)
+
+    with tf.Graph().as_default():
+        inputs = tf.Variable(tf.random_uniform([batch_size, input_dims, size[0], size[1], 3], -1., 1.), trainable=False, name='profile_inputs')
+        labels = tf.Variable(tf.random_uniform([batch_size, seq_length], 0, output_dims, dtype=tf.int32), trainable=False, name='profile_labels')
+
+        with tf.device('/cpu:0' if cpu else '/gpu:'+gpu):
+            with tf.name_scope("my_scope") as scope:
+                logits = model.inference(inputs.value(), istraining, input_dims, output_dims, seq_length, scope)[0]
+
+            # END WITH
+
+            profiles = profile_layers(inputs.value())
+
+            if timed:
+                ops = timing_ops(profiles, model.loss(logits, labels, 'full_loss') if istraining else None)
+
+            # END IF
+
+        # END WITH
+
+        if timed:
+            sess = tf.Session(config=tf.ConfigProto(allow_soft_placement=True, device_count={'GPU': 0} if cpu else {}))
+            sess.run(tf.global_variables_initializer())
+
+            time_layers(sess, profiles, ops, num_steps, warmup_steps)
+
+            sess.close()
+
+        # END IF
+
+    # END WITH
+
+    set_record_layers(False)
+
+    return profiles
+
+
+if __name__=="__main__":
+    model = create_model_object(modelName = args.model,
+                                inputAlpha = 1.0,
+                                clipLength = -1,
+                                numVids = 1,
+                                batchSize = args.batchSize,
+                                numClips = -1,
+                                train = args.train,
+                                expName = 'profile_models',
+                                outputDims = args.outputDims,
+                                inputDims = args.inputDims,
+                                freeze = args.freeze,
+                                verbose = args.verbose)
+
+    set_fold_batch_norm(args.foldBatchNorm == 1)
+    set_data_format(args.dataFormat)
+
+    profiles = profile(model, args.inputDims, args.outputDims, args.seqLength, [args.size, args.size], args.batchSize, args.train == 1, args.time == 1,
+                       args.numSteps, args.warmupSteps, args.gpu, args.cpu == 1)
+
+    print_profiles(profiles)
+
+    output_file = args.outputFile
+
+    if output_file == '':
+        make_dir('results')
+        make_dir(os.path.join('results', 'profiles'))
+
+        output_file = os.path.join('results', 'profiles', '%s_%dx%dx%d_b%d_%s.json' % (model.name, args.inputDims, args.size, args.size, args.batchSize,
+                                                                                        'train' if args.train == 1 else 'test'))
+
+    # END IF
+
+    write_profiles(output_file, profiles, vars(args))
+
+    print "Profile written to " + output_file
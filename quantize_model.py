@@ -0,0 +1,287 @@
+# Basic imports
+import os
+import argparse
+import tensorflow      as tf
+import numpy           as np
+
+# Tensorflow ops imports
+from tensorflow.python.training import queue_runner_impl
+
+# Custom imports
+from models                       import *
+from utils                        import initialize_from_dict, load_checkpoint, fold_batch_norms, set_conv3d_as_conv2d
+from utils.export_utils           import build_inference_graph, freeze_graph, write_graph
+from utils.quantization_utils     import quantize_graph, calibrate_requantization_ranges, freeze_requantization_ranges, agreement
+from utils.frozen_model           import FrozenModel, INPUT_NAME
+from utils.load_dataset_tfrecords import load_dataset
+
+
+parser = argparse.ArgumentParser()
+
+# Model parameters
+
+parser.add_argument('--model', action= 'store', required=True,
+        help= 'Model architecture (c3d, i3d, tsn, resnet)')
+
+parser.add_argument('--inputDims', action='store', required=True, type=int,
+        help = 'Input Dimensions (Number of frames to pass as input to the model)')
+
+parser.add_argument('--outputDims', action='store', required=True, type=int,
+        help = 'Output Dimensions (Number of classes in dataset)')
+
+parser.add_argument('--seqLength', action='store', required=True, type=int,
+        help = 'Number of output frames expected from model')
+
+parser.add_argument('--size', action='store', required=True, type=int,
+        help = 'Input frame size')
+
+parser.add_argument('--inputAlpha', action='store', type=float, default=1.,
+        help = 'Resampling factor for constant value resampling of input video')
+
+parser.add_argument('--loadWeights', action='store', type=str, default='default',
+        help = 'String which can be used to specify the default weights to load.')
+
+parser.add_argument('--preprocMethod', action='store', default='default',
+        help = 'Which preprocessing method to use (default, cvr, rr, sr are options for existing models)')
+
+# Checkpoint parameters
+
+parser.add_argument('--load', action='store', type=int, default=1,
+        help = 'Whether to quantize a saved checkpoint of the experiment (1) or the default weights of the model (0)')
+
+parser.add_argument('--loadedDataset', action= 'store', required=True,
+        help= 'Dataset (UCF101, HMDB51) the checkpoint was trained on')
+
+parser.add_argument('--expName', action='store', required=True,
+        help = 'Name of the experiment whose checkpoint is quantized')
+
+parser.add_argument('--loadedCheckpoint', action='store', type=int, default=-1,
+        help = 'Step of the saved checkpoint to quantize. Defaults to most recent checkpoint.')
+
+# Calibration parameters
+
+parser.add_argument('--dataset', action= 'store', required=True,
+        help= 'Dataset (UCF101, HMDB51) of the calibration clips')
+
+parser.add_argument('--split', action='store', type=int, default=1,
+        help = 'Dataset split to use')
+
+parser.add_argument('--baseDataPath', action='store', default='/z/dat',
+        help = 'Path to datasets')
+
+parser.add_argument('--fName', action='store', default='testlist',
+        help = 'Which dataset list the calibration clips are taken from (trainlist, testlist, vallist)')
+
+parser.add_argument('--calibrationClips', action='store', type=int, default=300,
+        help = 'Number of clips on which the ranges of the activations are calibrated')
+
+parser.add_argument('--clipLength', action='store', type=int, default=-1,
+        help = 'Length of clips to cut video into, -1 indicates using the entire video as one clip')
+
+parser.add_argument('--videoOffset', action='store', default='none',
+        help = '(none or random) indicating where to begin selecting video clips assuming clipOffset is none')
+
+parser.add_argument('--clipOffset', action='store', default='none',
+        help = '(none or random) indicating if clips are selected sequentially or randomly')
+
+parser.add_argument('--clipStride', action='store', type=int, default=0,
+        help = 'Number of frames that overlap between clips, 0 indicates no overlap and negative values indicate a gap of frames between clips')
+
+parser.add_argument('--numClips', action='store', type=int, default=-1,
+        help = 'Number of clips to break video into, -1 indicates breaking the video into the maximum number of clips based on clipLength, clipStride, and clipOffset')
+
+parser.add_argument('--batchSize', action='store', type=int, default=1,
+        help = 'Number of clips in each input of the quantized graph, must match the batchSize of test.py')
+
+parser.add_argument('--clipCacheDir', action='store', default='clip_cache',
+        help = 'Directory caching preprocessed testing clips, shared with test.py, not used for random clips (videoOffset or clipOffset random, preprocMethod rr), empty string disables the cache (Default clip_cache)')
+
+# Export parameters
+
+parser.add_argument('--outputPath', action='store', default='',
+        help = 'Path of the quantized graph file, defaults to results/<model>/<loadedDataset>/<preprocMethod>/<expName>/frozen/<model>_int8.pb')
+
+parser.add_argument('--verify', action='store', type=int, default=1,
+        help = 'Boolean indicating whether to compare the predictions of the quantized and float32 graphs on the calibration clips')
+
+parser.add_argument('--verbose', action='store', type=int, default=1,
+        help = 'Boolean switch to display all print statements or not')
+
+
+args = parser.parse_args()
+
+if args.verbose:
+    print "Setup of current quantization"
+    print "\n############################"
+    print args
+    print "############################ \n"
+
+# END IF
+
+
+def _calibration_batches(model, input_dims, output_dims, seq_length, size, data_path, dataset, clip_length, video_offset, clip_offset, num_clips, clip_stride,
+                         batch_size, calibration_clips, clip_cache_dir, verbose):
+    """
+    Load preprocessed testing clips, in a graph of their own
+    Args:
+        :data_path: Full path to the tfrecords of the split
+        (remaining arguments as in quantize)
+
+    Returns:
+        List of arrays of batch_size preprocessed clips
+    """
+    with tf.Graph().as_default():
+        video_step = tf.Variable(1.0, name='video_step', trainable=False)
+        sess       = tf.Session(config=tf.ConfigProto(allow_soft_placement=True))
+
+        input_data_tensor = load_dataset(model, 1, batch_size, output_dims, input_dims, seq_length, size, data_path, dataset, False, clip_length, video_offset, clip_offset, num_clips,
+                                         clip_stride, video_step, 0, 0, verbose, 'tf', 0, clip_cache_dir)[0]
+
+        sess.run(tf.global_variables_initializer())
+
+        coord   = tf.train.Coordinator()
+        threads = queue_runner_impl.start_queue_runners(sess=sess, coord=coord)
+        batches = []
+
+        while len(batches) * batch_size < calibration_clips:
+            batches.append(sess.run(input_data_tensor)[0:batch_size])
+
+        # END WHILE
+
+        coord.request_stop()
+        coord.join(threads)
+        sess.close()
+
+    # END WITH
+
+    return batches
+
+
+def quantize(model, input_dims, output_dims, seq_length, size, load_model, loaded_dataset, experiment_name, loaded_checkpoint, preproc_method, dataset, split, base_data_path,
+             f_name, calibration_clips, clip_length, video_offset, clip_offset, num_clips, clip_stride, batch_size, clip_cache_dir, output_path, verify, verbose):
+    """
+    Export a model and its weights as a frozen inference graph with 8-bit weights and activations, whose activation ranges are calibrated on testing clips.
+    The graph takes batch_size preprocessed clips, as loaded by load_dataset, and is evaluated by test.py --quantizedGraph
+    Args:
+        :model:             tf-activity-recognition framework model object
+        :input_dims:        Number of frames used in input
+        :output_dims:       Integer number of classes in current dataset
+        :seq_length:        Length of output sequence expected from LSTM
+        :size:              List detailing height and width of frame
+        :load_model:        Boolean variable indicating whether to load from a checkpoint or the default weights of the model
+        :loaded_dataset:    Name of dataset which was used to train the current model
+        :experiment_name:   Name of the experiment of the checkpoint
+        :loaded_checkpoint: Step of the checkpoint, -1 for the most recent one
+        :preproc_method:    The preprocessing method to use, default, cvr, rr, sr, or any other custom preprocessing
+        :dataset:           Name of dataset of the calibration clips
+        :split:             Split of dataset being used
+        :base_data_path:    Full path to root directory containing datasets
+        :f_name:            Specific video directory within a chosen split of a dataset
+        :calibration_clips: Number of clips on which the activation ranges are calibrated
+        :clip_length:       Length of clips to cut video into, -1 indicates using the entire video as one clip
+        :video_offset:      String indicating where to begin selecting video clips (provided clipOffset is None)
+        :clip_offset:       "none" or "random" indicating where to begin selecting video clips
+        :num_clips:         Number of clips to break video into
+        :clip_stride:       Number of frames that overlap between clips, 0 indicates no overlap and negative values indicate a gap of frames between clips
+        :batch_size:        Number of clips in each input of the graph
+        :clip_cache_dir:    Directory caching preprocessed testing clips, '' disables the cache
+        :output_path:       Path of the quantized graph file
+        :verify:            Boolean indicating whether to compare the predictions of the quantized and float32 graphs on the calibration clips
+        :verbose:           Boolean to indicate if all print statement should be procesed or not
+
+    Returns:
+        Does not return anything
+    """
+    if load_model:
+        ckpt = load_checkpoint(model.name, loaded_dataset, experiment_name, loaded_checkpoint, preproc_method)[0]
+
+    else:
+        ckpt = model.load_default_weights()
+
+    # END IF
+
+    data_path = os.path.join(base_data_path, 'tfrecords_'+dataset, 'Split'+str(split), f_name)
+    batches   = _calibration_batches(model, input_dims, output_dims, seq_length, size, data_path, dataset, clip_length, video_offset, clip_offset, num_clips, clip_stride,
+                                     batch_size, calibration_clips, clip_cache_dir, verbose)
+
+    # 3D convolutions are built from 2D convolutions, which have a quantized kernel
+    set_conv3d_as_conv2d(True)
+
+    with tf.Graph().as_default():
+        clips, output_names = build_inference_graph(model, input_dims, output_dims, seq_length, size, ['logits'], batch_size, None, None, None, embed_preprocessing=False)
+
+        sess = tf.Session(config=tf.ConfigProto(allow_soft_placement=True))
+        sess.run(tf.global_variables_initializer())
+
+        if ckpt is None:
+            print "Caution: Model weights are not being loaded, quantizing a random initialization."
+
+            # Folded batch normalizations keep their default statistics
+            fold_batch_norms(sess)
+
+        else:
+            initialize_from_dict(sess, ckpt, model.name)
+
+        # END IF
+
+        graph_def = freeze_graph(sess, output_names, verbose)
+
+        if verify:
+            reference = [sess.run(output_names[-1] + ':0', feed_dict={clips: batch}) for batch in batches]
+
+        # END IF
+
+        sess.close()
+
+    # END WITH
+
+    set_conv3d_as_conv2d(False)
+
+    quantized = quantize_graph(graph_def, INPUT_NAME, output_names)
+    ranges    = calibrate_requantization_ranges(quantized, INPUT_NAME, batches, verbose)
+    quantized = freeze_requantization_ranges(quantized, INPUT_NAME, output_names, ranges)
+
+    if verbose:
+        print "Quantized graph: %d nodes, %d quantized ops" % (len(quantized.node), len([node for node in quantized.node if node.op.startswith('Quantized')]))
+
+    # END IF
+
+    write_graph(quantized, output_path, verbose)
+
+    if verify:
+        frozen = FrozenModel(output_path, cpu=True)
+        actual = [frozen.run(batch, ['probabilities'])['probabilities'] for batch in batches]
+        frozen.close()
+
+        top1, max_diff = agreement(reference, actual)
+
+        print "Top-1 agreement with float32 on the calibration clips: %.4f, max abs diff of probabilities %.2e" % (top1, max_diff)
+
+    # END IF
+
+
+if __name__=="__main__":
+    model = models_import.create_model_object(modelName = args.model,
+                                              inputAlpha = args.inputAlpha,
+                                              clipLength = args.clipLength,
+                                              numVids = 1,
+                                              batchSize = args.batchSize,
+                                              numClips = args.numClips,
+                                              train = 0,
+                                              expName = args.expName,
+                                              outputDims = args.outputDims,
+                                              inputDims = args.inputDims,
+                                              preprocMethod = args.preprocMethod,
+                                              loadWeights = args.loadWeights,
+                                              verbose = args.verbose)
+
+    output_path = args.outputPath
+
+    if output_path == '':
+        output_path = os.path.join('results', model.name, args.loadedDataset, args.preprocMethod, args.expName, 'frozen', model.name+'_int8.pb')
+
+    # END IF
+
+    quantize(model, args.inputDims, args.outputDims, args.seqLength, [args.size, args.size], args.load, args.loadedDataset, args.expName, args.loadedCheckpoint,
+             args.preprocMethod, args.dataset, args.split, args.baseDataPath, args.fName, args.calibrationClips, args.clipLength, args.videoOffset, args.clipOffset,
+             args.numClips, args.clipStride, args.batchSize, args.clipCacheDir, output_path, args.verify, args.verbose)
@@ -16,11 +16,13 @@ from tensorflow.python.training import queue_runner_impl
 
 # Custom imports
 from models                       import *
-from utils                        import initialize_from_dict, save_checkpoint, load_checkpoint, make_dir, Metrics
+from utils                        import initialize_from_dict, save_checkpoint, load_checkpoint, make_dir, Metrics, set_fold_batch_norm, fold_batch_norms, set_data_format, set_xla, session_config, jit_scope, check_static_shape
 from Queue                        import Queue
 from utils.logger                 import Logger
 from random                       import shuffle
-from utils.load_dataset_tfrecords import load_dataset
+from utils.load_dataset_tfrecords import load_dataset, load_cascade_dataset
+from utils.frozen_model           import FrozenModel
+from utils.cascade_utils          import CascadeModel, confidence, tradeoff_curve, print_tradeoff_curve
 
 
 parser = argparse.ArgumentParser()
@@ -52,7 +54,7 @@ parser.add_argument('--freeze', action='store', type=int, default=0,
         help = 'Freeze weights during training of any layers within the model that have the option set. (default False)')
 
 parser.add_argument('--returnLayer', nargs='+',type=str, default=['logits'],
-        help = 'Which model layers to be returned by the models\' inference during testing.')
+        help = 'Which model layers to be returned by the models\' inference during testing, see extract_features.py to store the outputs of several layers')
 
 parser.add_argument('--loadWeights', action='store', type=str, default='default',
         help = 'String which can be used to specify the default weights to load.')
@@ -137,6 +139,54 @@ parser.add_argument('--useSoftmax', action='store', type=int, default=1,
 parser.add_argument('--preprocDebugging', action='store', type=int, default=0,
         help = 'Boolean indicating whether to load videos and clips in a queue or to load them directly for debugging (Default 0)')
 
+parser.add_argument('--preprocBackend', action='store', default='tf',
+        help = 'Preprocess clips with tensorflow ops (tf) or with NumPy in a pool of processes (numpy)')
+
+parser.add_argument('--numWorkers', action='store', type=int, default=0,
+        help = 'Number of preprocessing processes used by the numpy backend, 0 uses one per cpu (Default 0)')
+
+parser.add_argument('--clipCacheDir', action='store', default='clip_cache',
+        help = 'Directory caching preprocessed testing clips so that later runs skip decoding and preprocessing, not used for random clips (videoOffset or clipOffset random, preprocMethod rr), empty string disables the cache (Default clip_cache)')
+
+parser.add_argument('--foldBatchNorm', action='store', type=int, default=0,
+        help = 'Boolean indicating whether to fold batch normalization layers into the preceding convolutions when loading weights, removing them from the graph (Default 0)')
+
+parser.add_argument('--dataFormat', action='store', default='channels_last',
+        help = 'Layout of the activations inside the model, channels_last or channels_first (preferred by MKL-DNN CPU builds) (Default channels_last)')
+
+parser.add_argument('--xla', action='store', default='none',
+        help = 'XLA JIT compilation: none, global (every supported op of the session) or scoped (the model\'s layers only), see benchmark_models.py --compare xla (Default none)')
+
+parser.add_argument('--quantizedGraph', action='store', default='',
+        help = 'Path of an 8-bit graph written by quantize_model.py, evaluated on the same clips as the model to report its accuracy and clips/s against float32. Both run on the CPU, cannot be combined with --cascadeModel (Default none)')
+
+parser.add_argument('--cascadeModel', action='store', default='',
+        help = 'Second, heavier model of a cascade (c3d, i3d, tsn, resnet): clips on which --model is not confident enough are classified again by it. Both models share the decoded videos (Default none)')
+
+parser.add_argument('--cascadeExpName', action='store', default='',
+        help = 'Experiment whose most recent checkpoint is loaded into the cascade model, empty string loads its default weights (Default none)')
+
+parser.add_argument('--cascadeInputDims', action='store', type=int, default=-1,
+        help = 'Input Dimensions of the cascade model, defaults to --inputDims')
+
+parser.add_argument('--cascadeSize', action='store', type=int, default=-1,
+        help = 'Input frame size of the cascade model, defaults to --size')
+
+parser.add_argument('--cascadeSeqLength', action='store', type=int, default=-1,
+        help = 'Number of output frames expected from the cascade model, defaults to --seqLength')
+
+parser.add_argument('--cascadePreprocMethod', action='store', default='default',
+        help = 'Preprocessing method of the cascade model (Default default)')
+
+parser.add_argument('--cascadeConfidence', action='store', default='max',
+        help = 'Confidence of --model on a clip: max (highest probability) or margin (difference of the two highest probabilities) (Default max)')
+
+parser.add_argument('--cascadeThreshold', action='store', type=float, default=0.9,
+        help = 'Confidence below which a clip is routed to the cascade model (Default 0.9)')
+
+parser.add_argument('--cascadeSweep', action='store', type=int, default=0,
+        help = 'Boolean indicating whether to run the cascade model on every clip to report the accuracy/throughput curve over thresholds (Default 0)')
+
 parser.add_argument('--verbose', action='store', type=int, default=1,
         help = 'Boolean switch to display all print statements or not')
 
@@ -154,6 +204,12 @@ if args.verbose:
 
 # END IF
 
+if args.quantizedGraph != '' and args.cascadeModel != '':
+    print "--quantizedGraph and --cascadeModel cannot be combined, evaluate the 8-bit graph and the cascade in separate runs"
+    exit()
+
+# END IF
+
 model_name = args.model
 
 model = models_import.create_model_object(modelName = model_name,
@@ -175,8 +231,32 @@ model = models_import.create_model_object(modelName = model_name,
                                    loadWeights = args.loadWeights,
                                    verbose = args.verbose)
 
+cascade_model = None
+
+if args.cascadeModel != '':
+    cascade_model = models_import.create_model_object(modelName = args.cascadeModel,
+                                       inputAlpha = args.inputAlpha,
+                                       modelAlpha = args.modelAlpha,
+                                       clipLength = args.clipLength,
+                                       numVids = args.numVids,
+                                       numEpochs = 1,
+                                       batchSize = args.batchSize,
+                                       numClips = args.numClips,
+                                       numGpus = 1,
+                                       train = args.train,
+                                       expName = args.cascadeExpName,
+                                       outputDims = args.outputDims,
+                                       inputDims = args.cascadeInputDims if args.cascadeInputDims > 0 else args.inputDims,
+                                       preprocMethod = args.cascadePreprocMethod,
+                                       dropoutRate = args.dropoutRate,
+                                       freeze = args.freeze,
+                                       loadWeights = args.loadWeights,
+                                       verbose = args.verbose)
 
-def test(model, input_dims, output_dims, seq_length, size, dataset, loaded_dataset, experiment_name, num_vids, split, base_data_path, f_name, load_model, return_layer, clip_length, video_offset, clip_offset, num_clips, clip_stride, metrics_method, batch_size, metrics_dir, loaded_checkpoint, verbose, gpu_list, preproc_method, random_init, avg_clips, use_softmax, preproc_debugging, topk):
+# END IF
+
+
+def test(model, input_dims, output_dims, seq_length, size, dataset, loaded_dataset, experiment_name, num_vids, split, base_data_path, f_name, load_model, return_layer, clip_length, video_offset, clip_offset, num_clips, clip_stride, metrics_method, batch_size, metrics_dir, loaded_checkpoint, verbose, gpu_list, preproc_method, random_init, avg_clips, use_softmax, preproc_debugging, topk, preproc_backend='tf', num_workers=0, clip_cache_dir='clip_cache', fold_batch_norm=0, data_format='channels_last', quantized_graph='', xla='none', cascade_model=None, cascade_exp_name='', cascade_input_dims=-1, cascade_size=None, cascade_seq_length=-1, cascade_preproc='default', cascade_confidence='max', cascade_threshold=0.9, cascade_sweep=0):
     """
     Function used to test the performance and analyse a chosen model
     Args:
@@ -210,11 +290,29 @@ def test(model, input_dims, output_dims, seq_length, size, dataset, loaded_datas
         :avg_clips:          Binary boolean indicating whether to average predictions across clips
         :use_softmax:        Binary boolean indicating whether to apply softmax to the inference of the model
         :preproc_debugging:  Boolean indicating whether to load videos and clips in a queue or to load them directly for debugging (Default 0)
+        :preproc_backend:    Preprocess clips with tensorflow ops (tf) or with NumPy in a pool of processes (numpy)
+        :num_workers:        Number of preprocessing processes used by the numpy backend, 0 uses one per cpu
+        :clip_cache_dir:     Directory caching preprocessed testing clips, '' disables the cache
+        :fold_batch_norm:    Boolean indicating whether to fold batch normalization layers into the preceding convolutions
+        :data_format:        Layout of the activations inside the model, channels_last or channels_first
+        :quantized_graph:    Path of an 8-bit graph written by quantize_model.py evaluated along with the model, both on the CPU, '' evaluates the model only
+        :xla:                XLA JIT compilation of the graph, none, global or scoped
+        :cascade_model:      Second, heavier tf-activity-recognition framework model object classifying the clips on which model is unsure, None runs model only
+        :cascade_exp_name:   Experiment whose most recent checkpoint is loaded into cascade_model, '' loads its default weights
+        :cascade_input_dims: Number of frames used in input by cascade_model
+        :cascade_size:       List detailing height and width of the frames of cascade_model
+        :cascade_seq_length: Length of output sequence expected from cascade_model, the predictions of the cascade are averaged over the sequence of each clip
+        :cascade_preproc:    The preprocessing method of cascade_model
+        :cascade_confidence: Confidence of model on a clip, max or margin (see utils/cascade_utils.py)
+        :cascade_threshold:  Confidence below which a clip is routed to cascade_model
+        :cascade_sweep:      Boolean indicating whether to run cascade_model on every clip to report the accuracy/throughput curve over thresholds
 
     Returns:
         Does not return anything
     """
 
+    set_xla(xla)
+
     with tf.name_scope("my_scope") as scope:
 
         # Initializers for checkpoint and global step variable
@@ -251,7 +349,7 @@ def test(model, input_dims, output_dims, seq_length, size, dataset, loaded_datas
         video_step       = tf.Variable(1.0, name='video_step', trainable=False)
 
 	    # TF session setup
-        config  = tf.ConfigProto(allow_soft_placement=True)
+        config  = session_config(allow_soft_placement=True)
         sess    = tf.Session(config=config)
         init    = tf.global_variables_initializer()
 
@@ -262,7 +360,15 @@ def test(model, input_dims, output_dims, seq_length, size, dataset, loaded_datas
 
         # Setting up tensors for models
         # input_data_tensor - [batchSize, inputDims, height, width, channels]
-        input_data_tensor, labels_tensor, names_tensor = load_dataset(model, 1, batch_size, output_dims, input_dims, seq_length, size, data_path, dataset, istraining, clip_length, video_offset, clip_offset, num_clips, clip_stride, video_step, preproc_debugging, 0, verbose)
+        if cascade_model is None:
+            input_data_tensor, labels_tensor, names_tensor = load_dataset(model, 1, batch_size, output_dims, input_dims, seq_length, size, data_path, dataset, istraining, clip_length, video_offset, clip_offset, num_clips, clip_stride, video_step, preproc_debugging, 0, verbose, preproc_backend, num_workers, clip_cache_dir)
+
+        else:
+            # Every video is decoded once, then preprocessed for each model of the cascade
+            input_tensors, labels_tensor, names_tensor = load_cascade_dataset([model, cascade_model], batch_size, output_dims, [input_dims, cascade_input_dims], seq_length, [size, cascade_size], data_path, dataset, clip_length, video_offset, clip_offset, num_clips, clip_stride, video_step, verbose)
+            input_data_tensor, cascade_input_tensor    = input_tensors
+
+        # END IF
 
         ######### GPU list check block ####################
 
@@ -277,15 +383,29 @@ def test(model, input_dims, output_dims, seq_length, size, dataset, loaded_datas
 
         ################################################## Setup TF graph block ######################################################
 
-        # Model Inference
-        with tf.device('/gpu:'+gpu_list[0]):
-            logits = model.inference(input_data_tensor[0:batch_size,:,:,:,:],
-                                     istraining,
-                                     input_dims,
-                                     output_dims,
-                                     seq_length,
-                                     scope,
-                                     return_layer = return_layer)[0]
+        # Batch normalizations are folded into the preceding convolutions by initialize_from_dict
+        set_fold_batch_norm(fold_batch_norm)
+
+        # Clips are loaded channels last, the model transposes them to data_format
+        set_data_format(data_format)
+
+        # Model Inference, on the CPU as the quantized graph when one is evaluated so that their clips/s compare
+        with tf.device('/cpu:0' if quantized_graph != '' else '/gpu:'+gpu_list[0]):
+            model_input = input_data_tensor[0:batch_size,:,:,:,:]
+
+            # XLA compiles the model for static shapes
+            check_static_shape(model_input, 'The input of the model')
+
+            with jit_scope():
+                logits = model.inference(model_input,
+                                         istraining,
+                                         input_dims,
+                                         output_dims,
+                                         seq_length,
+                                         scope,
+                                         return_layer = return_layer)[0]
+
+            # END WITH
 
             # Logits shape: [batchSize, seqLength, outputDims] if not, reshape
             logits_shape = logits.get_shape().as_list()
@@ -326,6 +446,45 @@ def test(model, input_dims, output_dims, seq_length, size, dataset, loaded_datas
         threads = queue_runner_impl.start_queue_runners(sess=sess, coord=coord)
         metrics = Metrics( output_dims, seq_length, curr_logger, metrics_method, istraining, model.name, experiment_name, preproc_method, dataset, metrics_dir, verbose=verbose, topk=topk)
 
+        # Quantized graph, fed the clips loaded for the model
+        quantized_model = None
+
+        if quantized_graph != '':
+            assert(return_layer[0] == 'logits')
+
+            quantized_model   = FrozenModel(quantized_graph, cpu=True)
+            quantized_output  = 'probabilities' if use_softmax else 'logits'
+
+            assert(quantized_model.input_shape()[0] == batch_size)
+
+            make_dir(os.path.join('results',model.name, dataset, preproc_method, experiment_name, metrics_dir+'_int8'))
+            quantized_metrics = Metrics( output_dims, seq_length, curr_logger, metrics_method, istraining, model.name, experiment_name, preproc_method, dataset, metrics_dir+'_int8', verbose=verbose, topk=topk)
+
+        # END IF
+
+        # Second model of the cascade, in a graph of its own, fed the clips loaded for it
+        cascade = None
+
+        if cascade_model is not None:
+            assert(return_layer[0] == 'logits' and use_softmax)
+
+            if cascade_exp_name != '':
+                cascade_ckpt = load_checkpoint(cascade_model.name, loaded_dataset, cascade_exp_name, -1, cascade_preproc)[0]
+
+            else:
+                cascade_ckpt = cascade_model.load_default_weights()
+
+            # END IF
+
+            cascade = CascadeModel(cascade_model, cascade_input_dims, output_dims, cascade_seq_length, cascade_size, batch_size, cascade_ckpt, gpu_list[0])
+
+            del cascade_ckpt
+
+            make_dir(os.path.join('results',model.name, dataset, preproc_method, experiment_name, metrics_dir+'_cascade'))
+            cascade_metrics = Metrics( output_dims, seq_length, curr_logger, metrics_method, istraining, model.name, experiment_name, preproc_method, dataset, metrics_dir+'_cascade', verbose=verbose, topk=topk)
+
+        # END IF
+
         # Variables get randomly initialized into tf graph
         sess.run(init)
 
@@ -333,6 +492,9 @@ def test(model, input_dims, output_dims, seq_length, size, dataset, loaded_datas
         if ((ckpt == None) or (random_init)):
             print "Caution: Model weights are not being loaded, using random initialization."
 
+            # Folded batch normalizations keep their default statistics
+            fold_batch_norms(sess)
+
         else:
             # Model variables initialized from previous saved models
             initialize_from_dict(sess, ckpt, model.name)
@@ -346,6 +508,12 @@ def test(model, input_dims, output_dims, seq_length, size, dataset, loaded_datas
         videos_loaded     = 0
         previous_vid_name = ''
         total_pred        = []
+        clips_run         = 0
+        float_time        = 0.0
+        quantized_time    = 0.0
+        cascade_time      = 0.0
+        routed_clips      = 0
+        cascade_records   = []
 
         if verbose:
             print "Begin Testing"
@@ -355,12 +523,84 @@ def test(model, input_dims, output_dims, seq_length, size, dataset, loaded_datas
         ########################################## Testing loop block ################################################################
 
         while videos_loaded <= num_vids:
-            output_predictions, labels, names = sess.run([logits, labels_tensor, names_tensor])
+            if cascade is not None:
+                # The second model only runs on batches holding a clip on which the first one is unsure, or on every batch to sweep the thresholds
+                clips, cascade_clips, labels, names = sess.run([model_input, cascade_input_tensor, labels_tensor, names_tensor])
+
+                start_time          = time.time()
+                output_predictions  = sess.run(logits, feed_dict={model_input: clips})
+                first_time          = time.time() - start_time
+                float_time         += first_time
+
+                clip_confidence = confidence(output_predictions, cascade_confidence)
+                routed          = clip_confidence < cascade_threshold
+                second_time     = 0.0
+
+                if cascade_sweep or routed.any():
+                    start_time          = time.time()
+                    second_predictions  = cascade.run(cascade_clips)
+                    second_time         = time.time() - start_time
+
+                # END IF
+
+                # Both models may have a different sequence length, the cascade predicts the average over the sequence of each clip
+                cascade_predictions = np.mean(output_predictions, 1, keepdims=True)
+
+                if routed.any():
+                    cascade_predictions = np.where(routed[:, None, None], np.mean(second_predictions, 1, keepdims=True), cascade_predictions)
+                    cascade_time       += first_time + second_time
+
+                else:
+                    cascade_time       += first_time
+
+                # END IF
+
+                routed_clips += routed.sum()
+                clips_run    += len(clips)
+
+                if cascade_sweep:
+                    record = {'first': output_predictions, 'second': second_predictions, 'confidence': clip_confidence, 'labels': labels[:,0],
+                              'names': names, 'first_time': first_time, 'second_time': second_time}
+
+                # END IF
+
+            elif quantized_model is None:
+                output_predictions, labels, names = sess.run([logits, labels_tensor, names_tensor])
+
+            else:
+                # Both models are timed on the same loaded clips, without the input pipeline
+                clips, labels, names = sess.run([model_input, labels_tensor, names_tensor])
+
+                start_time          = time.time()
+                output_predictions  = sess.run(logits, feed_dict={model_input: clips})
+                float_time         += time.time() - start_time
+
+                start_time             = time.time()
+                quantized_predictions  = quantized_model.run(clips, [quantized_output])[quantized_output]
+                quantized_time        += time.time() - start_time
+
+                quantized_predictions = np.reshape(quantized_predictions, output_predictions.shape)
+                clips_run            += len(clips)
+
+            # END IF
 
             if avg_clips:
                 output_predictions = np.array([np.mean(output_predictions, 0)])
+
+                if quantized_model is not None:
+                    quantized_predictions = np.array([np.mean(quantized_predictions, 0)])
+
+                # END IF
+
+                if cascade is not None:
+                    cascade_predictions = np.array([np.mean(cascade_predictions, 0)])
+
+                # END IF
+
                 names = names[:1]
 
+            logged_clips = len(clips) if cascade is not None else 0
+
             for batch_idx in range(len(names)):
                 vid_name = names[batch_idx]
                 if vid_name != previous_vid_name:
@@ -372,11 +612,28 @@ def test(model, input_dims, output_dims, seq_length, size, dataset, loaded_datas
 
                 # Extract remaining clips from currently loaded video, once it finishes exit while loop
                 if videos_loaded > num_vids:
+                    logged_clips = batch_idx if not avg_clips else 0
                     break
 
                 count += 1
                 metrics.log_prediction(labels[batch_idx][0], output_predictions[batch_idx], vid_name, count)
 
+                if quantized_model is not None:
+                    quantized_metrics.log_prediction(labels[batch_idx][0], quantized_predictions[batch_idx], vid_name, count)
+
+                # END IF
+
+                if cascade is not None:
+                    cascade_metrics.log_prediction(labels[batch_idx][0], cascade_predictions[batch_idx], vid_name, count)
+
+                # END IF
+
+            # END IF
+
+            # Only the clips of the videos logged are part of the curve
+            if cascade is not None and cascade_sweep and logged_clips > 0:
+                cascade_records.append(dict((key, value[:logged_clips] if key not in ['first_time', 'second_time'] else value) for key, value in record.items()))
+
             # END IF
 
         # END WHILE
@@ -398,40 +655,93 @@ def test(model, input_dims, output_dims, seq_length, size, dataset, loaded_datas
     # Save results in numpy format
     np.save(os.path.join('results', model.name, dataset, preproc_method, experiment_name, metrics_dir, 'test_predictions_'+dataset+"_"+metrics_method+'.npy'), np.array(total_pred))
 
+    if quantized_model is not None:
+        quantized_model.close()
+
+        quantized_accuracy = quantized_metrics.total_classification()
+
+        print "float32 : accuracy %.4f, %.2f clips/s" % (total_accuracy, clips_run / float_time)
+        print "int8    : accuracy %.4f, %.2f clips/s" % (quantized_accuracy, clips_run / quantized_time)
+        print "Accuracy delta (int8 - float32): %+.4f, speedup %.2fx" % (quantized_accuracy - total_accuracy, float_time / quantized_time)
+
+        np.save(os.path.join('results', model.name, dataset, preproc_method, experiment_name, metrics_dir+'_int8', 'test_predictions_'+dataset+"_"+metrics_method+'.npy'), np.array(quantized_metrics.get_predictions_array()))
+
+    # END IF
+
+    if cascade is not None:
+        cascade.close()
+
+        cascade_accuracy = cascade_metrics.total_classification()
+        cascade_dir      = os.path.join('results', model.name, dataset, preproc_method, experiment_name, metrics_dir+'_cascade')
+
+        print "%-8s : accuracy %.4f, %.2f clips/s" % (model.name, total_accuracy, clips_run / float_time)
+        print "cascade  : accuracy %.4f, %.2f clips/s, %.4f of the clips routed to %s (%s confidence < %.2f)" % (cascade_accuracy, clips_run / cascade_time,
+                                                                                                           routed_clips / float(clips_run), cascade_model.name, cascade_confidence, cascade_threshold)
+
+        np.save(os.path.join(cascade_dir, 'test_predictions_'+dataset+"_"+metrics_method+'.npy'), np.array(cascade_metrics.get_predictions_array()))
+
+        if cascade_sweep:
+            # Accuracies of the curve average the probabilities of the clips of each video, whatever metrics_method
+            curve = tradeoff_curve(cascade_records)
+
+            print_tradeoff_curve(curve)
+
+            np.save(os.path.join(cascade_dir, 'cascade_curve_'+cascade_confidence+'.npy'), curve)
+
+        # END IF
+
+    # END IF
+
 
 if __name__=="__main__":
     if not args.train:
-        test(   model             = model,
-                input_dims        = args.inputDims,
-                output_dims       = args.outputDims,
-                seq_length        = args.seqLength,
-                size              = [args.size, args.size],
-                dataset           = args.dataset,
-                loaded_dataset    = args.loadedDataset,
-                experiment_name   = args.expName,
-                num_vids          = args.numVids,
-                split             = args.split,
-                base_data_path    = args.baseDataPath,
-                f_name            = args.fName,
-                load_model        = args.load,
-                return_layer      = args.returnLayer,
-                clip_length       = args.clipLength,
-                video_offset      = args.videoOffset,
-                clip_offset       = args.clipOffset,
-                num_clips         = args.numClips,
-                clip_stride       = args.clipStride,
-                metrics_method    = args.metricsMethod,
-                batch_size        = args.batchSize,
-                metrics_dir       = args.metricsDir,
-                loaded_checkpoint = args.loadedCheckpoint,
-                verbose           = args.verbose,
-                gpu_list          = args.gpuList,
-                preproc_method    = args.preprocMethod,
-                random_init       = args.randomInit,
-                avg_clips         = args.avgClips,
-                use_softmax       = args.useSoftmax,
-                preproc_debugging = args.preprocDebugging,
-                topk              = args.topk)
+        test(   model              = model,
+                input_dims         = args.inputDims,
+                output_dims        = args.outputDims,
+                seq_length         = args.seqLength,
+                size               = [args.size, args.size],
+                dataset            = args.dataset,
+                loaded_dataset     = args.loadedDataset,
+                experiment_name    = args.expName,
+                num_vids           = args.numVids,
+                split              = args.split,
+                base_data_path     = args.baseDataPath,
+                f_name             = args.fName,
+                load_model         = args.load,
+                return_layer       = args.returnLayer,
+                clip_length        = args.clipLength,
+                video_offset       = args.videoOffset,
+                clip_offset        = args.clipOffset,
+                num_clips          = args.numClips,
+                clip_stride        = args.clipStride,
+                metrics_method     = args.metricsMethod,
+                batch_size         = args.batchSize,
+                metrics_dir        = args.metricsDir,
+                loaded_checkpoint  = args.loadedCheckpoint,
+                verbose            = args.verbose,
+                gpu_list           = args.gpuList,
+                preproc_method     = args.preprocMethod,
+                random_init        = args.randomInit,
+                avg_clips          = args.avgClips,
+                use_softmax        = args.useSoftmax,
+                preproc_debugging  = args.preprocDebugging,
+                topk               = args.topk,
+                preproc_backend    = args.preprocBackend,
+                num_workers        = args.numWorkers,
+                clip_cache_dir     = args.clipCacheDir,
+                fold_batch_norm    = args.foldBatchNorm,
+                data_format        = args.dataFormat,
+                quantized_graph    = args.quantizedGraph,
+                xla                = args.xla,
+                cascade_model      = cascade_model,
+                cascade_exp_name   = args.cascadeExpName,
+                cascade_input_dims = args.cascadeInputDims if args.cascadeInputDims > 0 else args.inputDims,
+                cascade_size       = [args.cascadeSize, args.cascadeSize] if args.cascadeSize > 0 else [args.size, args.size],
+                cascade_seq_length = args.cascadeSeqLength if args.cascadeSeqLength > 0 else args.seqLength,
+                cascade_preproc    = args.cascadePreprocMethod,
+                cascade_confidence = args.cascadeConfidence,
+                cascade_threshold  = args.cascadeThreshold,
+                cascade_sweep      = args.cascadeSweep)
 
     # END IF
 
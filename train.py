@@ -16,11 +16,13 @@ from tensorflow.python.training import queue_runner_impl
 
 # Custom imports
 from models                       import *
-from utils                        import initialize_from_dict, save_checkpoint, load_checkpoint, make_dir, Metrics
+from utils                        import initialize_from_dict, save_checkpoint, load_checkpoint, make_dir, Metrics, TRUNCATED_MODELS, RECOMPUTE_BOUNDARIES, set_stop_gradient, set_recompute, set_xla, session_config, jit_scope, check_static_shape
 from Queue                        import Queue
 from utils.logger                 import Logger
 from random                       import shuffle
 from utils.load_dataset_tfrecords import load_dataset
+from utils.feature_store          import FeatureStore, FeatureStoreWriter, feature_store_path
+from utils.recompute_utils        import recompute_gradients
 
 
 parser = argparse.ArgumentParser()
@@ -154,6 +156,24 @@ parser.add_argument('--shuffleSeed', action='store', type=int, default=0,
 parser.add_argument('--preprocDebugging', action='store', type=int, default=0,
         help = 'Boolean indicating whether to load videos and clips in a queue or to load them directly for debugging (Default 0)')
 
+parser.add_argument('--preprocBackend', action='store', default='tf',
+        help = 'Preprocess clips with tensorflow ops (tf) or with NumPy in a pool of processes (numpy)')
+
+parser.add_argument('--numWorkers', action='store', type=int, default=0,
+        help = 'Number of preprocessing processes used by the numpy backend, 0 uses one per cpu (Default 0)')
+
+parser.add_argument('--stopGradient', action='store', type=int, default=1,
+        help = 'Boolean indicating whether to stop backpropagation at the last frozen layer of the model, see benchmark_models.py --compare stop_gradient (Default 1)')
+
+parser.add_argument('--recompute', action='store', type=int, default=0,
+        help = 'Boolean indicating whether to keep only the outputs of the blocks of the model (e.g. I3D inception blocks) for backpropagation and recompute the other activations, see benchmark_models.py --compare recompute (Default 0)')
+
+parser.add_argument('--xla', action='store', default='none',
+        help = 'XLA JIT compilation: none, global (every supported op of the session) or scoped (the model\'s layers only), see benchmark_models.py --compare xla (Default none)')
+
+parser.add_argument('--featureCache', action='store', default='',
+        help = 'Directory of on-disk stores of the frozen trunk output, empty disables. The first run stores the output of the trunk for every training clip, the head of the model is then trained from the store only')
+
 parser.add_argument('--verbose', action='store', type=int, default=1,
         help = 'Boolean switch to display all print statements or not')
 
@@ -234,7 +254,106 @@ def _average_gradients(tower_grads):
     # END FOR
     return average_grads
 
-def train(model, input_dims, output_dims, seq_length, size, num_gpus, dataset, experiment_name, load_model, num_vids, n_epochs, split, base_data_path, f_name, learning_rate_init, wd, save_freq, clip_length, video_offset, clip_offset, num_clips, clip_stride, batch_size, loss_type, metrics_dir, loaded_checkpoint, verbose, opt_choice, gpu_list, grad_clip_value, preproc_method, random_init, shuffle_seed, preproc_debugging):
+def _extract_features(model, store_path, ckpt, input_dims, output_dims, seq_length, size, num_gpus, data_path, dataset, num_vids, clip_length, video_offset, clip_offset, num_clips, clip_stride, batch_size, gpu, random_init, shuffle_seed, preproc_debugging, verbose, preproc_backend, num_workers):
+    """
+    One-off pass over the training clips storing the output of the model's feature_layer for each of them, in a graph of its own
+    Args:
+        :model:       tf-activity-recognition framework model object
+        :store_path:  Directory of the feature store to write
+        :ckpt:        Dictionary of the weights to initialize the trunk with
+        :data_path:   Full path to the tfrecords of the split
+        :gpu:         GPU ID to run the trunk on
+        (remaining arguments as in train)
+
+    Returns:
+        Does not return anything
+    """
+    feature_layer = model.feature_layer()
+
+    with tf.Graph().as_default():
+        video_step = tf.Variable(1.0, name='video_step', trainable=False)
+        sess       = tf.Session(config=tf.ConfigProto(allow_soft_placement=True))
+
+        sess.run(tf.global_variables_initializer())
+
+        # Same clips, augmentation included, as those loaded by the training queue
+        input_data_tensor, labels_tensor, names_tensor = load_dataset(model, num_gpus, batch_size, output_dims, input_dims, seq_length, size, data_path, dataset, True, clip_length, video_offset, clip_offset, num_clips, clip_stride, video_step, preproc_debugging, shuffle_seed, verbose, preproc_backend, num_workers)
+
+        ############### TO DO: FIX THIS ASAP ########################
+        if ((batch_size == 1) and (num_clips==1)):
+            sess.run(tf.assign_add(video_step, -2))
+
+        else:
+            sess.run(tf.assign_add(video_step, -1))
+
+        # END IF
+        ############################################################
+
+        with tf.device('/gpu:'+gpu):
+            with tf.name_scope("my_scope") as scope:
+                # Built up to feature_layer only, in the training phase of the training graph
+                features_tensor = model.inference(input_data_tensor, True, input_dims, output_dims, seq_length, scope, return_layer=[feature_layer])[0]
+
+            # END WITH
+
+        # END WITH
+
+        coord   = tf.train.Coordinator()
+        threads = queue_runner_impl.start_queue_runners(sess=sess, coord=coord)
+
+        sess.run(tf.global_variables_initializer())
+
+        if ((ckpt is None) or (random_init)):
+            print "Caution: Model weights are not being loaded, stored features use random initialization."
+
+        else:
+            initialize_from_dict(sess, ckpt, model.name)
+
+        # END IF
+
+        writer            = FeatureStoreWriter(store_path, feature_layer)
+        previous_vid_name = ""
+        videos_loaded     = 0
+
+        # Clips of the last video may span several batches, extraction stops at the first clip of the video after it
+        while videos_loaded <= num_vids:
+            features, labels, vid_names = sess.run([features_tensor, labels_tensor, names_tensor])
+
+            # Rows of the layer output belonging to each clip (e.g. TSN segments or ResNet frames)
+            features = np.reshape(features, [len(vid_names), -1] + list(features.shape[1:]))
+
+            for clip_idx, name in enumerate(vid_names):
+                if name != previous_vid_name:
+                    videos_loaded += 1
+                    previous_vid_name = name
+
+                # END IF
+
+                if videos_loaded > num_vids:
+                    break
+
+                # END IF
+
+                writer.add(features[clip_idx], labels[clip_idx], name)
+
+            # END FOR
+
+            if verbose:
+                print "Stored features of %d/%d videos" % (min(videos_loaded, num_vids), num_vids)
+
+            # END IF
+
+        # END WHILE
+
+        writer.close()
+        coord.request_stop()
+        coord.join(threads)
+        sess.close()
+
+    # END WITH
+
+
+def train(model, input_dims, output_dims, seq_length, size, num_gpus, dataset, experiment_name, load_model, num_vids, n_epochs, split, base_data_path, f_name, learning_rate_init, wd, save_freq, clip_length, video_offset, clip_offset, num_clips, clip_stride, batch_size, loss_type, metrics_dir, loaded_checkpoint, verbose, opt_choice, gpu_list, grad_clip_value, preproc_method, random_init, shuffle_seed, preproc_debugging, preproc_backend='tf', num_workers=0, feature_cache='', stop_gradient=True, xla='none', recompute=False):
     """
     Training function used to train or fine-tune a chosen model
     Args:
@@ -273,11 +392,21 @@ def train(model, input_dims, output_dims, seq_length, size, num_gpus, dataset, e
         :preproc_method:     The preprocessing method to use, default, cvr, rr, sr, or any other custom preprocessing
         :random_init:        Randomly initialize model weights, not loading from any files (deafult False)
         :preproc_debugging:  Boolean indicating whether to load videos and clips in a queue or to load them directly for debugging (Default 0)
+        :preproc_backend:    Preprocess clips with tensorflow ops (tf) or with NumPy in a pool of processes (numpy)
+        :num_workers:        Number of preprocessing processes used by the numpy backend, 0 uses one per cpu
+        :feature_cache:      Directory of the stores of the trunk output the head of the model is trained from, empty to train on the clips
+        :stop_gradient:      Boolean indicating whether to stop backpropagation at the output of the model's freeze_boundary layer
+        :xla:                XLA JIT compilation of the graph, none, global or scoped
+        :recompute:          Boolean indicating whether to recompute the activations between the model's recompute_boundaries during backpropagation
 
     Returns:
         Does not return anything
     """
 
+    set_stop_gradient(stop_gradient)
+    set_xla(xla)
+    set_recompute(recompute)
+
     with tf.name_scope("my_scope") as scope:
 
         # Initializers for checkpoint and global step variable
@@ -315,7 +444,7 @@ def train(model, input_dims, output_dims, seq_length, size, num_gpus, dataset, e
         reuse_variables    = None
 
         # TF session setup
-        config  = tf.ConfigProto(allow_soft_placement=True)
+        config  = session_config(allow_soft_placement=True)
         sess    = tf.Session(config=config)
         init    = tf.global_variables_initializer()
 
@@ -328,19 +457,57 @@ def train(model, input_dims, output_dims, seq_length, size, num_gpus, dataset, e
 
         data_path = os.path.join(base_data_path, 'tfrecords_'+dataset, 'Split'+str(split), f_name)
 
-        # Setup tensors for models
-        # input_data_tensor - [batchSize, inputDims, height, width, channels]
-        input_data_tensor, labels_tensor, names_tensor = load_dataset(model, num_gpus, batch_size, output_dims, input_dims, seq_length, size, data_path, dataset, istraining, clip_length, video_offset, clip_offset, num_clips, clip_stride, video_step, preproc_debugging, shuffle_seed, verbose)
+        if feature_cache:
+            if model.feature_layer() is None:
+                print "Model " + model.name + " has no frozen trunk whose output can be stored, train without --featureCache"
+                exit()
 
-        ############### TO DO: FIX THIS ASAP ########################
-        if ((batch_size == 1) and (num_clips==1)):
-            sess.run(tf.assign_add(video_step, -2))
+            # END IF
+
+            # Stored features depend on the trunk weights and on the clips, remove the store when either changes
+            store_path = feature_store_path(feature_cache, [model.name, model.load_weights, model.freeze, load_model, loaded_checkpoint, random_init, experiment_name, model.feature_layer(),
+                                                            dataset, split, f_name, num_vids, input_dims, output_dims, seq_length, list(size), clip_length, video_offset, clip_offset,
+                                                            num_clips, clip_stride, preproc_method, float(model.input_alpha), shuffle_seed])
+
+            if not FeatureStore.exists(store_path):
+                if verbose:
+                    print "Storing the output of layer " + model.feature_layer() + " in " + store_path
+
+                # END IF
+
+                _extract_features(model, store_path, ckpt, input_dims, output_dims, seq_length, size, num_gpus, data_path, dataset, num_vids, clip_length, video_offset, clip_offset,
+                                  num_clips, clip_stride, batch_size, gpu_list[0] if len(gpu_list) > 0 else '0', random_init, shuffle_seed, preproc_debugging, verbose, preproc_backend, num_workers)
+
+            # END IF
+
+            store   = FeatureStore(store_path)
+            batches = store.batches(num_gpus*batch_size, shuffle_seed)
+
+            # Batches of the store are fed in place of the clip queue
+            # input_data_tensor - [batchSize, rows of each clip, ...], every clip holding several rows of the feature layer when its input is flattened (e.g. TSN segments)
+            input_data_tensor = tf.placeholder(tf.float32, [num_gpus*batch_size] + store.clip_shape, name='stored_features')
+            labels_tensor     = tf.placeholder(tf.int32, [num_gpus*batch_size] + store.label_shape, name='stored_labels')
+            names_tensor      = tf.placeholder(tf.string, [num_gpus*batch_size], name='stored_names')
 
         else:
-            sess.run(tf.assign_add(video_step, -1))
+            # Setup tensors for models
+            # input_data_tensor - [batchSize, inputDims, height, width, channels]
+            input_data_tensor, labels_tensor, names_tensor = load_dataset(model, num_gpus, batch_size, output_dims, input_dims, seq_length, size, data_path, dataset, istraining, clip_length, video_offset, clip_offset, num_clips, clip_stride, video_step, preproc_debugging, shuffle_seed, verbose, preproc_backend, num_workers)
+
+            ############### TO DO: FIX THIS ASAP ########################
+            if ((batch_size == 1) and (num_clips==1)):
+                sess.run(tf.assign_add(video_step, -2))
+
+            else:
+                sess.run(tf.assign_add(video_step, -1))
+
+            # END IF
+            ############################################################
 
         # END IF
-        ############################################################
+
+        # XLA compiles the model for static shapes
+        check_static_shape(input_data_tensor, 'The input of the model')
 
 
         learning_rate = tf.Variable(learning_rate_init, name='learning_rate', trainable=False)
@@ -379,14 +546,31 @@ def train(model, input_dims, output_dims, seq_length, size, num_gpus, dataset, e
             with tf.device('/gpu:'+str(gpu_list[gpu_idx])):
                 with tf.name_scope('%s_%d' % ('tower', int(gpu_list[gpu_idx]))) as scope:
                     with tf.variable_scope(tf.get_variable_scope(), reuse = reuse_variables):
-                        returned_layers = model.inference(input_data_tensor[gpu_idx*batch_size:gpu_idx*batch_size+batch_size,:,:,:,:],
-                                                 istraining,
-                                                 input_dims,
-                                                 output_dims,
-                                                 seq_length,
-                                                 scope,
-                                                 return_layer = ['logits'],
-                                                 weight_decay = wd)
+                        with jit_scope():
+                            if feature_cache:
+                                # Only the layers after the stored feature layer are built
+                                features        = tf.reshape(input_data_tensor[gpu_idx*batch_size:gpu_idx*batch_size+batch_size], [-1] + store.clip_shape[1:])
+                                returned_layers = [model.inference_head(features,
+                                                     istraining,
+                                                     input_dims,
+                                                     output_dims,
+                                                     seq_length,
+                                                     scope,
+                                                     weight_decay = wd)]
+
+                            else:
+                                returned_layers = model.inference(input_data_tensor[gpu_idx*batch_size:gpu_idx*batch_size+batch_size,:,:,:,:],
+                                                     istraining,
+                                                     input_dims,
+                                                     output_dims,
+                                                     seq_length,
+                                                     scope,
+                                                     return_layer = ['logits'],
+                                                     weight_decay = wd)
+
+                            # END IF
+
+                        # END WITH
 
                         logits          = tf.cast(returned_layers[0], tf.float32)
 
@@ -405,7 +589,14 @@ def train(model, input_dims, output_dims, seq_length, size, num_gpus, dataset, e
 
                     total_loss = model.loss(logits, labels_tensor[gpu_idx*batch_size:gpu_idx*batch_size+batch_size, :], loss_type)
                     opt        = optimizer(learning_rate)
-                    gradients  = opt.compute_gradients(total_loss, vars_.trainable_variables())
+
+                    if recompute:
+                        gradients = recompute_gradients(total_loss, vars_.trainable_variables(), tf.get_collection(RECOMPUTE_BOUNDARIES))
+
+                    else:
+                        gradients = opt.compute_gradients(total_loss, vars_.trainable_variables())
+
+                    # END IF
 
                     tower_losses.append(total_loss)
                     tower_grads.append(gradients)
@@ -461,11 +652,19 @@ def train(model, input_dims, output_dims, seq_length, size, num_gpus, dataset, e
             print "Caution: Model weights are not being loaded, using random initialization."
 
         else:
+            if feature_cache:
+                tf.add_to_collection(TRUNCATED_MODELS, 'above ' + model.feature_layer() + ', whose output is read from the feature store')
+
+            # END IF
+
             # Model variables initialized from previous saved models
             initialize_from_dict(sess, ckpt, model.name)
 
         # END IF
 
+        # Weights of the trunk, which is not part of the graph, are saved along with those of the head
+        base_dict = ckpt.tolist() if feature_cache and ckpt is not None and not random_init else None
+
         del ckpt
 
 
@@ -507,7 +706,7 @@ def train(model, input_dims, output_dims, seq_length, size, num_gpus, dataset, e
                     if verbose:
                         print "Saving..."
 
-                    save_checkpoint(sess, model.name, dataset, experiment_name, preproc_method, l_r, global_step.eval(session=sess))
+                    save_checkpoint(sess, model.name, dataset, experiment_name, preproc_method, l_r, global_step.eval(session=sess), base_dict)
 
                 # END IF
 
@@ -518,11 +717,19 @@ def train(model, input_dims, output_dims, seq_length, size, num_gpus, dataset, e
 
             time_pre_train = time.time()
 
+            feed_dict = {}
+
+            if feature_cache:
+                features, clip_labels, clip_names = next(batches)
+                feed_dict = {input_data_tensor: features, labels_tensor: clip_labels, names_tensor: clip_names}
+
+            # END IF
+
             ######################################### Running TF training session block ##################################  
             _, loss_train, predictions, gs, labels, vid_names, l_r, track_vars = sess.run([train_op, tower_losses,
                                                                        tower_slogits, global_step,
                                                                        labels_tensor, names_tensor,
-                                                                       learning_rate, model.get_track_variables()])
+                                                                       learning_rate, model.get_track_variables()], feed_dict=feed_dict)
 
             ################################################################################################################
 
@@ -636,7 +843,7 @@ def train(model, input_dims, output_dims, seq_length, size, num_gpus, dataset, e
 
         # END IF
 
-        save_checkpoint(sess, model.name, dataset, experiment_name, preproc_method, l_r, gs)
+        save_checkpoint(sess, model.name, dataset, experiment_name, preproc_method, l_r, gs, base_dict)
         coord.request_stop()
         coord.join(threads)
 
@@ -697,6 +904,12 @@ if __name__=="__main__":
                 preproc_method      = args.preprocMethod,
                 random_init         = args.randomInit,
                 shuffle_seed        = args.shuffleSeed,
-                preproc_debugging   = args.preprocDebugging)
+                preproc_debugging   = args.preprocDebugging,
+                preproc_backend     = args.preprocBackend,
+                num_workers         = args.numWorkers,
+                feature_cache       = args.featureCache,
+                stop_gradient       = args.stopGradient == 1,
+                xla                 = args.xla,
+                recompute           = args.recompute == 1)
 
     # END IF
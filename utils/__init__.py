@@ -2,4 +2,5 @@ from sys_utils           import *
 from layers_utils        import *
 from metrics_utils       import *
 from checkpoint_utils    import *
+from sampling_utils      import *
 from preprocessing_utils import *
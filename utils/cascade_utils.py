@@ -0,0 +1,160 @@
+"""
+CASCADED INFERENCE USED BY test.py --cascadeModel: A FAST MODEL CLASSIFIES EVERY CLIP, THE CLIPS IT IS UNSURE ABOUT (CONFIDENCE BELOW A THRESHOLD) ARE
+CLASSIFIED AGAIN BY A SECOND, HEAVIER MODEL. BOTH MODELS ARE FED FROM THE SAME DECODED VIDEOS (SEE load_cascade_dataset IN utils/load_dataset_tfrecords.py).
+THE SECOND MODEL IS BUILT IN A GRAPH OF ITS OWN, SO THAT THE VARIABLE NAMES OF BOTH MODELS CANNOT COLLIDE.
+"""
+
+import numpy      as np
+import tensorflow as tf
+
+from utils.checkpoint_utils import initialize_from_dict, fold_batch_norms
+from utils.sys_utils        import session_config
+
+
+# Confidence measures of the probabilities of the fast model, see confidence
+CONFIDENCE_METHODS = ['max', 'margin']
+
+# Thresholds of the accuracy/throughput curve
+CURVE_THRESHOLDS = np.linspace(0.0, 1.0, 21)
+
+
+class CascadeModel(object):
+    """
+    Second model of a cascade, in its own graph and session, taking the preprocessed clips loaded for it and returning softmax probabilities
+    """
+
+    def __init__(self, model, input_dims, output_dims, seq_length, size, batch_size, ckpt, gpu='0'):
+        """
+        Args:
+            :model:       tf-activity-recognition framework model object
+            :input_dims:  Number of frames used in input
+            :output_dims: Integer number of classes in current dataset
+            :seq_length:  Length of output sequence expected from LSTM
+            :size:        List detailing height and width of frame
+            :batch_size:  Number of clips of each input
+            :ckpt:        Dictionary of weights of the model, None keeps a random initialization
+            :gpu:         GPU ID to run the model on
+        """
+        self.graph = tf.Graph()
+
+        with self.graph.as_default():
+            self.input = tf.placeholder(tf.float32, [batch_size, model.preprocessed_input_dims(input_dims, False), size[0], size[1], 3], name='cascade_clips')
+
+            with tf.device('/gpu:'+gpu), tf.name_scope("my_scope") as scope:
+                logits = model.inference(self.input, False, input_dims, output_dims, seq_length, scope)[0]
+
+                self.output = tf.nn.softmax(tf.reshape(logits, [batch_size, seq_length, output_dims]))
+
+            # END WITH
+
+            self.sess = tf.Session(graph=self.graph, config=session_config(allow_soft_placement=True))
+            self.sess.run(tf.global_variables_initializer())
+
+            if ckpt is None:
+                print "Caution: Weights of the cascade model are not being loaded, using random initialization."
+
+                # Folded batch normalizations keep their default statistics
+                fold_batch_norms(self.sess)
+
+            else:
+                initialize_from_dict(self.sess, ckpt, model.name)
+
+            # END IF
+
+        # END WITH
+
+    def run(self, clips):
+        """
+        Args:
+            :clips: Array of batch_size preprocessed clips
+
+        Return:
+            Probabilities [batch_size, seq_length, output_dims]
+        """
+        return self.sess.run(self.output, feed_dict={self.input: clips})
+
+    def close(self):
+        self.sess.close()
+
+
+def confidence(probabilities, method='max'):
+    """
+    Args:
+        :probabilities: Softmax probabilities [clips, seq_length, output_dims]
+        :method:        'max' (highest probability) or 'margin' (difference of the two highest probabilities), of the probabilities averaged over seq_length
+
+    Return:
+        Confidence of each clip in [0, 1]
+    """
+    assert(method in CONFIDENCE_METHODS)
+
+    probabilities = np.sort(np.mean(probabilities, 1), -1)
+
+    if method == 'max':
+        return probabilities[:, -1]
+
+    # END IF
+
+    return probabilities[:, -1] - probabilities[:, -2]
+
+
+def tradeoff_curve(records, thresholds=CURVE_THRESHOLDS):
+    """
+    Accuracy and throughput of the cascade at every threshold, from batches on which both models were run. The second model runs on a batch as soon as one
+    of its clips is routed to it. Video accuracy is that of the probabilities averaged over the clips of each video
+    Args:
+        :records:    List of dictionaries, one per batch, with keys first and second (probabilities of each model), confidence, labels and names (of each clip),
+                     first_time and second_time (seconds taken by each model)
+        :thresholds: Thresholds of the confidence below which clips are routed to the second model
+
+    Return:
+        Array of rows [threshold, fraction of clips routed, video accuracy, clips/s]
+    """
+    num_clips = sum([len(record['names']) for record in records])
+    curve     = []
+
+    for threshold in thresholds:
+        videos       = {}
+        routed_clips = 0
+        total_time   = 0.0
+
+        for record in records:
+            routed        = record['confidence'] < threshold
+            total_time   += record['first_time'] + (record['second_time'] if routed.any() else 0.0)
+            routed_clips += routed.sum()
+
+            for idx, name in enumerate(record['names']):
+                prediction = np.mean((record['second'] if routed[idx] else record['first'])[idx], 0)
+
+                if name not in videos:
+                    videos[name] = [record['labels'][idx], np.zeros_like(prediction), 0]
+
+                # END IF
+
+                videos[name][1] += prediction
+                videos[name][2] += 1
+
+            # END FOR
+
+        # END FOR
+
+        accuracy = np.mean([np.argmax(total / count) == label for label, total, count in videos.values()])
+
+        curve.append([threshold, routed_clips / float(num_clips), accuracy, num_clips / total_time])
+
+    # END FOR
+
+    return np.array(curve)
+
+
+def print_tradeoff_curve(curve):
+    """
+    Args:
+        :curve: Array returned by tradeoff_curve
+    """
+    print "%10s %10s %10s %10s" % ('threshold', 'routed', 'accuracy', 'clips/s')
+
+    for threshold, routed, accuracy, clips_per_second in curve:
+        print "%10.2f %10.4f %10.4f %10.2f" % (threshold, routed, accuracy, clips_per_second)
+
+    # END FOR
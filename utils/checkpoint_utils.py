@@ -3,6 +3,12 @@ import os
 import numpy      as np
 import tensorflow as tf
 
+from utils.layers_utils import FOLDED_BATCH_NORMS, TRANSPOSED_KERNELS, TRUNCATED_MODELS
+
+# Names of the same variable in checkpoints and graphs of other tensorflow versions or implementations of a layer
+# (e.g. weights and biases of LSTMBlockFusedCell in older versions, kernel and bias of BasicLSTMCell)
+_VARIABLE_ALIASES = {'weights': 'kernel', 'kernel': 'weights', 'biases': 'bias', 'bias': 'biases'}
+
 def load_checkpoint(model, dataset, experiment_name, loaded_checkpoint, preproc_method):
     """
     Function to checkpoint file (both ckpt text file, numpy and dat file)
@@ -71,7 +77,7 @@ def load_checkpoint(model, dataset, experiment_name, loaded_checkpoint, preproc_
 
     # END TRY
 
-def save_checkpoint(sess, model, dataset, experiment_name, preproc_method, lr, gs):
+def save_checkpoint(sess, model, dataset, experiment_name, preproc_method, lr, gs, base_dict=None):
     """
     Function to save numpy checkpoint file
     Args:
@@ -82,6 +88,7 @@ def save_checkpoint(sess, model, dataset, experiment_name, preproc_method, lr, g
         :preproc_method:  The preprocessing method to use, default, cvr, rr, sr, or any other custom preprocessing
         :lr:              Learning rate
         :gs:              Current global step
+        :base_dict:       Dictionary of model parameter values saved along with the variables of the graph, for the layers the graph does not build
 
     Return:
        Does not return anything
@@ -97,15 +104,39 @@ def save_checkpoint(sess, model, dataset, experiment_name, preproc_method, lr, g
     data_file.write('lr:'+str(lr)+'\n')
     data_file.close()
 
+    np.save(os.path.join('results', model, dataset, preproc_method, experiment_name, 'checkpoints',filename+'.npy'), checkpoint_dict(sess, base_dict))
+
+
+def checkpoint_dict(sess, base_dict=None):
+    """
+    Function builds the dictionary of model parameters saved by save_checkpoint
+    Args:
+        :sess:      Tensorflow session instance
+        :base_dict: Dictionary of model parameter values saved along with the variables of the graph, for the layers the graph does not build
+
+    Return:
+        Dictionary containing model parameters, loaded by initialize_from_dict
+    """
     data_dict = {}
 
+    if base_dict is not None:
+        for name, value in _flatten(base_dict).items():
+            if not _in_graph(_graph_tensor_name(name + ':0')):
+                data_dict = _add_tensor(data_dict, (name + ':0').split('/'), value)
+
+            # END IF
+
+        # END FOR
+
+    # END IF
+
     for var in tf.global_variables():
         layers = var.name.split('/')
-        data_dict = _add_tensor(data_dict, layers, sess.run(var))
+        data_dict = _add_tensor(data_dict, layers, _to_checkpoint_layout(var.name, sess.run(var)))
 
     # END FOR
 
-    np.save(os.path.join('results', model, dataset, preproc_method, experiment_name, 'checkpoints',filename+'.npy'), data_dict)
+    return data_dict
 
 
 def _add_tensor(data_dict, keys_list, data):
@@ -161,17 +192,18 @@ def _assign_tensors(sess, curr_dict, tensor_name):
 
             # END IF
 
-            if 'weights' in tensor_name:
-                tensor_name = tensor_name.replace('weights', 'kernel')
-
-            # END IF
+            tensor_name = _graph_tensor_name(tensor_name)
 
-            sess.run(tf.assign(tf.get_default_graph().get_tensor_by_name(tensor_name), curr_dict))
+            sess.run(tf.assign(tf.get_default_graph().get_tensor_by_name(tensor_name), _to_graph_layout(tensor_name, curr_dict)))
 
         # END IF
 
     except:
-        if 'Momentum' not in tensor_name:
+        # Variables of folded batch normalizations do not exist in the graph, their values are used by fold_batch_norms.
+        # Neither do those of the layers a partially built model leaves out, tensors of the layers it built are still reported
+        left_out = len(tf.get_collection(TRUNCATED_MODELS)) > 0 and not _in_graph(tensor_name)
+
+        if 'Momentum' not in tensor_name and not _is_folded(tensor_name) and not left_out:
             print "Notice: Tensor " + tensor_name + " could not be assigned properly. The tensors' default initializer will be used if possible. Verify the shape and name of the tensor."
 
         #END IF
@@ -179,6 +211,179 @@ def _assign_tensors(sess, curr_dict, tensor_name):
     # END TRY
 
 
+def _to_graph_layout(tensor_name, value):
+    """
+    Function reorders the rows of a fully connected kernel stored in the channels last order of checkpoints when the graph flattens
+    a channels first input into it (see set_data_format in utils/layers_utils.py)
+    Args:
+        :tensor_name: Name of the variable being assigned
+        :value:       Value of the variable in the checkpoint
+
+    Return:
+        Value to assign to the variable
+    """
+    input_dims = dict(tf.get_collection(TRANSPOSED_KERNELS)).get(tensor_name)
+
+    if input_dims is None:
+        return value
+
+    # END IF
+
+    # Rows ordered [(depth,) height, width, channels] to [channels, (depth,) height, width]
+    rank  = len(input_dims)
+    value = np.reshape(value, input_dims + [-1])
+
+    return np.reshape(np.transpose(value, [rank-1] + range(rank-1) + [rank]), [np.prod(input_dims), -1])
+
+
+def _to_checkpoint_layout(tensor_name, value):
+    """
+    Function reverses _to_graph_layout, so that saved checkpoints are independent of the data format of the graph
+    Args:
+        :tensor_name: Name of the variable being saved
+        :value:       Value of the variable in the graph
+
+    Return:
+        Value to store in the checkpoint
+    """
+    input_dims = dict(tf.get_collection(TRANSPOSED_KERNELS)).get(tensor_name)
+
+    if input_dims is None:
+        return value
+
+    # END IF
+
+    # Rows ordered [channels, (depth,) height, width] to [(depth,) height, width, channels]
+    rank  = len(input_dims)
+    value = np.reshape(value, input_dims[-1:] + input_dims[:-1] + [-1])
+
+    return np.reshape(np.transpose(value, range(1, rank) + [0, rank]), [np.prod(input_dims), -1])
+
+
+def _in_graph(tensor_name):
+    """
+    Return: Boolean indicating whether the default graph holds a tensor named tensor_name
+    """
+    try:
+        tf.get_default_graph().get_tensor_by_name(tensor_name)
+
+    except (KeyError, ValueError):
+        return False
+
+    # END TRY
+
+    return True
+
+
+def _graph_tensor_name(tensor_name):
+    """
+    Function maps the name of a checkpoint value to the tensor of the default graph it is assigned to
+    Args:
+        :tensor_name: Name of the value in the checkpoint, with its ':0' suffix
+
+    Return:
+        tensor_name when the graph holds it, else the name with the alias of its variable (see _VARIABLE_ALIASES)
+    """
+    if _in_graph(tensor_name):
+        return tensor_name
+
+    # END IF
+
+    scope, _, leaf     = tensor_name.rpartition('/')
+    variable, _, index = leaf.partition(':')
+
+    if variable in _VARIABLE_ALIASES:
+        return (scope + '/' if scope else '') + _VARIABLE_ALIASES[variable] + ':' + index
+
+    # END IF
+
+    # Checkpoints of older versions of the framework name kernels weights anywhere in their scope
+    return tensor_name.replace('weights', 'kernel')
+
+
+def _is_folded(tensor_name):
+    """
+    Return: Boolean indicating whether tensor_name is a variable of a batch normalization folded into a convolution
+    """
+    return any([tensor_name.startswith(bn_scope + '/') for bn_scope, conv_scope, epsilon in tf.get_collection(FOLDED_BATCH_NORMS)])
+
+
+def _flatten(data_dict, prefix=''):
+    """
+    Function flattens a nested dictionary of model parameters, whose keys may themselves contain several levels of scopes
+    Args:
+        :data_dict: Dictionary containing model parameter values
+        :prefix:    Scope of data_dict
+
+    Return:
+        Dictionary mapping full parameter names, without the ':0' suffix, to their values
+    """
+    flat = {}
+
+    for key, value in data_dict.items():
+        name = prefix + '/' + key if prefix else key
+
+        if type(value) == type({}):
+            flat.update(_flatten(value, name))
+
+        else:
+            flat[name.split(':')[0]] = value
+
+        # END IF
+
+    # END FOR
+
+    return flat
+
+
+def fold_batch_norms(sess, data_dict=None):
+    """
+    Function folds every batch normalization of the graph registered as folded (see set_fold_batch_norm in utils/layers_utils.py) into its convolution:
+        kernel <- kernel * gamma / sqrt(moving_variance + epsilon)
+        bias   <- (bias - moving_mean) * gamma / sqrt(moving_variance + epsilon) + beta
+    Args:
+        :sess:      Tensorflow session instance, the convolutions' variables hold their unfolded values
+        :data_dict: Dictionary containing model parameter values, including those of the folded batch normalizations. Missing values are replaced by
+                    their defaults (identity statistics) with a notice, None folds the defaults of a randomly initialized model silently
+
+    Return:
+       Does not return anything
+    """
+    graph = tf.get_default_graph()
+    flat  = {} if data_dict is None else _flatten(data_dict)
+
+    for bn_scope, conv_scope, epsilon in tf.get_collection(FOLDED_BATCH_NORMS):
+        kernel_var = graph.get_tensor_by_name(conv_scope + '/kernel:0')
+        bias_var   = graph.get_tensor_by_name(conv_scope + '/bias:0')
+        kernel, bias = sess.run([kernel_var, bias_var])
+
+        params = {}
+
+        for name, default in [('gamma', 1.), ('beta', 0.), ('moving_mean', 0.), ('moving_variance', 1.)]:
+            value = flat.get(bn_scope + '/' + name)
+
+            if value is None:
+                # Only a randomly initialized model (no data_dict) is folded with the default values without notice
+                if data_dict is not None:
+                    print "Notice: " + bn_scope + '/' + name + " is missing from the saved weights, the batch normalization is folded with " + name + " = " + str(default)
+
+                # END IF
+
+                value = np.full(kernel.shape[-1], default, dtype=np.float32)
+
+            # END IF
+
+            params[name] = np.asarray(value)
+
+        # END FOR
+
+        scale = params['gamma'] / np.sqrt(params['moving_variance'] + epsilon)
+
+        sess.run([tf.assign(kernel_var, kernel * scale), tf.assign(bias_var, (bias - params['moving_mean']) * scale + params['beta'])])
+
+    # END FOR
+
+
 def initialize_from_dict(sess, data_dict, model_name):
     """
     Function initializes model parameters from value given in a dictionary
@@ -191,6 +396,11 @@ def initialize_from_dict(sess, data_dict, model_name):
     """
 
     print 'Initializing model weights...'
+
+    if len(tf.get_collection(TRUNCATED_MODELS)) > 0:
+        print "Notice: Model built " + tf.get_collection(TRUNCATED_MODELS)[0] + ", saved weights of the other layers are skipped"
+
+    # END IF
     try:
         data_dict = data_dict.tolist()
         for key in data_dict.keys():
@@ -198,6 +408,9 @@ def initialize_from_dict(sess, data_dict, model_name):
 
         # END FOR
 
+        # Batch normalizations folded into convolutions at graph build time
+        fold_batch_norms(sess, data_dict)
+
     except:
         print "Error: Failed to initialize saved weights. Ensure naming convention in saved weights matches the defined model."
         exit()
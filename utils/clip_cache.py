@@ -0,0 +1,314 @@
+"""
+ON-DISK CACHE OF PREPROCESSED TESTING CLIPS. DURING TESTING PREPROCESSING IS DETERMINISTIC FOR A GIVEN MODEL AND CLIP SPECIFICATION,
+SO THE CLIPS OF EVERY RECORD ARE STORED ONCE AS .npy FILES AND READ BACK MEMORY-MAPPED BY LATER RUNS INSTEAD OF BEING DECODED AND PREPROCESSED AGAIN.
+CLIPS WITH RANDOM STARTS OR A RANDOM PREPROCESSING METHOD ARE NOT CACHED, SEE deterministic_clips.
+
+Layout: <cache_dir>/<config hash>/<record key>.npy (clips [num_clips, clip_frames, height, width, channels]) and <record key>.json (label, name, alphas)
+"""
+
+import os
+import sys
+import json
+import glob
+import hashlib
+import threading
+
+import numpy      as np
+import tensorflow as tf
+from tensorflow.python.training import queue_runner
+
+# Increment when the format of the cached files changes
+_CACHE_VERSION = 1
+
+# Preprocessing methods drawing random values during testing (random resampling rates), whose clips differ on every run
+RANDOM_PREPROC_METHODS = ['rr']
+
+# Shared preprocessing code whose changes invalidate every cached clip, in addition to the model's own directory
+_SHARED_SOURCES = ['utils/load_dataset_tfrecords.py', 'utils/preprocessing_utils.py', 'utils/preprocessing_pipeline.py', 'utils/sampling_utils.py']
+
+
+def _source_files(model):
+    """
+    Return: Sorted list of python files implementing the preprocessing of model
+    """
+    model_file = sys.modules[model.__class__.__module__].__file__
+    model_dir  = os.path.dirname(os.path.abspath(model_file))
+    root_dir   = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    return sorted(glob.glob(os.path.join(model_dir, '*.py'))) + [os.path.join(root_dir, source) for source in _SHARED_SOURCES]
+
+
+def deterministic_clips(model, video_offset, clip_offset):
+    """
+    Args:
+        :model:        tf-activity-recognition framework model object
+        :video_offset: String indicating where to begin selecting video clips (provided clipOffset is None)
+        :clip_offset:  "none" or "random" indicating where to begin selecting video clips
+
+    Return:
+        Boolean indicating whether the testing clips are the same on every run, so that they can be cached: their starts are not drawn
+        at random and the preprocessing method of model is not random
+    """
+    return video_offset != 'random' and clip_offset != 'random' and model.preproc_method not in RANDOM_PREPROC_METHODS
+
+
+def preprocessing_config_hash(model, input_dims, output_dims, seq_length, size, dataset, clip_length, video_offset, clip_offset, num_clips, clip_stride):
+    """
+    Hash of everything the testing preprocessing output depends on, other than the record itself
+    Args:
+        (arguments as in load_dataset)
+
+    Return:
+        Hexadecimal sha1 digest
+    """
+    config = [_CACHE_VERSION, model.name, model.preproc_method, float(model.input_alpha), model.input_channel_order(),
+              input_dims, output_dims, seq_length, list(size), dataset, clip_length, video_offset, clip_offset, num_clips, clip_stride]
+
+    digest = hashlib.sha1(json.dumps(config))
+
+    for source in _source_files(model):
+        if os.path.isfile(source):
+            with open(source, 'rb') as f:
+                digest.update(f.read())
+
+            # END WITH
+
+        # END IF
+
+    # END FOR
+
+    return digest.hexdigest()
+
+
+def record_key(filename):
+    """
+    Key of a tfrecords file, changes when the file is moved, rewritten or resized
+    Args:
+        :filename: Full path of the tfrecords file
+
+    Return:
+        Hexadecimal sha1 digest
+    """
+    stat = os.stat(filename)
+
+    return hashlib.sha1(json.dumps([os.path.abspath(filename), stat.st_size, int(stat.st_mtime)])).hexdigest()
+
+
+class ClipCache(object):
+    """
+    Preprocessed clips of every record of a dataset split for one preprocessing configuration
+    """
+
+    def __init__(self, cache_dir, config_hash):
+        """
+        Args:
+            :cache_dir:   Root directory of the cache, shared by every configuration
+            :config_hash: Result of preprocessing_config_hash
+        """
+        self.path = os.path.join(cache_dir, config_hash)
+
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+        # END IF
+
+    def _paths(self, filename):
+        key = os.path.join(self.path, record_key(filename))
+
+        return key + '.npy', key + '.json'
+
+    def contains(self, filename):
+        """ Return: Boolean indicating whether the clips of filename are cached """
+        clips_path, meta_path = self._paths(filename)
+
+        return os.path.isfile(clips_path) and os.path.isfile(meta_path)
+
+    def write(self, filename, clips, label, name, alphas):
+        """
+        Store the preprocessed clips of a record, files are renamed into place so that an interrupted write is never read back
+        Args:
+            :filename: Full path of the tfrecords file
+            :clips:    Float32 array [num_clips, clip_frames, height, width, channels]
+            :label:    Integer label of the video
+            :name:     Name of the video
+            :alphas:   Resampling factor of each clip
+        """
+        clips_path, meta_path = self._paths(filename)
+
+        with open(clips_path + '.tmp', 'wb') as f:
+            np.save(f, np.ascontiguousarray(clips, dtype=np.float32))
+
+        # END WITH
+
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump({'record': os.path.abspath(filename), 'label': int(label), 'name': name, 'alphas': [float(alpha) for alpha in alphas]}, f)
+
+        # END WITH
+
+        os.rename(clips_path + '.tmp', clips_path)
+        os.rename(meta_path + '.tmp', meta_path)
+
+    def read(self, filename):
+        """
+        Return: Memory-mapped clips, label, name and alphas of a cached record
+        """
+        clips_path, meta_path = self._paths(filename)
+
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+
+        # END WITH
+
+        return np.load(clips_path, mmap_mode='r'), meta['label'], str(meta['name']), meta['alphas']
+
+
+class ClipCacheRunner(queue_runner.QueueRunner):
+    """
+    Queue runner whose thread enqueues the cached clips of each record, in order, indefinitely
+    """
+
+    def __init__(self, queue, placeholders, enqueue_op, filenames, cache, seq_length, video_step):
+        """
+        Args:
+            :queue:        Clip queue shared with the rest of the graph
+            :placeholders: Placeholders of enqueue_op (clips, labels, names, video steps, alphas)
+            :enqueue_op:   enqueue_many op of queue fed from placeholders
+            :filenames:    List of tfrecords files, all of them cached
+            :cache:        ClipCache containing the preprocessed clips
+            :seq_length:   Length of output sequence expected from LSTM
+            :video_step:   Tensorflow variable providing the initial number of loaded videos
+        """
+        super(ClipCacheRunner, self).__init__(queue, [enqueue_op])
+
+        self._placeholders = placeholders
+        self._enqueue_op   = enqueue_op
+        self._filenames    = list(filenames)
+        self._cache        = cache
+        self._seq_length   = seq_length
+        self._video_step   = video_step
+
+    def create_threads(self, sess, coord=None, daemon=False, start=False):
+        """
+        Create the feeding thread and, if a coordinator is given, a thread cancelling pending enqueues on stop
+        """
+        threads = [threading.Thread(target=self._feed, args=(sess, coord))]
+
+        if coord:
+            threads.append(threading.Thread(target=self._stop_on_request, args=(sess, coord)))
+
+        # END IF
+
+        for thread in threads:
+            if coord:
+                coord.register_thread(thread)
+
+            # END IF
+
+            if daemon:
+                thread.daemon = True
+
+            # END IF
+
+            if start:
+                thread.start()
+
+            # END IF
+
+        # END FOR
+
+        return threads
+
+    def _feed(self, sess, coord):
+        clips_ph, labels_ph, names_ph, video_step_ph, alpha_ph = self._placeholders
+
+        step = float(sess.run(self._video_step))
+
+        try:
+            while not (coord and coord.should_stop()):
+                for filename in self._filenames:
+                    if coord and coord.should_stop():
+                        return
+
+                    # END IF
+
+                    clips, label, name, alphas = self._cache.read(filename)
+
+                    step     += 1
+                    num_clips = clips.shape[0]
+
+                    sess.run(self._enqueue_op, feed_dict={clips_ph:      clips,
+                                                          labels_ph:     np.tile(label, [num_clips, self._seq_length]),
+                                                          names_ph:      [name]*num_clips,
+                                                          video_step_ph: [step]*num_clips,
+                                                          alpha_ph:      alphas})
+
+                # END FOR
+
+            # END WHILE
+
+        except (tf.errors.CancelledError, tf.errors.OutOfRangeError):
+            pass
+
+        except Exception as e:
+            if coord:
+                coord.request_stop(e)
+
+            else:
+                raise
+
+            # END IF
+
+        # END TRY
+
+    def _stop_on_request(self, sess, coord):
+        """
+        Unblock the feeding thread once the coordinator requests a stop
+        """
+        coord.wait_for_stop()
+
+        try:
+            sess.run(self.cancel_op)
+
+        except Exception:
+            pass
+
+        # END TRY
+
+
+def load_dataset_cached(model, num_gpus, batch_size, input_dims, seq_length, size, filenames, cache, video_step):
+    """
+    Setup the clip queue fed from a clip cache containing every one of filenames
+    Args:
+        :model:      tf-activity-recognition framework model object
+        :num_gpus:   Number of gpus to use
+        :batch_size: Number of clips to load into the model each step.
+        :input_dims: Number of frames used in input
+        :seq_length: Length of output sequence expected from LSTM
+        :size:       List detailing height and width of frame
+        :filenames:  List of tfrecords files, in the order they are loaded
+        :cache:      ClipCache containing the preprocessed clips of filenames
+        :video_step: Tensorflow variable indicating the total number of videos (not clips) that have been loaded
+
+    Return:
+        Input data tensor, label tensor, name of loaded data (video/image) and alpha tensor
+    """
+    # Number of frames actually produced by the model's preprocessing during testing
+    clip_dims = model.preprocessed_input_dims(input_dims, False)
+
+    # Same queue layout as load_dataset: [[clip_frame_count, height, width, channels], [labels_copied_seqLength], [name_of_video], [video_step], [alpha]]
+    clip_q = tf.FIFOQueue(num_gpus*batch_size, dtypes=[tf.float32, tf.int32, tf.string, tf.float32, tf.float32], shapes=[[clip_dims, size[0], size[1], 3],[seq_length],[],[],[]])
+
+    placeholders = [tf.placeholder(tf.float32, [None, clip_dims, size[0], size[1], 3]),
+                    tf.placeholder(tf.int32, [None, seq_length]),
+                    tf.placeholder(tf.string, [None]),
+                    tf.placeholder(tf.float32, [None]),
+                    tf.placeholder(tf.float32, [None])]
+
+    enqueue_op = clip_q.enqueue_many(placeholders)
+
+    # Started with the other queue runners in test.py after the Session is begun
+    queue_runner.add_queue_runner(ClipCacheRunner(clip_q, placeholders, enqueue_op, filenames, cache, seq_length, video_step))
+
+    input_data_tensor, labels_tensor, names_tensor, video_step_tensor, alpha_tensor = clip_q.dequeue_many(num_gpus*batch_size)
+
+    return input_data_tensor, labels_tensor, names_tensor, alpha_tensor
@@ -0,0 +1,142 @@
+"""
+BUILDING AND FREEZING OF THE INFERENCE GRAPHS WRITTEN BY export_model.py AND quantize_model.py, READ BACK BY utils/frozen_model.py
+"""
+
+import os
+
+import tensorflow as tf
+
+from utils.layers_utils           import set_fold_batch_norm
+from utils.load_dataset_tfrecords import _preprocess_clips
+from utils.frozen_model           import INPUT_NAME, OUTPUT_SCOPE
+
+
+# Transforms of the Graph Transform Tool applied to the frozen graph
+GRAPH_TRANSFORMS = ['strip_unused_nodes', 'remove_nodes(op=Identity, op=CheckNumerics, op=StopGradient)', 'fold_constants(ignore_errors=true)',
+                    'fold_batch_norms', 'fold_old_batch_norms', 'sort_by_execution_order']
+
+
+def build_inference_graph(model, input_dims, output_dims, seq_length, size, return_layer, num_clips, clip_length, frame_height, frame_width, embed_preprocessing=True):
+    """
+    Build the preprocessing and inference of a model on uint8 clips (or on preprocessed clips), in testing phase and with batch normalizations folded into convolutions
+    Args:
+        :model:               tf-activity-recognition framework model object
+        :input_dims:          Number of frames used in input
+        :output_dims:         Integer number of classes in current dataset
+        :seq_length:          Length of output sequence expected from LSTM
+        :size:                List detailing height and width of frame
+        :return_layer:        List of layers exported as outputs
+        :num_clips:           Number of clips of the input
+        :clip_length:         Number of frames of each input clip
+        :frame_height:        Height of the input frames
+        :frame_width:         Width of the input frames
+        :embed_preprocessing: Boolean, False takes float32 clips already preprocessed (as loaded by load_dataset) instead of uint8 frames,
+                              clip_length, frame_height and frame_width are then unused
+
+    Returns:
+        Input placeholder and list of output names
+    """
+    set_fold_batch_norm(True)
+
+    if embed_preprocessing:
+        # Frames as stored in the tfrecords: uint8, BGR
+        clips = tf.placeholder(tf.uint8, [num_clips, clip_length, frame_height, frame_width, 3], name=INPUT_NAME)
+
+        if model.input_channel_order() == 'RGB':
+            model_clips = clips[...,::-1]
+
+        else:
+            model_clips = clips
+
+        # END IF
+
+        # No queue and no label, the testing preprocessing is applied to every clip
+        inputs = _preprocess_clips(model, tf.to_int32(model_clips), frame_height, frame_width, 3, input_dims, output_dims, seq_length, size,
+                                   tf.constant(0, tf.int32), False, tf.constant(1.0))[0]
+        inputs.set_shape([num_clips, model.preprocessed_input_dims(input_dims, False), size[0], size[1], 3])
+
+    else:
+        clips  = tf.placeholder(tf.float32, [num_clips, model.preprocessed_input_dims(input_dims, False), size[0], size[1], 3], name=INPUT_NAME)
+        inputs = clips
+
+    # END IF
+
+    with tf.name_scope("my_scope") as scope:
+        # Dropout layers are identities in the testing phase
+        layers = model.inference(inputs, False, input_dims, output_dims, seq_length, scope, return_layer=return_layer)
+
+    # END WITH
+
+    with tf.name_scope(OUTPUT_SCOPE):
+        output_names = []
+
+        for name, layer in zip(return_layer, layers):
+            output_names.append(tf.identity(layer, name=name).op.name)
+
+        # END FOR
+
+        if 'logits' in return_layer:
+            output_names.append(tf.nn.softmax(layers[return_layer.index('logits')], name='probabilities').op.name)
+
+        # END IF
+
+    # END WITH
+
+    return clips, output_names
+
+
+def freeze_graph(sess, output_names, verbose=True):
+    """
+    Turn the variables of the graph into constants and simplify the result
+    Args:
+        :sess:         Tensorflow session holding the values of the variables
+        :output_names: List of names of the output ops
+        :verbose:      Boolean to indicate if all print statement should be procesed or not
+
+    Returns:
+        Frozen GraphDef
+    """
+    graph_def = tf.graph_util.convert_variables_to_constants(sess, sess.graph.as_graph_def(), output_names)
+
+    # Stripping of training only nodes, constant and batch normalization folding need the Graph Transform Tool (tensorflow >= 1.3),
+    # which keeps the identities naming the outputs
+    try:
+        from tensorflow.tools.graph_transforms import TransformGraph
+
+    except ImportError:
+        print "Notice: tensorflow.tools.graph_transforms is not available, the frozen graph is not simplified"
+        return graph_def
+
+    # END TRY
+
+    transformed = TransformGraph(graph_def, [INPUT_NAME], output_names, GRAPH_TRANSFORMS)
+
+    if verbose:
+        print "Graph simplified from %d to %d nodes" % (len(graph_def.node), len(transformed.node))
+
+    # END IF
+
+    return transformed
+
+
+def write_graph(graph_def, path, verbose=True):
+    """
+    Args:
+        :graph_def: GraphDef to write
+        :path:      Path of the .pb file, its directory is created if needed
+        :verbose:   Boolean to indicate if all print statement should be procesed or not
+    """
+    if os.path.dirname(path) != '' and not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+
+    # END IF
+
+    with open(path, 'wb') as f:
+        f.write(graph_def.SerializeToString())
+
+    # END WITH
+
+    if verbose:
+        print "Frozen graph written to " + path
+
+    # END IF
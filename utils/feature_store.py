@@ -0,0 +1,371 @@
+"""
+CHUNKED ON-DISK STORE OF THE OUTPUT OF ONE LAYER (E.G. THE FROZEN TRUNK OF A MODEL) FOR EVERY CLIP OF A DATASET SPLIT. WRITTEN ONCE BY A PASS OVER THE CLIPS,
+THEN READ BACK MEMORY-MAPPED IN SHUFFLED BATCHES TO TRAIN THE LAYERS ON TOP OF IT WITHOUT DECODING, PREPROCESSING OR RUNNING THE TRUNK AGAIN.
+
+Layout: <store dir>/index.json (layer, clip feature and label shapes, number of clips per chunk, chunk files, video names),
+        <store dir>/chunk_<n>.npy (features [clips, ...]) and <store dir>/chunk_<n>_labels.npy (labels [clips, seq_length])
+
+LAYER FEATURES OF SEVERAL LAYERS, WRITTEN BY extract_features.py IN ONE PASS OVER THE CLIPS, ARE KEPT IN A SINGLE HDF5 FILE FOR SVM, KNN OR ANALYSIS JOBS.
+Layout: layers/<layer> (chunked and compressed features [clips, ...], one dataset per layer), and the index of the clips: names (video name),
+        labels (video label), videos (index of the video in the order of loading) and clips (index of the clip in its video), config attribute (JSON)
+"""
+
+import os
+import json
+import shutil
+import hashlib
+
+import h5py
+import numpy as np
+
+
+# Largest size in bytes of the HDF5 chunks of layer features, clips larger than it get a chunk each
+MAX_CHUNK_BYTES = 2**20
+
+
+def feature_store_path(root_dir, config):
+    """
+    Directory of the store for a given configuration
+    Args:
+        :root_dir: Root directory shared by every store
+        :config:   JSON serializable list of everything the stored features depend on
+
+    Return:
+        Full path of the store directory
+    """
+    return os.path.join(root_dir, hashlib.sha1(json.dumps(config)).hexdigest())
+
+
+class FeatureStoreWriter(object):
+    """
+    Writes the features of consecutive clips into chunks, the store only appears at its final path once close() succeeds
+    """
+
+    def __init__(self, path, layer, chunk_size=1024):
+        """
+        Args:
+            :path:       Directory of the store
+            :layer:      Name of the layer whose output is stored
+            :chunk_size: Number of clips in each chunk file
+        """
+        self.path       = path
+        self.tmp_path   = path + '.tmp'
+        self.layer      = layer
+        self.chunk_size = chunk_size
+
+        self._features    = []
+        self._labels      = []
+        self._names       = []
+        self._chunks      = []
+        self._clip_shape  = None
+        self._label_shape = None
+
+        if os.path.isdir(self.tmp_path):
+            shutil.rmtree(self.tmp_path)
+
+        # END IF
+
+        os.makedirs(self.tmp_path)
+
+    def add(self, features, labels, name):
+        """
+        Append one clip to the store
+        Args:
+            :features: Output of the layer for the clip
+            :labels:   Labels of the clip [seq_length]
+            :name:     Name of the video the clip belongs to
+        """
+        if self._clip_shape is None:
+            self._clip_shape  = list(features.shape)
+            self._label_shape = list(np.shape(labels))
+
+        # END IF
+
+        self._features.append(np.asarray(features, dtype=np.float32))
+        self._labels.append(np.asarray(labels, dtype=np.int32))
+        self._names.append(name)
+
+        if len(self._features) - len(self._chunks) * self.chunk_size == self.chunk_size:
+            self._write_chunk()
+
+        # END IF
+
+    def _write_chunk(self):
+        start = len(self._chunks) * self.chunk_size
+        chunk = 'chunk_%05d' % len(self._chunks)
+
+        np.save(os.path.join(self.tmp_path, chunk + '.npy'), np.stack(self._features[start:]))
+        np.save(os.path.join(self.tmp_path, chunk + '_labels.npy'), np.stack(self._labels[start:]))
+
+        # Written features are not kept in memory
+        self._features[start:] = [None] * (len(self._features) - start)
+        self._chunks.append(chunk)
+
+    def close(self):
+        """
+        Write the last chunk and the index, then move the store to its final path
+        """
+        if len(self._features) > len(self._chunks) * self.chunk_size:
+            self._write_chunk()
+
+        # END IF
+
+        with open(os.path.join(self.tmp_path, 'index.json'), 'w') as f:
+            json.dump({'layer': self.layer, 'clip_shape': self._clip_shape, 'label_shape': self._label_shape, 'chunk_size': self.chunk_size, 'chunks': self._chunks, 'names': self._names}, f)
+
+        # END WITH
+
+        if os.path.isdir(self.path):
+            shutil.rmtree(self.path)
+
+        # END IF
+
+        os.rename(self.tmp_path, self.path)
+
+
+class FeatureStore(object):
+    """
+    Read access to a complete store written by FeatureStoreWriter
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            :path: Directory of the store
+        """
+        with open(os.path.join(path, 'index.json'), 'r') as f:
+            index = json.load(f)
+
+        # END WITH
+
+        self.path        = path
+        self.layer       = index['layer']
+        self.clip_shape  = index['clip_shape']
+        self.label_shape = index['label_shape']
+        self.names       = [str(name) for name in index['names']]
+
+        self._chunk_size = index['chunk_size']
+        self._features   = [np.load(os.path.join(path, chunk + '.npy'), mmap_mode='r') for chunk in index['chunks']]
+        self._labels     = [np.load(os.path.join(path, chunk + '_labels.npy')) for chunk in index['chunks']]
+
+    @staticmethod
+    def exists(path):
+        """ Return: Boolean indicating whether a complete store exists at path """
+        return os.path.isfile(os.path.join(path, 'index.json'))
+
+    def __len__(self):
+        return len(self.names)
+
+    def read(self, clip_indices):
+        """
+        Return: Features, labels and video names of the given clips
+        """
+        features = np.stack([self._features[idx // self._chunk_size][idx % self._chunk_size] for idx in clip_indices])
+        labels   = np.stack([self._labels[idx // self._chunk_size][idx % self._chunk_size] for idx in clip_indices])
+
+        return features, labels, [self.names[idx] for idx in clip_indices]
+
+    def batches(self, batch_size, shuffle_seed=0):
+        """
+        Endless generator of batches of clips. Videos are shuffled every epoch, the clips of a video stay consecutive so that videos are
+        counted the same way as with the clip queue of load_dataset.
+        Args:
+            :batch_size:   Number of clips in each batch
+            :shuffle_seed: Seed of the shuffling of videos
+
+        Return:
+            Generator of (features, labels, names) tuples
+        """
+        # Clip indices of each video, in order of appearance
+        videos = []
+
+        for idx, name in enumerate(self.names):
+            if idx == 0 or name != self.names[idx-1]:
+                videos.append([])
+
+            # END IF
+
+            videos[-1].append(idx)
+
+        # END FOR
+
+        rng     = np.random.RandomState(shuffle_seed)
+        pending = []
+
+        while True:
+            for video_idx in rng.permutation(len(videos)):
+                pending.extend(videos[video_idx])
+
+                while len(pending) >= batch_size:
+                    yield self.read(pending[:batch_size])
+                    pending = pending[batch_size:]
+
+                # END WHILE
+
+            # END FOR
+
+        # END WHILE
+
+
+class LayerFeatureWriter(object):
+    """
+    Writes the outputs of several layers for consecutive clips into an HDF5 file, the file only appears at its final path once close() succeeds
+    """
+
+    def __init__(self, path, layers, config, chunk_size=64, compression='gzip'):
+        """
+        Args:
+            :path:        Path of the HDF5 file
+            :layers:      List of names of the layers whose outputs are stored
+            :config:      JSON serializable description of the extraction, stored as the config attribute
+            :chunk_size:  Number of clips written at a time, and largest number of clips in each HDF5 chunk (see MAX_CHUNK_BYTES)
+            :compression: HDF5 compression filter of the layer datasets, gzip, lzf or none
+        """
+        self.path        = path
+        self.tmp_path    = path + '.tmp'
+        self.layers      = layers
+        self.chunk_size  = chunk_size
+        self.compression = None if compression == 'none' else compression
+
+        self._features = dict((layer, []) for layer in layers)
+        self._names    = []
+        self._labels   = []
+        self._videos   = []
+        self._clips    = []
+        self._rows     = 0
+
+        self._file = h5py.File(self.tmp_path, 'w')
+        self._file.attrs['config'] = json.dumps(config)
+        self._file.create_group('layers')
+
+    def add(self, features, label, name):
+        """
+        Append one clip to the store
+        Args:
+            :features: Dictionary of the output of each layer for the clip
+            :label:    Label of the video the clip belongs to
+            :name:     Name of the video the clip belongs to
+        """
+        if len(self._names) > 0 and name == self._names[-1]:
+            self._videos.append(self._videos[-1])
+            self._clips.append(self._clips[-1] + 1)
+
+        else:
+            self._videos.append(self._videos[-1] + 1 if len(self._videos) > 0 else 0)
+            self._clips.append(0)
+
+        # END IF
+
+        for layer in self.layers:
+            self._features[layer].append(np.asarray(features[layer], dtype=np.float32))
+
+        # END FOR
+
+        self._names.append(name)
+        self._labels.append(label)
+
+        if len(self._features[self.layers[0]]) == self.chunk_size:
+            self._write_rows()
+
+        # END IF
+
+    def _write_rows(self):
+        rows = len(self._features[self.layers[0]])
+
+        for layer in self.layers:
+            features = np.stack(self._features[layer])
+
+            if layer not in self._file['layers']:
+                # Rows are appended along the first axis, each chunk holds whole clips
+                chunk_rows = max(1, min(self.chunk_size, MAX_CHUNK_BYTES // features[0].nbytes))
+
+                self._file['layers'].create_dataset(layer, shape=(0,) + features.shape[1:], maxshape=(None,) + features.shape[1:], dtype=np.float32,
+                                                    chunks=(chunk_rows,) + features.shape[1:], compression=self.compression,
+                                                    shuffle=self.compression is not None)
+
+            # END IF
+
+            dataset = self._file['layers'][layer]
+            dataset.resize(self._rows + rows, axis=0)
+            dataset[self._rows:] = features
+
+            # Written features are not kept in memory
+            self._features[layer] = []
+
+        # END FOR
+
+        self._rows += rows
+
+    def close(self):
+        """
+        Write the last rows and the index of the clips, then move the file to its final path
+        """
+        if len(self._features[self.layers[0]]) > 0:
+            self._write_rows()
+
+        # END IF
+
+        self._file.create_dataset('names', data=np.array(self._names, dtype=np.string_))
+        self._file.create_dataset('labels', data=np.array(self._labels, dtype=np.int32))
+        self._file.create_dataset('videos', data=np.array(self._videos, dtype=np.int32))
+        self._file.create_dataset('clips', data=np.array(self._clips, dtype=np.int32))
+        self._file.close()
+
+        os.rename(self.tmp_path, self.path)
+
+
+class LayerFeatures(object):
+    """
+    Read access to a file written by LayerFeatureWriter, rows of the layer datasets are clips
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            :path: Path of the HDF5 file
+        """
+        self.path   = path
+        self._file  = h5py.File(path, 'r')
+        self.config = json.loads(self._file.attrs['config'])
+        self.layers = list(self._file['layers'].keys())
+        self.names  = [str(name) for name in self._file['names'][:]]
+        self.labels = self._file['labels'][:]
+        self.videos = self._file['videos'][:]
+        self.clips  = self._file['clips'][:]
+
+    def __len__(self):
+        return len(self.names)
+
+    def read(self, layer, rows=None):
+        """
+        Args:
+            :layer: Name of a stored layer
+            :rows:  Sorted list of the clips to read, None reads every clip
+
+        Return:
+            Features of the clips [clips, ...]
+        """
+        if rows is None:
+            return self._file['layers'][layer][:]
+
+        # END IF
+
+        return self._file['layers'][layer][list(rows)]
+
+    def video_features(self, layer):
+        """
+        Args:
+            :layer: Name of a stored layer
+
+        Return:
+            Features of the layer averaged over the clips of each video [videos, ...], labels and names of the videos
+        """
+        features = self.read(layer)
+        starts   = np.flatnonzero(self.clips == 0)
+        counts   = np.diff(np.append(starts, len(self)))
+        averages = np.add.reduceat(features, starts, axis=0) / counts.reshape([-1] + [1] * (features.ndim - 1))
+
+        return averages, self.labels[starts], [self.names[idx] for idx in starts]
+
+    def close(self):
+        self._file.close()
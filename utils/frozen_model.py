@@ -0,0 +1,74 @@
+"""
+LOADER OF THE FROZEN INFERENCE GRAPHS WRITTEN BY export_model.py AND OF THE 8-BIT GRAPHS WRITTEN BY quantize_model.py. ONLY DEPENDS ON TENSORFLOW AND NUMPY, THE MODEL CODE IS NOT NEEDED
+(THIS FILE CAN BE COPIED ALONG WITH THE .pb FILE).
+
+    model = FrozenModel('c3d_frozen.pb')
+    probabilities = model.run(clips)['probabilities']
+"""
+
+import tensorflow as tf
+import numpy      as np
+
+# Names used by export_model.py
+INPUT_NAME   = 'input_clips'
+OUTPUT_SCOPE = 'output'
+
+
+class FrozenModel(object):
+    """
+    Frozen inference graph taking uint8 clips [num_clips, frames, height, width, 3] with the BGR channel order of the tfrecords,
+    preprocessing is part of the graph. Graphs exported without preprocessing take float32 clips as loaded by load_dataset instead.
+    """
+
+    def __init__(self, path, gpu='0', cpu=False):
+        """
+        Args:
+            :path: Path of the frozen GraphDef (.pb) file
+            :gpu:  GPU ID to run the graph on
+            :cpu:  Boolean indicating whether to run the graph on the CPU only
+        """
+        graph_def = tf.GraphDef()
+
+        with open(path, 'rb') as f:
+            graph_def.ParseFromString(f.read())
+
+        # END WITH
+
+        self.graph = tf.Graph()
+
+        with self.graph.as_default():
+            with tf.device('/cpu:0' if cpu else '/gpu:'+gpu):
+                tf.import_graph_def(graph_def, name='')
+
+            # END WITH
+
+        # END WITH
+
+        self.input   = self.graph.get_tensor_by_name(INPUT_NAME + ':0')
+        self.outputs = dict([(op.name[len(OUTPUT_SCOPE)+1:], op.outputs[0]) for op in self.graph.get_operations() if op.name.startswith(OUTPUT_SCOPE + '/')])
+        self.sess    = tf.Session(graph=self.graph, config=tf.ConfigProto(allow_soft_placement=True, device_count={'GPU': 0} if cpu else {}))
+
+    def input_shape(self):
+        """ Return: Shape of the clips expected by run, [num_clips, frames, height, width, 3] """
+        return self.input.get_shape().as_list()
+
+    def run(self, clips, outputs=None):
+        """
+        Args:
+            :clips:   Array of shape input_shape(), cast to the type of the input (uint8 or float32)
+            :outputs: List of output names to compute, defaults to every output (the exported return layers and 'probabilities')
+
+        Return:
+            Dictionary mapping output names to their values
+        """
+        if outputs is None:
+            outputs = self.outputs.keys()
+
+        # END IF
+
+        values = self.sess.run([self.outputs[name] for name in outputs], feed_dict={self.input: np.asarray(clips, dtype=self.input.dtype.as_numpy_dtype)})
+
+        return dict(zip(outputs, values))
+
+    def close(self):
+        self.sess.close()
@@ -1,10 +1,135 @@
 """ FILE TO SUPPORT LAYER DEFINITIONS IN TENSORFLOW. ANY AND ALL LAYER DEFINITIONS USED TO MAKE NETWORKS MUST BE DERIVED FROM THIS DOCUMENT """
 
-from tensorflow.contrib.rnn import static_rnn
-
 import tensorflow as tf
 import numpy      as np
 
+# Fast (fused or inference only) batch normalization, see set_fast_batch_norm
+_FAST_BATCH_NORM = True
+
+# Fused LSTM block cell in lstm, see set_fused_lstm
+_FUSED_LSTM = True
+
+# Implementation of convolutions with groups > 1, see set_grouped_conv
+_GROUPED_CONV = 'auto'
+
+# Largest number of groups for which 'auto' runs a single convolution with a block diagonal kernel,
+# whose cost grows with the number of groups
+_BLOCK_DIAGONAL_MAX_GROUPS = 4
+
+# Fold batch normalization with training=False into the preceding convolution, see set_fold_batch_norm
+_FOLD_BATCH_NORM = False
+
+# Stop gradients at the freeze boundary of models, see set_stop_gradient
+_STOP_GRADIENT = True
+
+# Compute 3D convolutions as sums of 2D convolutions over the kernel depth, see set_conv3d_as_conv2d
+_CONV3D_AS_CONV2D = False
+
+# Recompute the activations between the recompute boundaries of models during backpropagation, see set_recompute
+_RECOMPUTE = False
+
+# Record every layer added to the LayerDict of models in the MODEL_LAYERS collection, see set_record_layers
+_RECORD_LAYERS = False
+
+# Layout of the activations of every layer, 'channels_last' (NHWC/NDHWC) or 'channels_first' (NCHW/NCDHW), see set_data_format
+_DATA_FORMAT = 'channels_last'
+
+# Graph collections of (output tensor name, variable scope) of convolutions without activation,
+# (batch normalization variable scope, convolution variable scope, epsilon) of folded batch normalizations and
+# (kernel variable name, channels last input dims) of fully connected kernels whose rows follow a channels first input,
+# descriptions of the layers built by models built only in part, (layer output, stopped layer output) of recompute boundaries and
+# (layer name, layer output) of every layer of models (see LayerDict)
+CONV_OUTPUTS         = 'conv_outputs'
+FOLDED_BATCH_NORMS   = 'folded_batch_norms'
+TRANSPOSED_KERNELS   = 'transposed_kernels'
+TRUNCATED_MODELS     = 'truncated_models'
+RECOMPUTE_BOUNDARIES = 'recompute_boundaries'
+MODEL_LAYERS         = 'model_layers'
+
+def set_data_format(data_format):
+    """
+    Select the layout of the activations of graphs built afterwards. Models receive channels last inputs, convert them with
+    to_data_format and convert their outputs back with from_data_format. Kernels are identical in both layouts.
+    Args:
+        :data_format: 'channels_last' (default, NHWC/NDHWC) or 'channels_first' (NCHW/NCDHW, preferred by MKL-DNN CPU builds)
+    """
+    assert(data_format in ['channels_last', 'channels_first'])
+
+    global _DATA_FORMAT
+    _DATA_FORMAT = data_format
+
+
+def get_data_format():
+    """ Return: Current layout of the activations, 'channels_last' or 'channels_first' """
+    return _DATA_FORMAT
+
+
+def channel_axis(input_tensor):
+    """ Return: Axis of the channels of a 4-D or 5-D activation in the current layout """
+    return 1 if _DATA_FORMAT == 'channels_first' else len(input_tensor.get_shape()) - 1
+
+
+def spatial_axes(input_tensor):
+    """ Return: List of the (depth,) height and width axes of a 4-D or 5-D activation in the current layout """
+    rank = len(input_tensor.get_shape())
+
+    return range(2, rank) if _DATA_FORMAT == 'channels_first' else range(1, rank-1)
+
+
+def to_data_format(input_tensor):
+    """ Return: Channels last input_tensor transposed to the current layout """
+    if _DATA_FORMAT == 'channels_first':
+        rank = len(input_tensor.get_shape())
+
+        return tf.transpose(input_tensor, [0, rank-1] + range(1, rank-1))
+
+    # END IF
+
+    return input_tensor
+
+
+def from_data_format(input_tensor):
+    """ Return: input_tensor in the current layout transposed to channels last """
+    if _DATA_FORMAT == 'channels_first':
+        rank = len(input_tensor.get_shape())
+
+        return tf.transpose(input_tensor, [0] + range(2, rank) + [1])
+
+    # END IF
+
+    return input_tensor
+
+
+def _format_dims(dims):
+    """ Return: Per-axis list (strides, kernel size, paddings) given in channels last order, reordered for the current layout """
+    if _DATA_FORMAT == 'channels_first':
+        return [dims[0], dims[-1]] + list(dims[1:-1])
+
+    # END IF
+
+    return list(dims)
+
+
+def _format_string(rank):
+    """ Return: data_format argument of tf.nn ops for the current layout and the rank of their input """
+    if rank == 4:
+        return 'NCHW' if _DATA_FORMAT == 'channels_first' else 'NHWC'
+
+    # END IF
+
+    return 'NCDHW' if _DATA_FORMAT == 'channels_first' else 'NDHWC'
+
+
+def _add_bias(output, bias):
+    """ Return: output of a convolution plus the per channel bias, in the current layout """
+    if _DATA_FORMAT == 'channels_first':
+        return output + tf.reshape(bias, [-1] + [1]*(len(output.get_shape())-2))
+
+    # END IF
+
+    return output + bias
+
+
 def conv_layer(input_tensor,
                filter_dims,
                name,
@@ -39,35 +164,34 @@ def conv_layer(input_tensor,
     assert(len(filter_dims) == 3)
     assert(len(stride_dims) == 2)
 
-    num_channels_in                      = input_dims[-1]
+    num_channels_in                      = input_dims[channel_axis(input_tensor)]
     filter_h, filter_w, num_channels_out = filter_dims
     stride_h, stride_w                   = stride_dims
 
-    convolve = lambda i, k: tf.nn.conv2d(i, k, [1, stride_h, stride_w, 1], padding=padding)
+    strides = [1, stride_h, stride_w, 1]
 
     with tf.variable_scope(name) as scope:
         if groups == 1:
             w = tf.get_variable('kernel', shape=[filter_h, filter_w, num_channels_in, num_channels_out],
                                 initializer=kernel_init, regularizer=tf.contrib.layers.l2_regularizer(weight_decay), trainable=trainable)
-            output = convolve(input_tensor, w)
+            output = tf.nn.conv2d(input_tensor, w, _format_dims(strides), padding=padding, data_format=_format_string(4))
 
         else:
             w = tf.get_variable('kernel', shape=[filter_h, filter_w, int(num_channels_in/groups), num_channels_out],
                                 initializer=kernel_init, regularizer=tf.contrib.layers.l2_regularizer(weight_decay), trainable=trainable)
-
-            input_groups  = tf.split(input_tensor, groups, axis=3)
-            kernel_groups = tf.split(w, groups, axis=3)
-            output_groups = [convolve(i, k) for i, k in zip(input_groups, kernel_groups)]
-            output        = tf.concat(output_groups, 3)
+            output = grouped_convolution(input_tensor, w, groups, strides, padding)
 
         # END IF
 
         b        = tf.get_variable('bias', shape=[num_channels_out], initializer=bias_init, trainable=trainable)
-        conv_out = output + b
+        conv_out = _add_bias(output, b)
 
         if non_linear_fn is not None:
             conv_out = non_linear_fn(conv_out, name=scope.name)
 
+        else:
+            tf.add_to_collection(CONV_OUTPUTS, (conv_out.name, scope.name))
+
         # END IF
 
     # END WITH
@@ -110,32 +234,35 @@ def conv3d_layer(input_tensor,
     assert(len(filter_dims) == 4)
     assert(len(stride_dims) == 3)
 
-    num_channels_in                                = input_dims[-1]
+    num_channels_in                                = input_dims[channel_axis(input_tensor)]
     filter_d, filter_h, filter_w, num_channels_out = filter_dims
     stride_d, stride_h, stride_w                   = stride_dims
 
-    convolve = lambda i, k: tf.nn.conv3d(i, k, [1, stride_d, stride_h, stride_w, 1], padding=padding)
+    strides = [1, stride_d, stride_h, stride_w, 1]
 
     with tf.variable_scope(name) as scope:
         if groups == 1:
             w = tf.get_variable('kernel', shape=[filter_d, filter_h, filter_w, num_channels_in, num_channels_out],
                                 initializer=kernel_init, regularizer=tf.contrib.layers.l2_regularizer(weight_decay), trainable=trainable)
-            output = convolve(input_tensor, w)
+            if _CONV3D_AS_CONV2D and _DATA_FORMAT == 'channels_last':
+                output = conv3d_as_conv2d(input_tensor, w, strides, padding)
+
+            else:
+                output = tf.nn.conv3d(input_tensor, w, _format_dims(strides), padding=padding, data_format=_format_string(5))
+
+            # END IF
 
         else:
             w = tf.get_variable('kernel', shape=[filter_d, filter_h, filter_w, int(num_channels_in/groups), num_channels_out],
                                 initializer=kernel_init, regularizer=tf.contrib.layers.l2_regularizer(weight_decay), trainable=trainable)
-
-            input_groups  = tf.split(input_tensor, groups, axis=3)
-            kernel_groups = tf.split(w, groups, axis=3)
-            output_groups = [convolve(i, k) for i, k in zip(input_groups, kernel_groups)]
-            output        = tf.concat(output_groups, 3)
+            output = grouped_convolution(input_tensor, w, groups, strides, padding)
 
         # END IF
 
-        if use_bias:
-            b        = tf.get_variable('bias', shape=[num_channels_out], initializer=bias_init, trainable=trainable)
-            conv_out = output + b
+        # A batch normalization folded into the convolution requires a bias
+        if use_bias or (_FOLD_BATCH_NORM and non_linear_fn is None):
+            b        = tf.get_variable('bias', shape=[num_channels_out], initializer=bias_init if use_bias else tf.zeros_initializer(), trainable=trainable)
+            conv_out = _add_bias(output, b)
 
         else:
             conv_out = output
@@ -145,6 +272,9 @@ def conv3d_layer(input_tensor,
         if non_linear_fn is not None:
             conv_out = non_linear_fn(conv_out, name=scope.name)
 
+        elif use_bias or _FOLD_BATCH_NORM:
+            tf.add_to_collection(CONV_OUTPUTS, (conv_out.name, scope.name))
+
         # END IF
 
     # END WITH
@@ -153,6 +283,148 @@ def conv3d_layer(input_tensor,
 
 
 
+def set_conv3d_as_conv2d(enabled):
+    """
+    Enable or disable (default) computing the ungrouped channels last 3D convolutions of graphs built afterwards as sums of 2D convolutions.
+    Same kernel variable and output, only for graphs with static shapes. The Graph Transform Tool quantizes Conv2D but not Conv3D (see utils/quantization_utils.py)
+    Args:
+        :enabled: Boolean
+    """
+    global _CONV3D_AS_CONV2D
+    _CONV3D_AS_CONV2D = enabled
+
+
+def conv3d_as_conv2d(input_tensor, kernel, strides, padding):
+    """
+    3D convolution computed as the sum over the kernel depth of 2D convolutions of the strided frames of the input, with the batch and depth axes merged
+    Args:
+        :input_tensor: Channels last input tensor [batch, depth, height, width, channels_in] with static depth, height and width
+        :kernel:       Kernel [depth, height, width, channels_in, channels_out]
+        :strides:      Strides of each dimension of input_tensor
+        :padding:      Padding type definition (VALID or SAME)
+
+    Return:
+        Output of the convolution [batch, depth, height, width, channels_out]
+    """
+    input_dims = input_tensor.get_shape().as_list()
+    filter_d   = kernel.get_shape().as_list()[0]
+    stride_d   = strides[1]
+
+    if padding == 'SAME':
+        # Padding of the depth axis as done by conv3d, the height and width axes are padded the same way by conv2d
+        output_d     = int(np.ceil(input_dims[1] / float(stride_d)))
+        pad_total    = max((output_d - 1) * stride_d + filter_d - input_dims[1], 0)
+        input_tensor = tf.pad(input_tensor, [[0, 0], [pad_total // 2, pad_total - pad_total // 2], [0, 0], [0, 0], [0, 0]])
+
+    else:
+        output_d = (input_dims[1] - filter_d) // stride_d + 1
+
+    # END IF
+
+    output = None
+
+    for idx in range(filter_d):
+        frames = input_tensor[:, idx:idx + (output_d - 1) * stride_d + 1:stride_d]
+        frames = tf.reshape(frames, [-1] + input_dims[2:])
+        conv   = tf.nn.conv2d(frames, kernel[idx], [1, strides[2], strides[3], 1], padding=padding)
+        output = conv if output is None else output + conv
+
+    # END FOR
+
+    return tf.reshape(output, [-1, output_d] + output.get_shape().as_list()[1:])
+
+
+def set_grouped_conv(method):
+    """
+    Select the implementation of convolutions with groups > 1 for graphs built afterwards, every implementation uses the same kernel variable
+    Args:
+        :method: One of 'auto' (default), 'block_diagonal', 'depthwise' or 'split', see grouped_convolution
+    """
+    assert(method in ['auto', 'block_diagonal', 'depthwise', 'split'])
+
+    global _GROUPED_CONV
+    _GROUPED_CONV = method
+
+
+def grouped_convolution(input_tensor, kernel, groups, strides, padding):
+    """
+    Convolution whose input and output channels are divided into groups, each output group only sees the input channels of its group.
+    Implementations:
+        block_diagonal: One conv2d/conv3d with the kernel placed on the block diagonal of a dense kernel, groups times the computation of the
+                        grouped convolution but a single large op
+        depthwise:      One depthwise_conv2d followed by a sum over the input channels of each group, same computation as the grouped convolution
+                        (channels last 2D convolutions with equal row and column strides only)
+        split:          One convolution per group on slices of the input and kernel, concatenated
+    'auto' uses block_diagonal up to _BLOCK_DIAGONAL_MAX_GROUPS groups, depthwise above that and split where depthwise is not available
+
+    Args:
+        :input_tensor: Input tensor [batch, (depth,) height, width, channels_in], channels first with set_data_format('channels_first')
+        :kernel:       Kernel [(depth,) height, width, channels_in/groups, channels_out]
+        :groups:       Number of groups, divides channels_in and channels_out
+        :strides:      Strides of each dimension of input_tensor, in channels last order
+        :padding:      Padding type definition (VALID or SAME)
+
+    Return:
+        Output of the convolution [batch, (depth,) height, width, channels_out], in the layout of input_tensor
+    """
+    kernel_dims = kernel.get_shape().as_list()
+    rank        = len(kernel_dims)
+    axis        = channel_axis(input_tensor)
+    conv        = lambda i, k: (tf.nn.conv2d if rank == 4 else tf.nn.conv3d)(i, k, _format_dims(strides), padding=padding, data_format=_format_string(rank))
+
+    depthwise_available = rank == 4 and strides[1] == strides[2] and _DATA_FORMAT == 'channels_last'
+
+    method = _GROUPED_CONV
+
+    if method == 'auto':
+        if groups <= _BLOCK_DIAGONAL_MAX_GROUPS:
+            method = 'block_diagonal'
+
+        elif depthwise_available:
+            method = 'depthwise'
+
+        else:
+            method = 'split'
+
+        # END IF
+
+    elif method == 'depthwise' and not depthwise_available:
+        method = 'split'
+
+    # END IF
+
+    group_in, num_channels_out = kernel_dims[-2:]
+    group_out                  = num_channels_out / groups
+
+    if method == 'block_diagonal':
+        # Kernel repeated for every input group, entries connecting channels of different groups are zeroed
+        mask   = np.kron(np.eye(groups), np.ones([group_in, group_out])).astype(np.float32)
+        kernel = tf.tile(kernel, [1]*(rank-2) + [groups, 1]) * mask
+
+        return conv(input_tensor, kernel)
+
+    elif method == 'depthwise':
+        # Depthwise kernel [height, width, channels_in, group_out]: each input channel is convolved with the filters of its group's outputs
+        kernel = tf.reshape(kernel, kernel_dims[:2] + [group_in, groups, group_out])
+        kernel = tf.reshape(tf.transpose(kernel, [0,1,3,2,4]), kernel_dims[:2] + [groups*group_in, group_out])
+
+        output      = tf.nn.depthwise_conv2d(input_tensor, kernel, strides, padding=padding)
+        output_dims = [dim if dim is not None else tf.shape(output)[idx] for idx, dim in enumerate(output.get_shape().as_list()[:3])]
+
+        # Sum the contributions of the input channels of each group
+        output = tf.reduce_sum(tf.reshape(output, output_dims + [groups, group_in, group_out]), axis=4)
+
+        return tf.reshape(output, output_dims + [num_channels_out])
+
+    # END IF
+
+    input_groups  = tf.split(input_tensor, groups, axis=axis)
+    kernel_groups = tf.split(kernel, groups, axis=rank-1)
+    output_groups = [conv(i, k) for i, k in zip(input_groups, kernel_groups)]
+
+    return tf.concat(output_groups, axis)
+
+
 def max_pool_layer(input_tensor,
                    filter_dims,
                    stride_dims,
@@ -180,8 +452,8 @@ def max_pool_layer(input_tensor,
 
     with tf.variable_scope(name) as scope:
         # Define the max pool flow graph and return output
-        pool_out = tf.nn.max_pool(input_tensor, ksize=[1, filter_h, filter_w, 1],
-                               strides=[1, stride_h, stride_w, 1], padding=padding, name=scope.name)
+        pool_out = tf.nn.max_pool(input_tensor, ksize=_format_dims([1, filter_h, filter_w, 1]),
+                               strides=_format_dims([1, stride_h, stride_w, 1]), padding=padding, data_format=_format_string(4), name=scope.name)
     # END WITH
 
     return pool_out
@@ -219,8 +491,8 @@ def max_pool3d_layer(input_tensor,
 
     with tf.variable_scope(name) as scope:
         # Define the max pool flow graph and return output
-        pool_out = tf.nn.max_pool3d(input_tensor, ksize=[1, filter_d, filter_h, filter_w, 1],
-                               strides=[1, stride_d, stride_h, stride_w, 1], padding=padding, name=scope.name)
+        pool_out = tf.nn.max_pool3d(input_tensor, ksize=_format_dims([1, filter_d, filter_h, filter_w, 1]),
+                               strides=_format_dims([1, stride_d, stride_h, stride_w, 1]), padding=padding, data_format=_format_string(5), name=scope.name)
     # END WITH
 
     return pool_out
@@ -251,8 +523,8 @@ def avg_pool_layer(input_tensor,
     stride_h, stride_w = stride_dims
     with tf.variable_scope(name) as scope:
         # Define the max pool flow graph and return output
-        pool_out = tf.nn.avg_pool(input_tensor, ksize=[1, filter_h, filter_w, 1],
-                               strides=[1, stride_h, stride_w, 1], padding=padding, name=scope.name)
+        pool_out = tf.nn.avg_pool(input_tensor, ksize=_format_dims([1, filter_h, filter_w, 1]),
+                               strides=_format_dims([1, stride_h, stride_w, 1]), padding=padding, data_format=_format_string(4), name=scope.name)
     return pool_out
 
 
@@ -281,8 +553,8 @@ def avg_pool3d_layer(input_tensor,
     _, stride_d, stride_h, stride_w, _ = stride_dims
     with tf.variable_scope(name) as scope:
         # Define the max pool flow graph and return output
-        pool_out = tf.nn.avg_pool3d(input_tensor, ksize=[1, filter_d, filter_h, filter_w, 1],
-                               strides=[1, stride_d, stride_h, stride_w, 1], padding=padding, name=scope.name)
+        pool_out = tf.nn.avg_pool3d(input_tensor, ksize=_format_dims([1, filter_d, filter_h, filter_w, 1]),
+                               strides=_format_dims([1, stride_d, stride_h, stride_w, 1]), padding=padding, data_format=_format_string(5), name=scope.name)
     return pool_out
 
 
@@ -313,10 +585,8 @@ def fully_connected_layer(input_tensor,
     with tf.variable_scope(name) as scope:
         input_dims = input_tensor.get_shape().as_list()
 
-        if len(input_dims) == 4:
-            batch_size, input_h, input_w, num_channels = input_dims
-
-            in_dim     = input_h * input_w * num_channels
+        if len(input_dims) > 2:
+            in_dim     = int(np.prod(input_dims[1:]))
             flat_input = tf.reshape(input_tensor, [-1, in_dim])
 
         else:
@@ -326,6 +596,13 @@ def fully_connected_layer(input_tensor,
         # END IF
 
         w      = tf.get_variable('kernel', shape=[in_dim, out_dim], initializer=weight_init, regularizer=tf.contrib.layers.l2_regularizer(weight_decay), trainable=trainable)
+
+        if len(input_dims) > 2 and _DATA_FORMAT == 'channels_first':
+            # Rows of w follow the channels first input, checkpoints keep the channels last order (see initialize_from_dict)
+            tf.add_to_collection(TRANSPOSED_KERNELS, (w.name, input_dims[2:] + input_dims[1:2]))
+
+        # END IF
+
         b      = tf.get_variable('bias', shape=[out_dim], initializer=bias_init, trainable=trainable)
         fc_out = tf.add(tf.matmul(flat_input, w), b, name=scope.name)
 
@@ -352,6 +629,24 @@ def reshape(input_tensor, shape, name):
     return tf.reshape(input_tensor, shape=shape, name=name)
 
 
+def temporal_windows(input_tensor, num_windows, window_stride, start, stop):
+    """
+    Args:
+        :input_tensor:  Input tensor [BatchSize x Frames x ...], frames along the second axis
+        :num_windows:   Number of windows of each batch entry
+        :window_stride: Number of frames between the first frames of consecutive windows
+        :start:         First frame of each window gathered, relative to the first frame of the window
+        :stop:          Frame following the last frame of each window gathered
+
+    Return:
+        Frames [start, stop) of every window [BatchSize*num_windows x stop-start x ...], the windows of each batch entry consecutive
+    """
+    shape   = input_tensor.get_shape().as_list()
+    indices = np.arange(shape[0])[:, None, None] * shape[1] + np.arange(num_windows)[None, :, None] * window_stride + np.arange(start, stop)[None, None, :]
+
+    return tf.gather(tf.reshape(input_tensor, [-1] + shape[2:]), indices.reshape(-1, stop - start).astype(np.int32))
+
+
 def dropout(input_tensor, training, rate):
     """
     Args:
@@ -365,17 +660,155 @@ def dropout(input_tensor, training, rate):
     return tf.layers.dropout(input_tensor, training=training, rate=rate)
 
 
-def batch_normalization(input_tensor, training, name, trainable=True):
+def set_fast_batch_norm(enabled):
+    """
+    Enable (default) or disable the fast paths of batch_normalization for graphs built afterwards, used to benchmark both versions
+    Args:
+        :enabled: Boolean, False reverts to the unfused tf.layers.batch_normalization
+    """
+    global _FAST_BATCH_NORM
+    _FAST_BATCH_NORM = enabled
+
+
+def set_fused_lstm(enabled):
+    """
+    Enable (default) or disable the fused LSTM block cell of lstm for graphs built afterwards, used to benchmark both versions
+    Args:
+        :enabled: Boolean, False uses a BasicLSTMCell unrolled by tf.nn.dynamic_rnn, both share the same variables
+    """
+    global _FUSED_LSTM
+    _FUSED_LSTM = enabled
+
+
+def set_stop_gradient(enabled):
+    """
+    Enable (default) or disable stopping gradients at the output of the last frozen layer of models (see LayerDict), for graphs built afterwards.
+    Gradients are then neither computed through the frozen layers nor for their activations, used to benchmark both versions
+    Args:
+        :enabled: Boolean
+    """
+    global _STOP_GRADIENT
+    _STOP_GRADIENT = enabled
+
+
+def set_recompute(enabled):
     """
+    Enable or disable (default) recomputation of activations for graphs built afterwards. The outputs of the recompute_boundaries layers of models
+    are then the only activations kept for backpropagation, the layers between two boundaries are run again during backpropagation.
+    Only for training graphs whose gradients are computed by recompute_gradients (utils/recompute_utils.py)
+    Args:
+        :enabled: Boolean
+    """
+    global _RECOMPUTE
+    _RECOMPUTE = enabled
+
+
+def set_record_layers(enabled):
+    """
+    Enable or disable (default) recording the name and output of every layer of the models built afterwards in the MODEL_LAYERS collection,
+    in the order in which the layers are added, used by profile_models.py
+    Args:
+        :enabled: Boolean
+    """
+    global _RECORD_LAYERS
+    _RECORD_LAYERS = enabled
+
+
+def set_fold_batch_norm(enabled):
+    """
+    Enable or disable (default) folding batch normalizations with training=False into the convolution producing their input, for graphs built afterwards.
+    Folded batch normalizations create no ops or variables, their statistics are folded into the convolution's kernel and bias by
+    initialize_from_dict (utils/checkpoint_utils.py). Only for inference: the convolution outputs then hold the batch normalized values.
+    Args:
+        :enabled: Boolean
+    """
+    global _FOLD_BATCH_NORM
+    _FOLD_BATCH_NORM = enabled
+
+
+def batch_normalization(input_tensor, training, name, trainable=True, epsilon=1e-3):
+    """
+    Fast paths share the variables (name/gamma, name/beta, name/moving_mean, name/moving_variance) of tf.layers.batch_normalization:
+        - training=False: inference only affine transform using the moving statistics, no moments ops are created
+        - 4-D input: fused batch normalization kernel
+        - 5-D input: reshaped to 4-D (merging the batch and depth axes) for the fused kernel, the statistics are unchanged
+        - channels first 5-D input: reshaped to 4-D (merging the depth and height axes) instead
+    With set_fold_batch_norm(True), training=False and an input produced by conv_layer/conv3d_layer, the layer is folded into that convolution instead
     Args:
         :input_tensor:  Input tensor to be reshaped
         :training:      Whether to return output during training or testing
         :name:          Scope name to be provided for reshape operation
+        :trainable:     Boolean indicating whether gamma and beta are trainable
+        :epsilon:       Small value added to the variance to avoid dividing by zero
 
     Return:
         Batch normalized input tensor
     """
-    return tf.layers.batch_normalization(input_tensor, training=training, name=name, trainable=trainable)
+    if training is False and _FOLD_BATCH_NORM:
+        conv_scope = dict(tf.get_collection(CONV_OUTPUTS)).get(input_tensor.name)
+
+        if conv_scope is not None:
+            scope = tf.get_variable_scope().name
+            tf.add_to_collection(FOLDED_BATCH_NORMS, ((scope + '/' if scope else '') + name, conv_scope, epsilon))
+
+            return input_tensor
+
+        # END IF
+
+    # END IF
+
+    axis = channel_axis(input_tensor)
+
+    if not _FAST_BATCH_NORM:
+        return tf.layers.batch_normalization(input_tensor, axis=axis, training=training, name=name, trainable=trainable, epsilon=epsilon)
+
+    # END IF
+
+    # Python boolean False (not a tensor): the moving statistics are constant for the whole graph
+    if training is False:
+        num_channels = input_tensor.get_shape().as_list()[axis]
+
+        with tf.variable_scope(name):
+            gamma           = tf.get_variable('gamma', shape=[num_channels], initializer=tf.ones_initializer(), trainable=trainable)
+            beta            = tf.get_variable('beta', shape=[num_channels], initializer=tf.zeros_initializer(), trainable=trainable)
+            moving_mean     = tf.get_variable('moving_mean', shape=[num_channels], initializer=tf.zeros_initializer(), trainable=False)
+            moving_variance = tf.get_variable('moving_variance', shape=[num_channels], initializer=tf.ones_initializer(), trainable=False)
+
+            scale  = gamma * tf.rsqrt(moving_variance + epsilon)
+            offset = beta - moving_mean * scale
+
+        # END WITH
+
+        if _DATA_FORMAT == 'channels_first':
+            scale  = tf.reshape(scale, [-1] + [1]*(len(input_tensor.get_shape())-2))
+            offset = tf.reshape(offset, [-1] + [1]*(len(input_tensor.get_shape())-2))
+
+        # END IF
+
+        return input_tensor * scale + offset
+
+    # END IF
+
+    if len(input_tensor.get_shape()) == 5:
+        # Static height, width and channels are kept so that the variables can be created, the whole shape when it is static (needed by XLA)
+        shape  = input_tensor.get_shape().as_list() if input_tensor.get_shape().is_fully_defined() else tf.shape(input_tensor)
+        dims   = [dim if dim is not None else shape[idx+2] for idx, dim in enumerate(input_tensor.get_shape().as_list()[2:])]
+
+        if _DATA_FORMAT == 'channels_first':
+            # [batch, channels, depth x height, width]
+            dims = [input_tensor.get_shape().as_list()[1], dims[0] * dims[1], dims[2]]
+
+        # END IF
+
+        output = tf.layers.batch_normalization(tf.reshape(input_tensor, [-1] + dims), axis=axis if axis == 1 else 3, training=training, name=name, trainable=trainable, epsilon=epsilon, fused=True)
+        output = tf.reshape(output, shape)
+        output.set_shape(input_tensor.get_shape())
+
+        return output
+
+    # END IF
+
+    return tf.layers.batch_normalization(input_tensor, axis=axis, training=training, name=name, trainable=trainable, epsilon=epsilon, fused=len(input_tensor.get_shape()) == 4)
 
 
 def pad(input_tensor,
@@ -395,37 +828,142 @@ def pad(input_tensor,
         return tf.pad(input_tensor, [[padding, padding],[padding, padding],[0,0]], "CONSTANT")
 
     elif len(input_tensor.shape) == 4:
-        return tf.pad(input_tensor, [[0,0],[padding, padding],[padding, padding],[0,0]], "CONSTANT")
+        return tf.pad(input_tensor, _format_dims([[0,0],[padding, padding],[padding, padding],[0,0]]), "CONSTANT")
 
     elif len(input_tensor.shape) == 5:
-        return tf.pad(input_tensor, [[0,0],[0,0],[padding, padding],[padding, padding],[0,0]], "CONSTANT")
+        return tf.pad(input_tensor, _format_dims([[0,0],[0,0],[padding, padding],[padding, padding],[0,0]]), "CONSTANT")
 
 def lstm(inputs, seq_length, feat_size, cell_size=1024):
     """
     Args:
-        :inputs:       List of length input_dims where each element is of shape [batch_size x feat_size]
+        :inputs:       Tensor of shape [(batch_size x seq_length) x feat_size], the time steps of each clip are consecutive
         :seq_length:   Length of output sequence
         :feat_size:    Size of input to LSTM
         :cell_size:    Size of internal cell (output of LSTM)
 
     Return:
-        :lstm_outputs:  Output list of length seq_length where each element is of shape [batch_size x cell_size]
+        :lstm_outputs:  Tensor of shape [(batch_size x seq_length) x cell_size], in the same order as inputs
     """
 
-    # Unstack input tensor to match shape:
-    # list of n_time_steps items, each item of size (batch_size x featSize)
-    inputs = tf.reshape(inputs, [-1,1,feat_size])
-    inputs = tf.unstack(inputs, seq_length, axis=0)
+    # Time major input to the LSTM: [seq_length, batch_size, feat_size]
+    inputs = tf.transpose(tf.reshape(inputs, [-1, seq_length, feat_size]), [1,0,2])
+
+    # Variables are created under rnn/basic_lstm_cell with the gate layout (i, j, f, o) of the previous static_rnn over a BasicLSTMCell.
+    # Their names (kernel and bias, or weights and biases for LSTMBlockFusedCell in some tensorflow versions) are mapped onto each other
+    # by initialize_from_dict, see benchmark_models.py --compare lstm for a check that checkpoints load into either implementation
+    if _FUSED_LSTM:
+        # A single op over the whole sequence instead of one subgraph per time step
+        with tf.variable_scope('rnn'):
+            lstm_cell            = tf.contrib.rnn.LSTMBlockFusedCell(cell_size)
+            lstm_outputs, states = lstm_cell(inputs, dtype=tf.float32, scope='basic_lstm_cell')
 
-    # LSTM cell definition
-    lstm_cell            = tf.contrib.rnn.BasicLSTMCell(cell_size)
-    lstm_outputs, states = static_rnn(lstm_cell, inputs, dtype=tf.float32)
+        # END WITH
+
+    else:
+        lstm_cell            = tf.contrib.rnn.BasicLSTMCell(cell_size)
+        lstm_outputs, states = tf.nn.dynamic_rnn(lstm_cell, inputs, dtype=tf.float32, time_major=True, scope='rnn')
+
+    # END IF
 
     # Condense output shape from:
-    # list of n_time_steps itmes, each item of size (batch_size x cell_size)
+    # Tensor: [seq_length, batch_size, cell_size]
     # To:
-    # Tensor: [(n_time_steps x 1), cell_size] (Specific to our case)
-    lstm_outputs = tf.stack(lstm_outputs)
-    lstm_outputs = tf.reshape(lstm_outputs,[-1,cell_size])
+    # Tensor: [(batch_size x seq_length), cell_size]
+    lstm_outputs = tf.transpose(lstm_outputs, [1,0,2])
+    lstm_outputs = tf.reshape(lstm_outputs, [-1, cell_size])
 
     return lstm_outputs
+
+
+class ReturnLayersBuilt(Exception):
+    """ Raised by LayerDict once every requested layer has been built """
+    pass
+
+
+class LayerDict(dict):
+    """
+    Dictionary of the layers of a model that stops the construction of the model as soon as every layer of return_layer has been added,
+    so that requesting an intermediate layer (e.g. for feature extraction) only builds, initializes and runs the layers it depends on.
+    Used as a context manager around the construction of the layers, which suppresses ReturnLayersBuilt:
+
+        with tf.name_scope(scope, 'model', [inputs]), LayerDict(return_layer, self.freeze_boundary()) as layers:
+            layers['conv1'] = ...
+
+    The output of the freeze_boundary layer, below which every layer is frozen, is stored behind tf.stop_gradient (see set_stop_gradient).
+    So are the outputs of the recompute_boundaries layers, whose gradients are then computed by recompute_gradients (see set_recompute).
+    Every layer added is also recorded in the MODEL_LAYERS collection when set_record_layers(True) was called.
+    """
+
+    def __init__(self, return_layer, freeze_boundary=None, recompute_boundaries=()):
+        """
+        Args:
+            :return_layer:         List of strings matching names of layers in the model
+            :freeze_boundary:      Name of the last frozen layer of the model, None when there is none
+            :recompute_boundaries: Names of the layers whose outputs are kept for backpropagation when recomputing activations
+        """
+        super(LayerDict, self).__init__()
+
+        self.return_layer         = set(return_layer)
+        self.freeze_boundary      = freeze_boundary
+        self.recompute_boundaries = set(recompute_boundaries)
+
+    def __setitem__(self, key, value):
+        super(LayerDict, self).__setitem__(key, self._record(key, self._stop_gradient(key, value)))
+        self._check_built()
+
+    def update(self, *args, **kwargs):
+        items = dict(*args, **kwargs).items()
+
+        # Dictionaries of layers built by a block are recorded in the order their outputs were created
+        if _RECORD_LAYERS:
+            ops   = dict((op, idx) for idx, op in enumerate(tf.get_default_graph().get_operations()))
+            items = sorted(items, key=lambda item: ops.get(getattr(item[1], 'op', None), -1))
+
+        # END IF
+
+        super(LayerDict, self).update([(key, self._record(key, self._stop_gradient(key, value))) for key, value in items])
+        self._check_built()
+
+    def _record(self, key, value):
+        if _RECORD_LAYERS:
+            tf.add_to_collection(MODEL_LAYERS, (key, value))
+
+        # END IF
+
+        return value
+
+    def _stop_gradient(self, key, value):
+        if _STOP_GRADIENT and key == self.freeze_boundary:
+            return tf.stop_gradient(value, name='freeze_boundary')
+
+        # END IF
+
+        if _RECOMPUTE and key in self.recompute_boundaries:
+            stopped = tf.stop_gradient(value, name='recompute_boundary')
+            tf.add_to_collection(RECOMPUTE_BOUNDARIES, (value, stopped))
+
+            return stopped
+
+        # END IF
+
+        return value
+
+    def _check_built(self):
+        if self.return_layer.issubset(self.keys()):
+            raise ReturnLayersBuilt()
+
+        # END IF
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Layers after the requested ones are not built
+        if exc_type is not None and issubclass(exc_type, ReturnLayersBuilt):
+            tf.add_to_collection(TRUNCATED_MODELS, 'up to ' + ', '.join(sorted(self.return_layer)))
+
+            return True
+
+        # END IF
+
+        return False
@@ -0,0 +1,388 @@
+"""
+PROCESS POOL PREPROCESSING BACKEND. VIDEOS ARE READ, DECODED AND PREPROCESSED WITH NUMPY IN WORKER PROCESSES AND
+FED INTO THE SAME CLIP QUEUE USED BY load_dataset_tfrecords.py, SO THE REST OF THE TRAIN/TEST GRAPH IS UNCHANGED.
+"""
+
+import os
+import random
+import signal
+import struct
+import threading
+import collections
+import multiprocessing as mp
+
+import numpy      as np
+import tensorflow as tf
+from tensorflow.python.training import queue_runner
+from tensorflow.core.example    import example_pb2
+
+from utils.numpy_preprocessing_utils import extract_clips, reduce_fps
+
+# State of each worker process, set once by _init_worker
+_WORKER = {}
+
+
+def _init_worker(preprocess_fn, preprocess_kwargs, loader_kwargs, seed):
+    """
+    Initialize a worker process of the preprocessing pool
+    Args:
+        :preprocess_fn:     NumPy preprocessing function of the model (see Abstract_Model_Class.numpy_preprocessing)
+        :preprocess_kwargs: Keyword arguments of preprocess_fn
+        :loader_kwargs:     Dictionary of the load_dataset arguments needed to turn a record into clips
+        :seed:              Seed shared by all workers, offset by the process id
+    """
+    # Interrupts are handled by the main process, which terminates the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    np.random.seed((seed + os.getpid()) % (2**32))
+
+    _WORKER['preprocess_fn']     = preprocess_fn
+    _WORKER['preprocess_kwargs'] = preprocess_kwargs
+    _WORKER.update(loader_kwargs)
+
+
+def read_tfrecords(filename):
+    """
+    Read every example of a tfrecords file without using any tensorflow ops
+    Args:
+        :filename: Full path of the tfrecords file
+
+    Return:
+        List of dictionaries containing the features of each sample (Data, Frames, Height, Width, Channels, Label, Name)
+    """
+    records = []
+
+    with open(filename, 'rb') as f:
+        while True:
+            # Each record: uint64 length, uint32 masked crc of length, data, uint32 masked crc of data
+            header = f.read(12)
+
+            if len(header) < 12:
+                break
+
+            # END IF
+
+            length  = struct.unpack('<Q', header[:8])[0]
+            data    = f.read(length)
+            f.read(4)
+
+            feature = example_pb2.Example.FromString(data).features.feature
+            records.append({'Data':     feature['Data'].bytes_list.value[0],
+                            'Name':     feature['Name'].bytes_list.value[0],
+                            'Frames':   feature['Frames'].int64_list.value[0],
+                            'Height':   feature['Height'].int64_list.value[0],
+                            'Width':    feature['Width'].int64_list.value[0],
+                            'Channels': feature['Channels'].int64_list.value[0],
+                            'Label':    feature['Label'].int64_list.value[0]})
+
+        # END WHILE
+
+    # END WITH
+
+    return records
+
+
+def _preprocess_record(filename):
+    """
+    Load every video of a tfrecords file, extract its clips and preprocess them (mirrors _load_video in load_dataset_tfrecords.py)
+    Args:
+        :filename: Full path of the tfrecords file
+
+    Return:
+        List of (clips [num_clips, clip_frames, height, width, channels], label, name) tuples
+    """
+    results = []
+
+    for features in read_tfrecords(filename):
+        frames  = int(features['Frames'])
+        height  = int(features['Height'])
+        width   = int(features['Width'])
+        channel = int(features['Channels'])
+
+        # Shape [frames, height, width, channels], BGR to RGB
+        video = np.frombuffer(features['Data'], dtype=np.uint8).reshape(frames, height, width, channel)[...,::-1]
+
+        # Reduction in fps to 25 for HMDB51 dataset
+        if ('HMDB51' in _WORKER['dataset']) or ('MIT' in _WORKER['dataset']):
+            video, frames = reduce_fps(video, frames)
+
+        # END IF
+
+        # If clip_length <= 0 then the entire video is to be used as a single clip
+        if _WORKER['clip_length'] <= 0:
+            clips = video[np.newaxis]
+
+        else:
+            clips = extract_clips(video, frames, _WORKER['num_clips'], _WORKER['clip_offset'], _WORKER['clip_length'], _WORKER['video_offset'], _WORKER['clip_stride'])
+
+        # END IF
+
+        clips = np.stack([_WORKER['preprocess_fn'](clip, clip.shape[0], height, width, channel, _WORKER['input_dims'], _WORKER['output_dims'],
+                                                   _WORKER['seq_length'], _WORKER['size'], int(features['Label']), _WORKER['istraining'],
+                                                   **_WORKER['preprocess_kwargs']) for clip in clips])
+
+        results.append((clips.astype(np.float32), int(features['Label']), features['Name']))
+
+    # END FOR
+
+    return results
+
+
+class NumpyPreprocessingRunner(queue_runner.QueueRunner):
+    """
+    Queue runner whose thread submits tfrecords files to a pool of preprocessing processes and enqueues the returned clips
+    """
+
+    def __init__(self, queue, placeholders, enqueue_op, filenames, num_workers, worker_args, istraining, seq_length, video_step, shuffle_seed=0):
+        """
+        Args:
+            :queue:        Clip queue shared with the rest of the graph
+            :placeholders: Placeholders of enqueue_op (clips, labels, names, video steps, alphas)
+            :enqueue_op:   enqueue_many op of queue fed from placeholders
+            :filenames:    List of tfrecords files
+            :num_workers:  Number of preprocessing processes
+            :worker_args:  Arguments of _init_worker
+            :istraining:   Boolean variable indicating training/testing phase, files are shuffled each epoch during training
+            :seq_length:   Length of output sequence expected from LSTM
+            :video_step:   Tensorflow variable providing the initial number of loaded videos
+            :shuffle_seed: Seed of the per-epoch file shuffle
+        """
+        super(NumpyPreprocessingRunner, self).__init__(queue, [enqueue_op])
+
+        self._placeholders = placeholders
+        self._enqueue_op   = enqueue_op
+        self._filenames    = list(filenames)
+        self._istraining   = istraining
+        self._seq_length   = seq_length
+        self._video_step   = video_step
+        self._shuffle_seed = shuffle_seed
+
+        # Bound the number of videos in flight so that preprocessed clips never pile up in memory
+        self._max_pending  = 2 * num_workers
+        self._pool         = mp.Pool(num_workers, _init_worker, worker_args)
+
+    def create_threads(self, sess, coord=None, daemon=False, start=False):
+        """
+        Create the feeding thread and, if a coordinator is given, a thread cancelling pending enqueues and terminating the pool on stop
+        """
+        threads = [threading.Thread(target=self._feed, args=(sess, coord))]
+
+        if coord:
+            threads.append(threading.Thread(target=self._stop_on_request, args=(sess, coord)))
+
+        # END IF
+
+        for thread in threads:
+            if coord:
+                coord.register_thread(thread)
+
+            # END IF
+
+            if daemon:
+                thread.daemon = True
+
+            # END IF
+
+            if start:
+                thread.start()
+
+            # END IF
+
+        # END FOR
+
+        return threads
+
+    def _wait(self, result, coord):
+        """
+        Wait for a result of the pool, returning None if a stop is requested in the meantime
+        """
+        while not result.ready():
+            if coord and coord.should_stop():
+                return None
+
+            # END IF
+
+            result.wait(0.1)
+
+        # END WHILE
+
+        return result.get()
+
+    def _enqueue(self, sess, results):
+        """
+        Enqueue the clips of every video returned by _preprocess_record, returns False if results is None (stop requested)
+        """
+        if results is None:
+            return False
+
+        # END IF
+
+        clips_ph, labels_ph, names_ph, video_step_ph, alpha_ph = self._placeholders
+
+        for clips, label, name in results:
+            self._step += 1
+            num_clips   = clips.shape[0]
+
+            sess.run(self._enqueue_op, feed_dict={clips_ph:      clips,
+                                                  labels_ph:     np.tile(label, [num_clips, self._seq_length]),
+                                                  names_ph:      [name]*num_clips,
+                                                  video_step_ph: [self._step]*num_clips,
+                                                  alpha_ph:      [1.0]*num_clips})
+
+        # END FOR
+
+        return True
+
+    def _feed(self, sess, coord):
+        """
+        Loop over the dataset indefinitely, keeping at most _max_pending files in the pool
+        """
+        rng        = random.Random(self._shuffle_seed)
+        self._step = float(sess.run(self._video_step))
+
+        try:
+            while not (coord and coord.should_stop()):
+                filenames = list(self._filenames)
+
+                if self._istraining:
+                    rng.shuffle(filenames)
+
+                # END IF
+
+                pending = collections.deque()
+
+                for filename in filenames:
+                    pending.append(self._pool.apply_async(_preprocess_record, (filename,)))
+
+                    if len(pending) >= self._max_pending:
+                        if not self._enqueue(sess, self._wait(pending.popleft(), coord)):
+                            return
+
+                        # END IF
+
+                    # END IF
+
+                # END FOR
+
+                while len(pending) > 0:
+                    if not self._enqueue(sess, self._wait(pending.popleft(), coord)):
+                        return
+
+                    # END IF
+
+                # END WHILE
+
+            # END WHILE
+
+        except (tf.errors.CancelledError, tf.errors.OutOfRangeError):
+            pass
+
+        except Exception as e:
+            if coord:
+                coord.request_stop(e)
+
+            else:
+                raise
+
+            # END IF
+
+        # END TRY
+
+    def _stop_on_request(self, sess, coord):
+        """
+        Unblock the feeding thread and shut the pool down once the coordinator requests a stop
+        """
+        coord.wait_for_stop()
+
+        try:
+            sess.run(self.cancel_op)
+
+        except Exception:
+            pass
+
+        # END TRY
+
+        self._pool.terminate()
+
+
+def load_dataset_numpy(model, num_gpus, batch_size, output_dims, input_dims, seq_length, size, base_data_path, dataset, istraining, clip_length, video_offset, clip_offset, num_clips, clip_stride, video_step, shuffle_seed=0, num_workers=0, verbose=True):
+    """
+    Function load dataset and setup the clip queue, clips are preprocessed by a pool of processes using the model's NumPy preprocessing
+    Args:
+        :model:              tf-activity-recognition framework model object
+        :num_gpus:           Number of gpus to use when training
+        :batch_size:         Number of clips to load into the model each step.
+        :input_dims:         Number of frames used in input
+        :output_dims:        Integer number of classes in current dataset
+        :seq_length:         Length of output sequence expected from LSTM
+        :size:               List detailing height and width of frame
+        :dataset:            Name of dataset being processed
+        :base_data_path:     Full path to root directory containing datasets
+        :istraining:         Boolean variable indicating training/testing phase
+        :clip_length:        Length of clips to cut video into, -1 indicates using the entire video as one clip')
+        :clip_offset:        "none" or "random" indicating where to begin selecting video clips
+        :num_clips:          Number of clips to break video into
+        :clip_stride:        Number of frames that overlap between clips, 0 indicates no overlap and negative values indicate a gap of frames between clips
+        :video_step:         Tensorflow variable indicating the total number of videos (not clips) that have been loaded
+        :shuffle_seed:       Seed integer for random shuffle of files
+        :num_workers:        Number of preprocessing processes, 0 uses one per cpu
+
+    Return:
+        Input data tensor, label tensor and name of loaded data (video/image)
+    """
+    preprocessing = model.numpy_preprocessing()
+
+    if preprocessing is None:
+        print "Preprocessing method " + model.preproc_method + " of model " + model.name + " has no NumPy version, use --preprocBackend tf"
+        exit()
+
+    # END IF
+
+    # Get a list of tfrecords file names from which to pull videos
+    filenames = [os.path.join(base_data_path, f) for f in os.listdir(base_data_path)]
+
+    if num_workers <= 0:
+        num_workers = mp.cpu_count()
+
+    # END IF
+
+    if verbose:
+        print "Number of records available: ", len(filenames)
+        print "Number of preprocessing processes: ", num_workers
+
+    # END IF
+
+    loader_kwargs = {'dataset':      dataset,
+                     'clip_length':  clip_length,
+                     'num_clips':    num_clips,
+                     'clip_offset':  clip_offset,
+                     'video_offset': video_offset,
+                     'clip_stride':  clip_stride,
+                     'input_dims':   input_dims,
+                     'output_dims':  output_dims,
+                     'seq_length':   seq_length,
+                     'size':         size,
+                     'istraining':   istraining}
+
+    # Number of frames actually produced by the model's preprocessing for the current phase
+    clip_dims = model.preprocessed_input_dims(input_dims, istraining)
+
+    # Same queue layout as load_dataset: [[clip_frame_count, height, width, channels], [labels_copied_seqLength], [name_of_video], [video_step], [alpha]]
+    clip_q = tf.FIFOQueue(num_gpus*batch_size*num_workers, dtypes=[tf.float32, tf.int32, tf.string, tf.float32, tf.float32], shapes=[[clip_dims, size[0], size[1], 3],[seq_length],[],[],[]])
+
+    placeholders = [tf.placeholder(tf.float32, [None, clip_dims, size[0], size[1], 3]),
+                    tf.placeholder(tf.int32, [None, seq_length]),
+                    tf.placeholder(tf.string, [None]),
+                    tf.placeholder(tf.float32, [None]),
+                    tf.placeholder(tf.float32, [None])]
+
+    enqueue_op = clip_q.enqueue_many(placeholders)
+
+    # Started with the other queue runners in train.py/test.py after the Session is begun
+    qr = NumpyPreprocessingRunner(clip_q, placeholders, enqueue_op, filenames, num_workers,
+                                  (preprocessing[0], preprocessing[1], loader_kwargs, shuffle_seed), istraining, seq_length, video_step, shuffle_seed)
+    queue_runner.add_queue_runner(qr)
+
+    # Dequeue the required number of clips so that each gpu contains batch_size clips
+    input_data_tensor, labels_tensor, names_tensor, video_step_tensor, alpha_tensor = clip_q.dequeue_many(num_gpus*batch_size)
+
+    return input_data_tensor, labels_tensor, names_tensor
@@ -4,8 +4,12 @@ import numpy      as np
 import tensorflow as tf
 from tensorflow.python.training import queue_runner
 
+from utils.load_dataset_numpy   import load_dataset_numpy
+from utils.clip_cache           import ClipCache, load_dataset_cached, preprocessing_config_hash, deterministic_clips
+from utils.sampling_utils       import random_draw
 
-def load_dataset(model, num_gpus, batch_size, output_dims, input_dims, seq_length, size, base_data_path, dataset, istraining, clip_length, video_offset, clip_offset, num_clips, clip_stride, video_step, preproc_debugging=0, shuffle_seed=0, verbose=True):
+
+def load_dataset(model, num_gpus, batch_size, output_dims, input_dims, seq_length, size, base_data_path, dataset, istraining, clip_length, video_offset, clip_offset, num_clips, clip_stride, video_step, preproc_debugging=0, shuffle_seed=0, verbose=True, preproc_backend='tf', num_workers=0, clip_cache_dir='clip_cache', num_threads=1):
     """
     Function load dataset, setup queue and read data into queue
     Args:
@@ -23,10 +27,28 @@ def load_dataset(model, num_gpus, batch_size, output_dims, input_dims, seq_lengt
         :clip_offset:        "none" or "random" indicating where to begin selecting video clips
         :num_clips:          Number of clips to break video into
         :clip_stride:        Number of frames that overlap between clips, 0 indicates no overlap and negative values indicate a gap of frames between clips
+        :preproc_backend:    'tf' to preprocess clips with tensorflow ops, 'numpy' to preprocess them in a pool of processes (utils/load_dataset_numpy.py)
+        :num_workers:        Number of preprocessing processes used by the numpy backend, 0 uses one per cpu
+        :clip_cache_dir:     Directory of the preprocessed clip cache used during testing (utils/clip_cache.py), '' disables the cache. Unused for random clips (see deterministic_clips)
+        :num_threads:        Number of threads loading and preprocessing videos into the clip queue, more than one does not preserve the order of videos
 
     Return:
         Input data tensor, label tensor and name of loaded data (video/image)
     """
+    # Testing preprocessing is deterministic, so clips are preprocessed once and read back from the clip cache by every later run,
+    # unless the clips start at random or are preprocessed with a random method, which the cache would replay on every run
+    use_clip_cache = (not istraining) and (not preproc_debugging) and clip_cache_dir != '' and deterministic_clips(model, video_offset, clip_offset)
+
+    if verbose and (not istraining) and (not preproc_debugging) and clip_cache_dir != '' and not use_clip_cache:
+        print "Clip cache disabled: testing clips are random (videoOffset, clipOffset or preprocMethod)"
+
+    # END IF
+
+    if preproc_backend == 'numpy' and not use_clip_cache:
+        return load_dataset_numpy(model, num_gpus, batch_size, output_dims, input_dims, seq_length, size, base_data_path, dataset, istraining, clip_length, video_offset, clip_offset, num_clips, clip_stride, video_step, shuffle_seed, num_workers, verbose)
+
+    # END IF
+
     # Get a list of tfrecords file names from which to pull videos
     filenames           = []
     number_of_tfrecords = 0
@@ -42,8 +64,11 @@ def load_dataset(model, num_gpus, batch_size, output_dims, input_dims, seq_lengt
 
     # END IF
 
-    # Create Queue which will read in videos num_gpus at a time (Queue seeded for repeatability of experiments)
-    tfrecord_file_queue = tf.train.string_input_producer(filenames, shuffle=istraining, name='file_q', seed=shuffle_seed)
+    # Create Queue which will read in videos num_gpus at a time (Queue seeded for repeatability of experiments), cached clips are fed in the same order
+    if not use_clip_cache:
+        tfrecord_file_queue = tf.train.string_input_producer(filenames, shuffle=istraining, name='file_q', seed=shuffle_seed)
+
+    # END IF
 
     # Errors occurring in a model's preprocessing function are not properly traced back when using 'clip_q'.
     # If an error occurs stating that "fifo_queue has insufficient elements", then set '--preprocDebugging 1'
@@ -51,14 +76,24 @@ def load_dataset(model, num_gpus, batch_size, output_dims, input_dims, seq_lengt
     if preproc_debugging:
         input_data_tensor, labels_tensor, names_tensor, video_step_tensor, alpha_tensor = _load_video(model, output_dims, input_dims, seq_length, size, base_data_path, dataset, istraining, clip_length, video_offset, clip_offset, num_clips, clip_stride, tfrecord_file_queue, video_step)
 
+    elif use_clip_cache:
+        cache = ClipCache(clip_cache_dir, preprocessing_config_hash(model, input_dims, output_dims, seq_length, size, dataset, clip_length, video_offset, clip_offset, num_clips, clip_stride))
+
+        _fill_clip_cache(model, filenames, cache, output_dims, input_dims, seq_length, size, base_data_path, dataset, clip_length, video_offset, clip_offset, num_clips, clip_stride, verbose)
+
+        input_data_tensor, labels_tensor, names_tensor, alpha_tensor = load_dataset_cached(model, num_gpus, batch_size, input_dims, seq_length, size, filenames, cache, video_step)
+
     else:
         tf.set_random_seed(0) # To ensure the numbers are generated for temporal offset consistently
 
         # Number of threads to be used
-        thread_count = 1
+        thread_count = num_threads
+
+        # Number of frames actually produced by the model's preprocessing for the current phase
+        clip_dims = model.preprocessed_input_dims(input_dims, istraining)
 
         # Initialize queue that will contain multiple clips of the format [[clip_frame_count, height, width, channels], [labels_copied_seqLength], [name_of_video]]
-        clip_q = tf.FIFOQueue(num_gpus*batch_size*thread_count, dtypes=[tf.float32, tf.int32, tf.string, tf.float32, tf.float32], shapes=[[input_dims, size[0], size[1], 3],[seq_length],[],[],[]])
+        clip_q = tf.FIFOQueue(num_gpus*batch_size*thread_count, dtypes=[tf.float32, tf.int32, tf.string, tf.float32, tf.float32], shapes=[[clip_dims, size[0], size[1], 3],[seq_length],[],[],[]])
 
         # Attempts to load num_gpus*batch_size number of clips into queue, if there exist too many clips in a video then this function blocks until the clips are dequeued
         enqueue_op = clip_q.enqueue_many(_load_video(model, output_dims, input_dims, seq_length, size, base_data_path, dataset, istraining, clip_length, video_offset, clip_offset, num_clips, clip_stride, tfrecord_file_queue, video_step))
@@ -82,6 +117,118 @@ def load_dataset(model, num_gpus, batch_size, output_dims, input_dims, seq_lengt
     return input_data_tensor, labels_tensor, names_tensor
 
 
+def load_cascade_dataset(models, batch_size, output_dims, input_dims, seq_length, size, base_data_path, dataset, clip_length, video_offset, clip_offset, num_clips, clip_stride, video_step, verbose=True):
+    """
+    Testing input pipeline of a cascade of models: every video is read and decoded once, then its clips are preprocessed by each model.
+    Neither the clip cache nor the numpy backend are used, each of them holds the clips of a single model
+    Args:
+        :models:     List of tf-activity-recognition framework model objects
+        :input_dims: List of the number of frames used in input by each model
+        :size:       List of the [height, width] of the frames of each model
+        (remaining arguments as in load_dataset)
+
+    Return:
+        List of the input data tensors of each model, label tensor and name of loaded data (video/image)
+    """
+    filenames = [os.path.join(base_data_path, f) for f in os.listdir(base_data_path)]
+
+    if verbose:
+        print "Number of records available: ", len(filenames)
+
+    # END IF
+
+    tfrecord_file_queue = tf.train.string_input_producer(filenames, shuffle=False, name='file_q', seed=0)
+
+    tf.set_random_seed(0) # To ensure the numbers are generated for temporal offset consistently
+
+    clips, height, width, channel, label, name = _read_clips(models[0], dataset, clip_length, video_offset, clip_offset, num_clips, clip_stride, tfrecord_file_queue)
+
+    clips_tensors = []
+
+    for model, model_input_dims, model_size in zip(models, input_dims, size):
+        # Clips are decoded in the channel order of the first model
+        if model.input_channel_order() != models[0].input_channel_order():
+            model_clips = clips[...,::-1]
+
+        else:
+            model_clips = clips
+
+        # END IF
+
+        clips_tensors.append(_preprocess_clips(model, model_clips, height, width, channel, model_input_dims, output_dims, seq_length, model_size, label, False, video_step)[0])
+
+    # END FOR
+
+    num_clips_tensor = tf.shape(clips_tensors[0])[0]
+    labels_tensor    = tf.tile([tf.tile([label], [seq_length])], [num_clips_tensor, 1])
+    names_tensor     = tf.tile([name], [num_clips_tensor])
+
+    clip_shapes = [[model.preprocessed_input_dims(model_input_dims, False), model_size[0], model_size[1], 3] for model, model_input_dims, model_size in zip(models, input_dims, size)]
+
+    clip_q     = tf.FIFOQueue(batch_size, dtypes=[tf.float32]*len(models) + [tf.int32, tf.string], shapes=clip_shapes + [[seq_length], []])
+    enqueue_op = clip_q.enqueue_many(clips_tensors + [labels_tensor, names_tensor])
+
+    queue_runner.add_queue_runner(tf.train.QueueRunner(clip_q, [enqueue_op]))
+
+    outputs = clip_q.dequeue_many(batch_size)
+
+    return outputs[:len(models)], outputs[-2], outputs[-1]
+
+
+def _fill_clip_cache(model, filenames, cache, output_dims, input_dims, seq_length, size, base_data_path, dataset, clip_length, video_offset, clip_offset, num_clips, clip_stride, verbose=True):
+    """
+    Preprocess the testing clips of every record missing from the clip cache with the model's tensorflow preprocessing and store them
+    Args:
+        :filenames: List of tfrecords files
+        :cache:     ClipCache to fill
+        (remaining arguments as in load_dataset)
+    """
+    missing = [filename for filename in filenames if not cache.contains(filename)]
+
+    if verbose:
+        print "Number of records found in the clip cache: ", len(filenames) - len(missing)
+
+    # END IF
+
+    if len(missing) == 0:
+        return
+
+    # END IF
+
+    # Separate graph and session, placed on the cpu, so that the model's graph is unaffected
+    with tf.Graph().as_default():
+        tf.set_random_seed(0) # Same temporal offsets as the uncached clip queue
+
+        # Files are fed one at a time so that each output is matched with the record it came from
+        filename_ph  = tf.placeholder(tf.string, [])
+        file_q       = tf.FIFOQueue(1, [tf.string])
+        enqueue_file = file_q.enqueue(filename_ph)
+        video_step   = tf.Variable(1.0, name='video_step', trainable=False)
+
+        clips_tensor, labels_tensor, names_tensor, video_step_tensor, alpha_tensor = _load_video(model, output_dims, input_dims, seq_length, size, base_data_path, dataset, False, clip_length, video_offset, clip_offset, num_clips, clip_stride, file_q, video_step)
+        alpha_tensor = tf.convert_to_tensor(alpha_tensor, dtype=tf.float32)
+
+        sess = tf.Session(config=tf.ConfigProto(device_count={'GPU': 0}))
+        sess.run(tf.global_variables_initializer())
+
+        for index, filename in enumerate(missing):
+            sess.run(enqueue_file, feed_dict={filename_ph: filename})
+            clips, labels, names, alphas = sess.run([clips_tensor, labels_tensor, names_tensor, alpha_tensor])
+
+            cache.write(filename, clips, labels[0][0], names[0], alphas)
+
+            if verbose and (index+1) % 100 == 0:
+                print "Records added to the clip cache: ", index+1, "/", len(missing)
+
+            # END IF
+
+        # END FOR
+
+        sess.close()
+
+    # END WITH
+
+
 def _load_video(model, output_dims, input_dims, seq_length, size, base_data_path, dataset, istraining, clip_length, video_offset, clip_offset, num_clips, clip_stride, tfrecord_file_queue, video_step):
     """
     Function to load a single video and preprocess its' frames
@@ -104,6 +251,33 @@ def _load_video(model, output_dims, input_dims, seq_length, size, base_data_path
         Input data tensor, label tensor and name of loaded data (video/image)
     """
 
+    clips, height, width, channel, label, name = _read_clips(model, dataset, clip_length, video_offset, clip_offset, num_clips, clip_stride, tfrecord_file_queue)
+
+    # Call preprocessing function related to model chosen that preprocesses each clip as an individual video
+    clips_tensor, alpha_tensor = _preprocess_clips(model, clips, height, width, channel, input_dims, output_dims, seq_length, size, label, istraining, video_step)
+
+    num_clips         = tf.shape(clips_tensor)[0]
+    video_step        = tf.assign_add(video_step, 1)
+    labels_tensor     = tf.tile( [label], [seq_length])
+    names_tensor      = tf.tile( [name], [num_clips])
+    video_step_tensor = tf.tile([video_step], [num_clips])
+
+    """ Reference of shape:
+        clips_tensor shape: [num_clips, input_dims, size[0], size[1], channels]
+    """
+
+    return [clips_tensor, tf.tile([labels_tensor], [num_clips,1]), names_tensor, video_step_tensor, alpha_tensor]
+
+
+def _read_clips(model, dataset, clip_length, video_offset, clip_offset, num_clips, clip_stride, tfrecord_file_queue):
+    """
+    Function to read and decode a single video and cut it into clips, before any preprocessing
+    Args:
+        (arguments as in _load_video)
+
+    Return:
+        Clips tensor [num_clips, clip_length or frames, height, width, channels] in the channel order of model, height, width, channels, label and name of the video
+    """
     # Dequeue video data from queue and convert it from TFRecord format (int64 or bytes)
     features = _read_tfrecords(tfrecord_file_queue)
     frames   = tf.cast(features['Frames'], tf.int32)
@@ -115,10 +289,7 @@ def _load_video(model, output_dims, input_dims, seq_length, size, base_data_path
     name     = features['Name']
 
     # Shape [frames, height, width, channels]
-    input_data_tensor = tf.reshape(tf.decode_raw(features['Data'], tf.uint8), tf.stack([frames,height,width,channel]))
-
-    # BGR to RGB
-    input_data_tensor = input_data_tensor[...,::-1]
+    input_data_tensor = _decode_video(features['Data'], frames, height, width, channel, model.input_channel_order())
 
     # Reduction in fps to 25 for HMDB51 dataset
     if ('HMDB51' in dataset) or ('MIT' in dataset):
@@ -141,7 +312,55 @@ def _load_video(model, output_dims, input_dims, seq_length, size, base_data_path
         model.preprocess_tfrecords input shape: [clip_length or frames, height, width, channels]
     """
 
-    # Call preprocessing function related to model chosen that preprocesses each clip as an individual video
+    return clips, height, width, channel, label, name
+
+
+def _decode_video(data, frames, height, width, channel, channel_order='RGB'):
+    """
+    Function that decodes the raw bytes of a video into frames in the given channel order
+    Args:
+        :data:          String tensor containing the raw uint8 BGR frames
+        :frames:        Number of frames of the video
+        :height:        Frame height
+        :width:         Frame width
+        :channel:       Number of channels
+        :channel_order: 'RGB' or 'BGR', the input_channel_order of the model the frames are preprocessed for
+
+    Return:
+        Video tensor of shape [frames, height, width, channels]
+    """
+    video = tf.reshape(tf.decode_raw(data, tf.uint8), tf.stack([frames,height,width,channel]))
+
+    # BGR to RGB, models whose preprocessing pipeline takes BGR frames convert (or cancel out the conversion) themselves
+    if channel_order == 'RGB':
+        video = video[...,::-1]
+
+    # END IF
+
+    return video
+
+
+def _preprocess_clips(model, clips, height, width, channel, input_dims, output_dims, seq_length, size, label, istraining, video_step):
+    """
+    Function that applies the model's preprocessing to every clip of a video
+    Args:
+        :clips: Tensor of shape [num_clips, clip_length or frames, height, width, channels], the number of clips must be static
+        (remaining arguments as in _load_video)
+
+    Return:
+        Preprocessed clips tensor [num_clips, input_dims, size[0], size[1], channels] and alpha of each clip
+    """
+    # Models declaring a batched preprocessing entry point process all clips at once, per clip preprocessing is the fallback
+    if not hasattr(model, 'store_alpha'):
+        clips_tensor = model.preprocess_tfrecords_batch(clips, tf.shape(clips)[1], height, width, channel, input_dims, output_dims, seq_length, size, label, istraining, video_step)
+
+        if clips_tensor is not None:
+            return clips_tensor, np.array([1.0]*clips.get_shape()[0].value)
+
+        # END IF
+
+    # END IF
+
     if hasattr(model, 'store_alpha'):
         clips_tensor = tf.map_fn(lambda clip: model.preprocess_tfrecords(clip[0], tf.shape(clip[0])[0], height, width,channel, input_dims, output_dims, seq_length, size, label, istraining, video_step),
             (clips, np.array([clips.get_shape()[0].value]*clips.get_shape()[0].value)), dtype=(tf.float32, tf.float32))
@@ -157,17 +376,7 @@ def _load_video(model, output_dims, input_dims, seq_length, size, base_data_path
 
     # END IF
 
-    num_clips         = tf.shape(clips_tensor)[0]
-    video_step        = tf.assign_add(video_step, 1)
-    labels_tensor     = tf.tile( [label], [seq_length])
-    names_tensor      = tf.tile( [name], [num_clips])
-    video_step_tensor = tf.tile([video_step], [num_clips])
-
-    """ Reference of shape:
-        clips_tensor shape: [num_clips, input_dims, size[0], size[1], channels]
-    """
-
-    return [clips_tensor, tf.tile([labels_tensor], [num_clips,1]), names_tensor, video_step_tensor, alpha_tensor]
+    return clips_tensor, alpha_tensor
 
 
 def _read_tfrecords(filename_queue):
@@ -179,11 +388,23 @@ def _read_tfrecords(filename_queue):
     Return:
         Dictionary containing features of a single sample
     """
-    feature_dict = {}
-    reader       = tf.TFRecordReader()
+    reader = tf.TFRecordReader()
 
     _, serialized_example = reader.read(filename_queue)
 
+    return _parse_example(serialized_example)
+
+
+def _parse_example(serialized_example):
+    """
+    Function that parses the features of a single serialized tfrecords sample
+    Args:
+        :serialized_example: String tensor containing a serialized tf.train.Example
+
+    Return:
+        Dictionary containing features of a single sample
+    """
+    feature_dict = {}
 
     feature_dict['Label']    = tf.FixedLenFeature([], tf.int64)
     feature_dict['Data']     = tf.FixedLenFeature([], tf.string)
@@ -214,7 +435,7 @@ def _extract_clips(video, frames, num_clips, clip_offset, clip_length, video_off
         A tensor containing the clip(s) extracted from the video (shape [clip_number, clip_frames, height, width, channel])
     """
     if video_offset == 'random':
-        video_start = tf.random_uniform([], maxval=frames-1, dtype=tf.int32)
+        video_start = random_draw([], 0, frames-1, dtype=tf.int32)
 
     else:
         video_start = 0
@@ -224,7 +445,7 @@ def _extract_clips(video, frames, num_clips, clip_offset, clip_length, video_off
                         lambda: _loop_video_with_offset(video, video, 0, frames, height, width, channel, clip_length),
                         lambda: video)
 
-        clip_begin = tf.random_uniform([num_clips], minval=0, maxval=tf.shape(video)[0]-clip_length+1, dtype=tf.int32)
+        clip_begin = random_draw([num_clips], 0, tf.shape(video)[0]-clip_length+1, dtype=tf.int32)
         rs = tf.reshape(clip_begin, [num_clips,1,1,1])
         video = tf.to_int32(video)
         clips = tf.map_fn(lambda clip_start: video[clip_start[0][0][0]:clip_start[0][0][0]+clip_length], rs)
@@ -389,10 +610,7 @@ def load_dataset_without_preprocessing(base_data_path, dataset, istraining, vid_
     name     = features['Name']
 
     # Shape [frames, height, width, channels]
-    input_data_tensor = tf.reshape(tf.decode_raw(features['Data'], tf.uint8), tf.stack([frames,height,width,channel]))
-
-    # BGR to RGB
-    input_data_tensor = input_data_tensor[...,::-1]
+    input_data_tensor = _decode_video(features['Data'], frames, height, width, channel)
 
     # Reduction in fps to 25 for HMDB51 dataset
     if 'HMDB51' in dataset:
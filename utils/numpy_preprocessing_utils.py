@@ -0,0 +1,411 @@
+"""
+NUMPY TWINS OF THE PREPROCESSING UTILITIES IN preprocessing_utils.py AND load_dataset_tfrecords.py.
+USED BY THE PROCESS POOL PREPROCESSING BACKEND (utils/load_dataset_numpy.py), RESULTS MATCH THE TENSORFLOW OPS THEY MIRROR.
+"""
+
+import numpy as np
+
+from utils.sampling_utils import sampling_indices, deterministic_draws
+
+
+def _bilinear(clip, y_coords, x_coords):
+    """
+    Bilinear sampling of a single image or an entire clip at the given row and column coordinates
+    Args:
+        :clip:     Array of shape [height, width, channels] or [frames, height, width, channels]
+        :y_coords: Float32 vector of row coordinates
+        :x_coords: Float32 vector of column coordinates
+
+    Return:
+        Float32 array of shape [..., len(y_coords), len(x_coords), channels]
+    """
+    clip = np.asarray(clip, dtype=np.float32)
+
+    def _interpolation(coords, in_size):
+        low  = np.floor(coords).astype(np.int32)
+        high = np.minimum(np.ceil(coords).astype(np.int32), in_size - 1)
+        lerp = (coords - low).astype(np.float32)
+        return low, high, lerp
+
+    # END DEF
+
+    top, bottom, y_lerp = _interpolation(y_coords, clip.shape[-3])
+    left, right, x_lerp = _interpolation(x_coords, clip.shape[-2])
+
+    x_lerp = x_lerp.reshape(-1, 1)
+    y_lerp = y_lerp.reshape(-1, 1, 1)
+
+    top_rows    = clip[..., top, :, :]
+    bottom_rows = clip[..., bottom, :, :]
+
+    top_interp    = top_rows[..., left, :] + (top_rows[..., right, :] - top_rows[..., left, :]) * x_lerp
+    bottom_interp = bottom_rows[..., left, :] + (bottom_rows[..., right, :] - bottom_rows[..., left, :]) * x_lerp
+
+    return top_interp + (bottom_interp - top_interp) * y_lerp
+
+
+def resize(clip, new_height, new_width):
+    """
+    Bilinear resize of a single image or an entire clip, identical to tf.image.resize_bilinear(align_corners=True)
+    Args:
+        :clip:       Array of shape [height, width, channels] or [frames, height, width, channels]
+        :new_height: Height of the output
+        :new_width:  Width of the output
+
+    Return:
+        Float32 array with the new height and width
+    """
+    def _coords(in_size, out_size):
+        scale = np.float32(in_size - 1) / np.float32(out_size - 1) if out_size > 1 else np.float32(0.)
+        return np.arange(out_size, dtype=np.float32) * scale
+
+    # END DEF
+
+    shape = np.shape(clip)
+
+    return _bilinear(clip, _coords(shape[-3], new_height), _coords(shape[-2], new_width))
+
+
+def crop_and_resize(clip, box, crop_height, crop_width):
+    """
+    Crop the same box out of every frame of a clip and resize it, identical to tf.image.crop_and_resize
+    Args:
+        :clip:        Array of shape [frames, height, width, channels]
+        :box:         Normalized [y1, x1, y2, x2] coordinates, x1 > x2 produces a mirrored crop
+        :crop_height: Height of the output
+        :crop_width:  Width of the output
+
+    Return:
+        Float32 clip of shape [frames, crop_height, crop_width, channels]
+    """
+    def _coords(start, end, in_size, out_size):
+        start = np.float32(start) * np.float32(in_size - 1)
+        end   = np.float32(end) * np.float32(in_size - 1)
+
+        if out_size > 1:
+            return start + np.arange(out_size, dtype=np.float32) * (end - start) / np.float32(out_size - 1)
+
+        # END IF
+
+        return np.asarray([0.5 * (start + end)], dtype=np.float32)
+
+    # END DEF
+
+    return _bilinear(clip, _coords(box[0], box[2], clip.shape[1], crop_height), _coords(box[1], box[3], clip.shape[2], crop_width))
+
+
+def smallest_size_at_least(height, width, smallest_side):
+    """
+    Computes new shape with the smallest side equal to smallest_side while preserving the aspect ratio
+    Args:
+        :height:        Current height
+        :width:         Current width
+        :smallest_side: Size of the smallest side after resize
+
+    Return:
+        New height and width
+    """
+    height        = np.float32(height)
+    width         = np.float32(width)
+    smallest_side = np.float32(smallest_side)
+
+    if height > width:
+        scale = smallest_side / width
+
+    else:
+        scale = smallest_side / height
+
+    # END IF
+
+    return int(height * scale), int(width * scale)
+
+
+def aspect_preserving_resize(clip, smallest_side):
+    """
+    Resize a clip preserving the original aspect ratio
+    Args:
+        :clip:          Array of shape [frames, height, width, channels]
+        :smallest_side: Size of the smallest side after resize
+
+    Return:
+        Resized float32 clip
+    """
+    new_height, new_width = smallest_size_at_least(clip.shape[1], clip.shape[2], smallest_side)
+
+    return resize(clip, new_height, new_width)
+
+
+def crop_clip(clip, offset_height, offset_width, crop_height, crop_width):
+    """
+    Crop every frame of a clip using the provided offsets and sizes
+    Args:
+        :clip:          Array of shape [frames, height, width, channels]
+        :offset_height: Height offset
+        :offset_width:  Width offset
+        :crop_height:   Height of the crop
+        :crop_width:    Width of the crop
+
+    Return:
+        Cropped clip
+    """
+    offset_height = int(offset_height)
+    offset_width  = int(offset_width)
+
+    return clip[:, offset_height:offset_height+int(crop_height), offset_width:offset_width+int(crop_width), :]
+
+
+def central_crop_clip(clip, crop_height, crop_width):
+    """
+    Central crop of every frame of a clip
+    Args:
+        :clip:        Array of shape [frames, height, width, channels]
+        :crop_height: Height of the crop
+        :crop_width:  Width of the crop
+
+    Return:
+        Cropped clip
+    """
+    return crop_clip(clip, (clip.shape[1] - crop_height) // 2, (clip.shape[2] - crop_width) // 2, crop_height, crop_width)
+
+
+def random_integer(low, high, size=None):
+    """
+    np.random.randint, or low when deterministic draws are enabled (see sampling_utils.set_deterministic_draws)
+    Args:
+        :low:  Lower bound of the range (inclusive)
+        :high: Upper bound of the range (exclusive)
+        :size: Number of integers drawn, None for a single integer
+
+    Return:
+        Integer or int array of length size
+    """
+    if deterministic_draws():
+        return low if size is None else np.full(size, low, dtype=np.int64)
+
+    # END IF
+
+    return np.random.randint(low, high, size=size)
+
+
+def random_fraction():
+    """
+    np.random.uniform() over [0, 1), or 0. when deterministic draws are enabled (see sampling_utils.set_deterministic_draws)
+    """
+    if deterministic_draws():
+        return 0.
+
+    # END IF
+
+    return np.random.uniform()
+
+
+def random_crop_clip(clip, crop_height, crop_width):
+    """
+    Crop every frame of a clip at the same random offset
+    Args:
+        :clip:        Array of shape [frames, height, width, channels]
+        :crop_height: Height of the crop
+        :crop_width:  Width of the crop
+
+    Return:
+        Cropped clip
+    """
+    offset_height = random_integer(0, max(clip.shape[1] - crop_height, 1))
+    offset_width  = random_integer(0, max(clip.shape[2] - crop_width, 1))
+
+    return crop_clip(clip, offset_height, offset_width, crop_height, crop_width)
+
+
+def random_flip_left_right_clip(clip):
+    """
+    Flip the entire clip horizontally with a 50% likelihood
+    Args:
+        :clip: Array of shape [frames, height, width, channels]
+
+    Return:
+        Float32 clip, possibly flipped
+    """
+    clip = np.asarray(clip, dtype=np.float32)
+
+    if random_fraction() >= 0.5:
+        clip = clip[:, :, ::-1, :]
+
+    # END IF
+
+    return clip
+
+
+def oversample(image, crop_height, crop_width):
+    """
+    Crop a frame into the four corners and center, followed by their mirrored versions (same order as preprocessing_utils.oversample)
+    Args:
+        :image:       Array of shape [height, width, channels]
+        :crop_height: Height of the crops
+        :crop_width:  Width of the crops
+
+    Return:
+        Array of shape [10, crop_height, crop_width, channels]
+    """
+    offset_h = image.shape[0] - crop_height
+    offset_w = image.shape[1] - crop_width
+    crops    = []
+
+    for h in [0, offset_h]:
+        for w in [0, offset_w]:
+            crops.append(image[h:h+crop_height, w:w+crop_width])
+
+        # END FOR
+
+    # END FOR
+
+    crops.append(central_crop_clip(image[np.newaxis], crop_height, crop_width)[0])
+    crops.extend([crop[:, ::-1, :] for crop in crops])
+
+    return np.stack(crops)
+
+
+def normalize_clip(clip, means, stds=None):
+    """
+    Subtract per-channel means from (and optionally divide per-channel standard deviations into) an entire clip
+    Args:
+        :clip:  Array of shape [frames, height, width, channels]
+        :means: C-vector or array broadcastable to clip
+        :stds:  Optional C-vector
+
+    Return:
+        Normalized float32 clip
+    """
+    clip = np.asarray(clip, dtype=np.float32) - np.asarray(means, dtype=np.float32)
+
+    if stds is not None:
+        clip = clip * (1.0 / np.asarray(stds, dtype=np.float32))
+
+    # END IF
+
+    return clip
+
+
+def temporal_resample(video, sample_dims, frame_count, alpha=1.0):
+    """
+    Resample a video along time at constant rate alpha
+    Args:
+        :video:       Array of shape [frames, height, width, channels]
+        :sample_dims: Number of frames to be provided as input to model
+        :frame_count: Total number of frames
+        :alpha:       Relative sampling rate
+
+    Return:
+        Resampled video
+    """
+    if (alpha == 1.0) and (sample_dims == frame_count):
+        return video
+
+    # END IF
+
+    return video[sampling_indices(frame_count, sample_dims, alpha)]
+
+
+def loop_video_with_offset(offset_tensor, input_data_tensor, offset_frames, frames, footprint):
+    """
+    Loop the video the number of times necessary for the number of frames to be > footprint
+    Args:
+        :offset_tensor:     Raw input data from offset frame number
+        :input_data_tensor: Raw input data
+        :offset_frames:     Number of frames in offset_tensor
+        :frames:            Total number of frames
+        :footprint:         Total length of video to be extracted before sampling down
+
+    Return:
+        Looped video
+    """
+    loop_factor = int((footprint - offset_frames) / float(frames) + 1)
+
+    return np.concatenate([offset_tensor, np.tile(input_data_tensor, [loop_factor, 1, 1, 1])], axis=0)
+
+
+def reduce_fps(video, frame_count):
+    """
+    Drop frames to match 25 fps from 30 fps captured videos
+    Args:
+        :video:       Array containing video frames
+        :frame_count: Total number of frames in the video
+
+    Return:
+        Video with reduced number of frames and the new frame count
+    """
+    remove_count = int(np.ceil(frame_count / 6.))
+    indices      = np.tile(np.arange(5), remove_count) + np.repeat(np.arange(remove_count), 5) * 6
+
+    if frame_count != remove_count * 6:
+        remove_count -= 1
+
+    # END IF
+
+    output_frames = frame_count - remove_count
+
+    return video[indices[:output_frames]], output_frames
+
+
+def extract_clips(video, frames, num_clips, clip_offset, clip_length, video_offset, clip_stride):
+    """
+    Extract clips from a video based off of clip specifications (mirrors _extract_clips in load_dataset_tfrecords.py)
+    Args:
+        :video:        Array of shape [frames, height, width, channels]
+        :frames:       The number of frames of the video
+        :num_clips:    Number of clips to break video into
+        :clip_offset:  "none" or "random" indicating where to begin selecting video clips
+        :clip_length:  Length of clips to cut video into
+        :video_offset: "none" or "random" indicating where in the video to begin
+        :clip_stride:  Number of frames that overlap between clips
+
+    Return:
+        Array of shape [clip_number, clip_length, height, width, channels]
+    """
+    if video_offset == 'random':
+        video_start = random_integer(0, max(frames - 1, 1))
+
+    else:
+        video_start = 0
+
+    # END IF
+
+    if clip_offset == 'random':
+        if clip_length > frames:
+            video = loop_video_with_offset(video, video, 0, frames, clip_length)
+
+        # END IF
+
+        clip_begin = random_integer(0, video.shape[0] - clip_length + 1, size=num_clips)
+
+    else:
+        if num_clips > 0:
+            frames_needed = clip_length + (clip_length - clip_stride) * (num_clips - 1)
+
+            if frames_needed > frames - video_start:
+                video = loop_video_with_offset(video[video_start:], video, frames - video_start, frames, frames_needed)
+
+            else:
+                video = video[video_start:]
+
+            # END IF
+
+            clip_begin = np.arange(0, frames_needed, clip_length - clip_stride)[:num_clips]
+
+        else:
+            if clip_length > frames - video_start:
+                video           = loop_video_with_offset(video[video_start:], video, frames - video_start, frames, clip_length + video_start)
+                number_of_clips = 1
+
+            else:
+                video           = video[video_start:]
+                number_of_clips = (frames - video_start - clip_length) // (clip_length - clip_stride) + 1
+
+            # END IF
+
+            clip_begin = np.arange(0, number_of_clips * (clip_length - clip_stride), clip_length - clip_stride)[:num_clips]
+
+        # END IF
+
+    # END IF
+
+    return np.stack([video[begin:begin+clip_length] for begin in clip_begin])
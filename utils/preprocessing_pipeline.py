@@ -0,0 +1,416 @@
+"""
+DECLARATIVE PREPROCESSING PIPELINES. MODELS DECLARE THE SEQUENCE OF CLIP LEVEL STAGES THEY NEED, WHICH IS COMPILED
+INTO A MINIMAL SEQUENCE OF OPS OVER THE ENTIRE CLIP (NO PER-FRAME tf.map_fn) BEFORE THE GRAPH IS BUILT:
+    - channel flips are moved as late as possible and flips that cancel out are dropped
+    - per-channel normalization is moved after crops and flips so that it runs on fewer pixels
+    - a resize directly followed by a crop is fused into a single crop_and_resize sampling only the cropped region
+    - casts to float are moved as late as possible and dropped when a later stage already produces floats
+A compiled pipeline is applied to a single clip or, with batch, to all clips of a video at once.
+"""
+
+from __future__ import absolute_import
+
+import numpy      as np
+import tensorflow as tf
+
+from utils.preprocessing_utils import normalize_clip, smallest_size_at_least
+from utils.sampling_utils      import random_draw
+
+# Stages that do not depend on the order of the channels
+_CHANNEL_AGNOSTIC = ['cast', 'resize', 'aspect_resize', 'central_crop', 'random_crop', 'random_flip', 'resize_crop']
+
+# Stages that only select or move pixels and therefore work on any dtype
+_DTYPE_AGNOSTIC   = ['channel_flip', 'central_crop', 'random_crop', 'random_flip']
+
+# Stages whose output is float32 whatever their input dtype
+_FLOAT_OUTPUT     = ['resize', 'aspect_resize', 'resize_crop', 'normalize']
+
+
+class PreprocessingPipeline(object):
+    """
+    Ordered list of clip level preprocessing stages, compiled on first call
+    """
+
+    def __init__(self, input_order='RGB'):
+        """
+        Args:
+            :input_order: Channel order of the clips passed to the pipeline, 'BGR' (order stored in the tfrecords) prepends a conversion to RGB
+        """
+        self._stages   = []
+        self._compiled = None
+
+        if input_order == 'BGR':
+            self.channel_flip()
+
+        # END IF
+
+    def _add(self, stage):
+        self._stages.append(stage)
+        self._compiled = None
+        return self
+
+    def cast(self, dtype=tf.float32):
+        """ Cast the clip to dtype """
+        return self._add({'op': 'cast', 'dtype': dtype})
+
+    def channel_flip(self):
+        """ Reverse the order of the channels (RGB <-> BGR) """
+        return self._add({'op': 'channel_flip'})
+
+    def resize(self, height, width):
+        """ Bilinear resize (align_corners) of every frame to height x width """
+        return self._add({'op': 'resize', 'height': height, 'width': width})
+
+    def aspect_resize(self, smallest_side):
+        """ Bilinear resize (align_corners) of every frame so that its smallest side equals smallest_side """
+        return self._add({'op': 'aspect_resize', 'smallest_side': smallest_side})
+
+    def central_crop(self, height, width):
+        """ Central crop of every frame """
+        return self._add({'op': 'central_crop', 'height': height, 'width': width})
+
+    def random_crop(self, height, width, probability=1.0):
+        """ Crop every frame at the same random offset with the given probability, otherwise central crop """
+        return self._add({'op': 'random_crop', 'height': height, 'width': width, 'probability': probability})
+
+    def random_flip(self):
+        """ Flip the entire clip horizontally with a 50% likelihood """
+        return self._add({'op': 'random_flip'})
+
+    def normalize(self, means, stds=None):
+        """ Subtract means from (and optionally divide stds into) the clip, C-vectors or arrays broadcastable to the clip in RGB order """
+        return self._add({'op': 'normalize', 'means': means, 'stds': stds})
+
+    def custom(self, fn, channel_agnostic=False, float_input=True, float_output=False):
+        """
+        Model specific stage applying fn to the entire clip, the flags describe what the compiler may move across it
+        Args:
+            :fn:               Function taking and returning a clip tensor
+            :channel_agnostic: fn does not depend on the order of the channels
+            :float_input:      fn requires a float32 input
+            :float_output:     fn always returns float32
+        """
+        return self._add({'op': 'custom', 'fn': fn, 'channel_agnostic': channel_agnostic, 'float_input': float_input, 'float_output': float_output})
+
+    def compile(self):
+        """
+        Return: Optimized list of stages
+        """
+        if self._compiled is None:
+            stages = _sink_channel_flips(list(self._stages))
+            stages = _sink_normalization(stages)
+            stages = _fuse_resize_crop(stages)
+            stages = _late_casts(stages)
+
+            self._compiled = stages
+
+        # END IF
+
+        return self._compiled
+
+    def describe(self, compiled=True):
+        """
+        Return: Names of the (compiled) stages, for debugging and benchmarking
+        """
+        stages = self.compile() if compiled else self._stages
+
+        return [stage['op'] for stage in stages]
+
+    def __call__(self, clip):
+        """
+        Apply the compiled pipeline to a clip tensor of shape [frames, height, width, channels]
+        Return: Float32 preprocessed clip
+        """
+        for stage in self.compile():
+            clip = _STAGE_OPS[stage['op']](clip, stage)
+
+        # END FOR
+
+        return tf.to_float(clip) if clip.dtype != tf.float32 else clip
+
+    def batch(self, clips):
+        """
+        Apply the compiled pipeline to every clip of a tensor of shape [num_clips, frames, height, width, channels] at once.
+        Deterministic spatial stages run on all frames of all clips together, random and custom stages draw or run separately for each clip.
+        Return: Float32 preprocessed clips
+        """
+        for stage in self.compile():
+            clips = _BATCH_STAGE_OPS[stage['op']](clips, stage)
+
+        # END FOR
+
+        return tf.to_float(clips) if clips.dtype != tf.float32 else clips
+
+
+def _is_channel_agnostic(stage):
+    return stage['op'] in _CHANNEL_AGNOSTIC or (stage['op'] == 'custom' and stage['channel_agnostic'])
+
+def _is_dtype_agnostic(stage):
+    return stage['op'] in _DTYPE_AGNOSTIC or (stage['op'] == 'custom' and not stage['float_input'])
+
+def _has_float_output(stage):
+    return stage['op'] in _FLOAT_OUTPUT or (stage['op'] == 'custom' and stage['float_output'])
+
+def _is_per_channel(values):
+    return values is None or np.ndim(values) <= 1
+
+
+def _reverse_channels(values):
+    """
+    Reverse the channel axis of normalization constants, None and scalars are returned unchanged
+    """
+    if values is None or np.ndim(values) == 0:
+        return values
+
+    # END IF
+
+    return np.asarray(values)[...,::-1]
+
+
+def _sink_channel_flips(stages):
+    """
+    Move every channel flip forward past channel agnostic stages, reversing normalization constants it crosses,
+    so that pairs of flips meet and cancel. A remaining flip is emitted before the first stage that depends on the channel order.
+    """
+    output  = []
+    flipped = False
+
+    for stage in stages:
+        if stage['op'] == 'channel_flip':
+            flipped = not flipped
+            continue
+
+        # END IF
+
+        if flipped and stage['op'] == 'normalize':
+            stage = dict(stage, means=_reverse_channels(stage['means']), stds=_reverse_channels(stage['stds']))
+
+        elif flipped and not _is_channel_agnostic(stage):
+            output.append({'op': 'channel_flip'})
+            flipped = False
+
+        # END IF
+
+        output.append(stage)
+
+    # END FOR
+
+    if flipped:
+        output.append({'op': 'channel_flip'})
+
+    # END IF
+
+    return output
+
+
+def _sink_normalization(stages):
+    """
+    Move per-channel normalization after crops and flips, which only select pixels
+    """
+    stages = list(stages)
+    moved  = True
+
+    while moved:
+        moved = False
+
+        for index in range(len(stages) - 1):
+            stage = stages[index]
+
+            if stage['op'] == 'normalize' and _is_per_channel(stage['means']) and _is_per_channel(stage['stds']) and \
+               stages[index+1]['op'] in ['central_crop', 'random_crop', 'random_flip']:
+                stages[index], stages[index+1] = stages[index+1], stage
+                moved = True
+
+            # END IF
+
+        # END FOR
+
+    # END WHILE
+
+    return stages
+
+
+def _fuse_resize_crop(stages):
+    """
+    Fuse a resize directly followed by a crop into one crop_and_resize. Both sample exactly the same points of the original frame.
+    """
+    output = []
+
+    for stage in stages:
+        if len(output) > 0 and output[-1]['op'] in ['resize', 'aspect_resize'] and stage['op'] in ['central_crop', 'random_crop']:
+            output[-1] = {'op': 'resize_crop', 'resize': output[-1], 'height': stage['height'], 'width': stage['width'],
+                          'probability': stage.get('probability', 0.0)}
+
+        else:
+            output.append(stage)
+
+        # END IF
+
+    # END FOR
+
+    return output
+
+
+def _late_casts(stages):
+    """
+    Move every cast as late as possible: past dtype agnostic stages, dropped when it reaches a stage producing floats,
+    otherwise emitted before the first stage requiring a float input (or at the end of the pipeline)
+    """
+    output  = []
+    pending = None
+
+    for stage in stages:
+        if stage['op'] == 'cast':
+            pending = stage
+            continue
+
+        # END IF
+
+        if pending is not None:
+            if _has_float_output(stage) and pending['dtype'] == tf.float32:
+                pending = None
+
+            elif not _is_dtype_agnostic(stage):
+                output.append(pending)
+                pending = None
+
+            # END IF
+
+        # END IF
+
+        output.append(stage)
+
+    # END FOR
+
+    if pending is not None:
+        output.append(pending)
+
+    # END IF
+
+    return output
+
+
+def _resized_dims(clip, stage):
+    """
+    Return: Height and width of the frames of clip after the resize described by stage
+    """
+    if stage['op'] == 'resize':
+        return stage['height'], stage['width']
+
+    # END IF
+
+    shape = tf.shape(clip)
+
+    return smallest_size_at_least(shape[1], shape[2], stage['smallest_side'])
+
+
+def _crop_offsets(height, width, crop_height, crop_width, probability):
+    """
+    Return: Height and width offsets of a crop, random (same distribution as random_crop_clip) with the given probability, otherwise central
+    """
+    def _central():
+        return tf.to_int32((height - crop_height) // 2), tf.to_int32((width - crop_width) // 2)
+
+    def _random():
+        return tf.to_int32(random_draw([], 0, tf.to_float(height - crop_height))), tf.to_int32(random_draw([], 0, tf.to_float(width - crop_width)))
+
+    # END DEF
+
+    if probability >= 1.0:
+        return _random()
+
+    elif probability <= 0.0:
+        return _central()
+
+    # END IF
+
+    return tf.cond(tf.less(random_draw([], 0, 1), probability), _random, _central)
+
+
+def _crop(clip, stage):
+    shape = tf.shape(clip)
+    offset_height, offset_width = _crop_offsets(shape[1], shape[2], stage['height'], stage['width'], stage.get('probability', 0.0))
+
+    return tf.slice(clip, tf.stack([0, offset_height, offset_width, 0]), [-1, stage['height'], stage['width'], -1])
+
+
+def _resize(clip, stage):
+    return tf.image.resize_bilinear(clip, tf.stack(_resized_dims(clip, stage)), align_corners=True)
+
+
+def _resize_crop(clip, stage):
+    """
+    Crop window of the resized frame expressed as a normalized box of the original frame and sampled with crop_and_resize
+    """
+    resized_height, resized_width = _resized_dims(clip, stage['resize'])
+    offset_height, offset_width   = _crop_offsets(resized_height, resized_width, stage['height'], stage['width'], stage['probability'])
+
+    scale_height = tf.to_float(resized_height - 1)
+    scale_width  = tf.to_float(resized_width - 1)
+
+    box = tf.stack([tf.to_float(offset_height) / scale_height,
+                    tf.to_float(offset_width) / scale_width,
+                    tf.to_float(offset_height + stage['height'] - 1) / scale_height,
+                    tf.to_float(offset_width + stage['width'] - 1) / scale_width])
+
+    num_frames = tf.shape(clip)[0]
+
+    return tf.image.crop_and_resize(clip, tf.tile([box], [num_frames, 1]), tf.range(num_frames), [stage['height'], stage['width']])
+
+
+def _random_flip(clip, stage):
+    to_flip = random_draw([], 0, 1)
+
+    return tf.cond(tf.greater_equal(to_flip, 0.5), lambda: clip[:,:,::-1,:], lambda: clip)
+
+
+def _fold_clips(op):
+    """
+    Return: Version of a frame level op applied to [num_clips, frames, height, width, channels] by merging the clip and frame axes
+    """
+    def _batch_op(clips, stage):
+        shape  = tf.shape(clips)
+        output = op(tf.reshape(clips, tf.concat([[-1], shape[2:]], 0)), stage)
+
+        return tf.reshape(output, tf.concat([shape[:2], tf.shape(output)[1:]], 0))
+
+    # END DEF
+
+    return _batch_op
+
+
+def _each_clip(op):
+    """
+    Return: Version of a clip level op applied separately to each clip of [num_clips, frames, height, width, channels]
+    """
+    def _batch_op(clips, stage):
+        dtype = tf.float32 if _has_float_output(stage) else clips.dtype
+
+        return tf.map_fn(lambda clip: op(clip, stage), clips, dtype=dtype)
+
+    # END DEF
+
+    return _batch_op
+
+
+_STAGE_OPS = {'cast':          lambda clip, stage: tf.cast(clip, stage['dtype']),
+              'channel_flip':  lambda clip, stage: clip[...,::-1],
+              'resize':        _resize,
+              'aspect_resize': _resize,
+              'central_crop':  _crop,
+              'random_crop':   _crop,
+              'resize_crop':   _resize_crop,
+              'random_flip':   _random_flip,
+              'normalize':     lambda clip, stage: normalize_clip(clip, stage['means'], stage['stds']),
+              'custom':        lambda clip, stage: stage['fn'](clip)}
+
+_BATCH_STAGE_OPS = {'cast':          _STAGE_OPS['cast'],
+                    'channel_flip':  _STAGE_OPS['channel_flip'],
+                    'resize':        _fold_clips(_resize),
+                    'aspect_resize': _fold_clips(_resize),
+                    'central_crop':  _fold_clips(_crop),
+                    'random_crop':   _each_clip(_crop),
+                    'resize_crop':   _each_clip(_resize_crop),
+                    'random_flip':   _each_clip(_random_flip),
+                    'normalize':     _STAGE_OPS['normalize'],
+                    'custom':        _each_clip(_STAGE_OPS['custom'])}
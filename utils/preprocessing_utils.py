@@ -39,6 +39,8 @@ www.robots.ox.ac.uk/~vgg/research/very_deep/
 import tensorflow as tf
 import numpy      as np
 
+from utils.sampling_utils import temporal_resample, temporal_indices, resampling_alpha
+
 # Imagenet mean rgb values
 # Used for normalization in models pretrained on imagenet
 _R_MEAN = 123.68
@@ -281,6 +283,31 @@ def oversample(images, crop_dims):
     return tf.convert_to_tensor(crops)
 
 
+def oversample_clip(clip, crop_height, crop_width):
+    """
+    Crop every frame of a clip into the four corners and center, followed by their mirrored versions, without a per-frame tf.map_fn.
+    Crops are returned frame by frame in the same order as oversample.
+    Args:
+        :clip:        Tensor of shape [frames, height, width, channels]
+        :crop_height: Height of the crops
+        :crop_width:  Width of the crops
+
+    Return:
+        :crops:       Tensor of shape [frames*10, crop_height, crop_width, channels]
+    """
+    shape    = tf.shape(clip)
+    offset_h = shape[1] - crop_height
+    offset_w = shape[2] - crop_width
+
+    offsets = [(0, 0), (0, offset_w), (offset_h, 0), (offset_h, offset_w), (offset_h // 2, offset_w // 2)]
+    crops   = [tf.slice(clip, tf.stack([0, h, w, 0]), [-1, crop_height, crop_width, -1]) for h, w in offsets]
+
+    # Mirror the crops
+    crops  += [crop[:,:,::-1,:] for crop in crops]
+
+    return tf.reshape(tf.stack(crops, axis=1), tf.stack([-1, crop_height, crop_width, shape[3]]))
+
+
 def central_crop(image_list, crop_height, crop_width):
   """Performs central crops of the given image list.
   Args:
@@ -326,10 +353,31 @@ def mean_image_subtraction(image, means):
   if len(means) != num_channels:
     raise ValueError('len(means) must match the number of channels')
 
-  channels = tf.split(axis=2, num_or_size_splits=num_channels, value=image)
-  for i in range(num_channels):
-    channels[i] -= means[i]
-  return tf.concat(axis=2, values=channels)
+  return normalize_clip(image, means)
+
+
+def normalize_clip(clip, means, stds=None):
+    """
+    Subtract per-channel means from (and optionally divide per-channel standard deviations into) an entire clip.
+    The vectors are broadcast over all leading dimensions, so the whole clip is normalized by a single elementwise op
+    instead of splitting, subtracting and concatenating channels frame by frame.
+    Args:
+        :clip:  Tensor of shape [frames, height, width, channels] (any rank whose trailing dimensions match means)
+        :means: C-vector, or any array broadcastable to the trailing dimensions of clip, of values to subtract
+        :stds:  Optional C-vector of values to divide by after the subtraction
+
+    Return:
+        Normalized float32 clip with the same shape as the input
+    """
+    clip = tf.to_float(clip)
+    clip = tf.subtract(clip, tf.constant(np.asarray(means, dtype=np.float32)))
+
+    if stds is not None:
+        clip = tf.multiply(clip, tf.constant(1.0 / np.asarray(stds, dtype=np.float32)))
+
+    # END IF
+
+    return clip
 
 
 def smallest_size_at_least(height, width, smallest_side):
@@ -488,15 +536,7 @@ def resample_input(video, sample_dims, frame_count, alpha):
     Return:
         Sampled video
     """
-
-    sample_dims = tf.cast(sample_dims, tf.float32)
-    indices = tf.range(start=0., limit=sample_dims, delta=1., dtype=tf.float32)
-    r_alpha = alpha * tf.cast(frame_count, tf.float32) / sample_dims
-    indices = tf.multiply(tf.tile([r_alpha], [tf.cast(sample_dims, tf.int32)]), indices)
-    indices = tf.clip_by_value(indices, 0., tf.cast(frame_count-1, tf.float32))
-    indices = tf.cast(indices, tf.int32)
-    output  = tf.gather(video, tf.convert_to_tensor(indices))
-    return output
+    return temporal_resample(video, sample_dims, frame_count, alpha, method='cvr')[0]
 
 def resample_model(video, sample_dims, frame_count, alpha):
     """Return video sampled at uniform rate
@@ -508,14 +548,7 @@ def resample_model(video, sample_dims, frame_count, alpha):
     Return:
         Sampled video
     """
-
-    indices = tf.range(start=0., limit=float(sample_dims), delta=1., dtype=tf.float32)
-    r_alpha = alpha * tf.cast(frame_count, tf.float32) / float(sample_dims)
-    indices = tf.multiply(tf.tile([r_alpha], [int(sample_dims)]), indices)
-    indices = tf.clip_by_value(indices, 0., tf.cast(frame_count-1, tf.float32))
-    indices = tf.cast(indices, tf.int32)
-    output  = tf.gather(video, tf.convert_to_tensor(indices))
-    return output
+    return temporal_resample(video, sample_dims, frame_count, alpha, method='cvr')[0]
 
 
 def resample_model_sinusoidal(video, sample_dims, frame_count, tracker):
@@ -529,18 +562,4 @@ def resample_model_sinusoidal(video, sample_dims, frame_count, tracker):
     Return:
         Sampled video
     """
-    alpha       = 1.6
-    upper_limit = 3.0
-    lower_limit = 0.2
-
-    indices = tf.range(start=0., limit=float(sample_dims), delta=1., dtype=tf.float32)
-
-    # Sinusoidal variation with alpha being the DC offset
-    r_alpha = (alpha + (upper_limit - lower_limit) / 2.0 * tf.sin(tf.cast(tracker,tf.float32))) * tf.cast(frame_count, tf.float32) / float(sample_dims)
-
-    indices = tf.multiply(tf.tile([r_alpha], [int(sample_dims)]), indices)
-    indices = tf.clip_by_value(indices, 0., tf.cast(frame_count-1, tf.float32))
-
-    indices = tf.cast(indices, tf.int32)
-    output  = tf.gather(video, tf.convert_to_tensor(indices))
-    return output, (alpha + (upper_limit - lower_limit) / 2.0 * tf.sin(tf.cast(tracker,tf.float32)))
+    return temporal_resample(video, sample_dims, frame_count, method='sr', tracker=tracker)
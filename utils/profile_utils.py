@@ -0,0 +1,326 @@
+"""
+PER LAYER PROFILES OF MODELS: OUTPUT SHAPE, PARAMETERS, FLOPS AND ACTIVATION MEMORY OF EVERY LAYER RECORDED IN THE MODEL_LAYERS COLLECTION
+(SEE set_record_layers IN utils/layers_utils.py), AND OPTIONALLY THEIR MEASURED FORWARD AND BACKWARD TIMES. USED BY profile_models.py.
+
+The ops of a layer are the ones its output depends on, back to the outputs of the previous layers or the inputs of the model. Ops not recorded as a
+layer (e.g. a ReLU applied to a layer's output before a pooling) are counted in the first layer built on them. FLOPs count a multiply-add as two
+operations and are computed from static shapes for convolutions, matrix products, pooling, reductions and elementwise ops. Ops inside while loops
+(e.g. the LSTM of ResNet with set_fused_lstm(False)) are counted for a single iteration, the fused LSTM block kernel is not counted.
+"""
+
+import json
+import time
+
+import numpy      as np
+import tensorflow as tf
+
+from utils.layers_utils import MODEL_LAYERS
+
+
+# FLOPs per output element of elementwise ops
+ELEMENTWISE_FLOPS = {'Add': 1, 'BiasAdd': 1, 'Sub': 1, 'Mul': 1, 'RealDiv': 1, 'Maximum': 1, 'Minimum': 1, 'Square': 1, 'Rsqrt': 1, 'Sqrt': 1,
+                     'Relu': 1, 'Relu6': 1, 'Elu': 1, 'Sigmoid': 4, 'Tanh': 4, 'Softmax': 5, 'FusedBatchNorm': 2}
+
+# Convolution and pooling ops, whose cost per output element is the size of their window
+CONV_OPS = ['Conv2D', 'Conv3D', 'DepthwiseConv2dNative']
+POOL_OPS = ['MaxPool', 'AvgPool', 'MaxPool3D', 'AvgPool3D']
+
+# Reductions, whose cost is the size of their input
+REDUCTION_OPS = ['Mean', 'Sum', 'Max', 'Min', 'Prod']
+
+# Ops whose outputs are not activations
+NON_ACTIVATION_OPS = ['Const', 'VariableV2', 'Variable', 'Identity', 'Shape', 'Reshape', 'ExpandDims', 'Squeeze', 'StopGradient', 'NoOp']
+
+
+def _num_elements(tensor):
+    shape = tensor.get_shape()
+
+    if not shape.is_fully_defined():
+        return None
+
+    # END IF
+
+    return int(np.prod(shape.as_list()))
+
+
+def op_flops(op):
+    """
+    Args:
+        :op: Tensorflow operation
+
+    Return:
+        Number of floating point operations of op computed from the static shapes of its inputs and outputs, 0 when they are unknown or the op is not counted
+    """
+    if len(op.outputs) == 0 or not op.outputs[0].dtype.is_floating:
+        return 0
+
+    # END IF
+
+    output_size = _num_elements(op.outputs[0])
+
+    if output_size is None:
+        return 0
+
+    # END IF
+
+    if op.type in CONV_OPS:
+        kernel_dims = op.inputs[1].get_shape().as_list()
+
+        if op.type == 'DepthwiseConv2dNative':
+            return 2 * output_size * int(np.prod(kernel_dims[:2]))
+
+        # END IF
+
+        return 2 * output_size * int(np.prod(kernel_dims[:-1]))
+
+    elif op.type in ['MatMul', 'BatchMatMul']:
+        input_dims = op.inputs[0].get_shape().as_list()
+        transposed = op.get_attr('transpose_a' if op.type == 'MatMul' else 'adj_x')
+
+        return 2 * output_size * input_dims[-2 if transposed else -1]
+
+    elif op.type in POOL_OPS:
+        return output_size * int(np.prod(op.get_attr('ksize')))
+
+    elif op.type in REDUCTION_OPS:
+        return _num_elements(op.inputs[0]) or 0
+
+    elif op.type == 'AddN':
+        return output_size * (len(op.inputs) - 1)
+
+    elif op.type in ELEMENTWISE_FLOPS:
+        return output_size * ELEMENTWISE_FLOPS[op.type]
+
+    # END IF
+
+    return 0
+
+
+def _layer_ops(output, stop_ts, assigned):
+    """
+    Args:
+        :output:   Output tensor of the layer
+        :stop_ts:  Set of tensors at which the walk stops (outputs of the other layers and inputs of the model)
+        :assigned: Set of ops already counted in a previous layer, updated with the ops returned
+
+    Return:
+        Ops computing output and the tensors of stop_ts they read
+    """
+    ops    = []
+    inputs = []
+    queue  = [output.op]
+
+    while len(queue) > 0:
+        op = queue.pop()
+
+        if op in assigned:
+            continue
+
+        # END IF
+
+        assigned.add(op)
+        ops.append(op)
+
+        for tensor in op.inputs:
+            if tensor in stop_ts and tensor is not output:
+                if tensor not in inputs:
+                    inputs.append(tensor)
+
+                # END IF
+
+            else:
+                queue.append(tensor.op)
+
+            # END IF
+
+        # END FOR
+
+    # END WHILE
+
+    return ops, inputs
+
+
+def profile_layers(inputs):
+    """
+    Profile the layers recorded in the MODEL_LAYERS collection of the default graph
+    Args:
+        :inputs: Input tensor of the model, its ops are not counted
+
+    Return:
+        List of dictionaries, one per layer in the order in which the layers were added, with keys:
+            name, shape (static output shape), params (number of weights read by the layer, batch normalization statistics included),
+            flops, output_bytes (size of the output), activation_bytes (size of the outputs of every op of the layer, the most that training keeps for backpropagation),
+            output (output tensor), inputs (tensors of the previous layers read by the layer) and variables (variables read by the layer)
+    """
+    variables = dict((var.op, var) for var in tf.global_variables())
+    layers    = tf.get_collection(MODEL_LAYERS)
+    stop_ts   = set([inputs] + [output for _, output in layers])
+    assigned  = set([inputs.op])
+    profiles  = []
+
+    for name, output in layers:
+        ops, layer_inputs = _layer_ops(output, stop_ts, assigned)
+        layer_variables   = [variables[op] for op in ops if op in variables]
+        activations       = [tensor for op in ops if op.type not in NON_ACTIVATION_OPS for tensor in op.outputs if tensor.dtype.is_floating]
+
+        profiles.append({'name':             name,
+                         'shape':            output.get_shape().as_list(),
+                         'params':           sum([_num_elements(var) or 0 for var in layer_variables]),
+                         'flops':            sum([op_flops(op) for op in ops]),
+                         'output_bytes':     (_num_elements(output) or 0) * output.dtype.size,
+                         'activation_bytes': sum([(_num_elements(tensor) or 0) * tensor.dtype.size for tensor in activations]),
+                         'output':           output,
+                         'inputs':           layer_inputs,
+                         'variables':        layer_variables})
+
+    # END FOR
+
+    return profiles
+
+
+def timing_ops(profiles, loss=None):
+    """
+    Build the ops timed by time_layers: for every layer, the computation of its inputs, of its output and of the gradients of its output with respect to
+    its inputs and variables. Backward ops are only built for the layers that the gradient of loss reaches (not below a stop_gradient)
+    Args:
+        :profiles: List returned by profile_layers
+        :loss:     Training loss of the model, None to time the forward pass only
+
+    Return:
+        List of (input op, forward op, backward op or None) per layer
+    """
+    if loss is not None:
+        reached = [gradient is not None for gradient in tf.gradients(loss, [profile['output'] for profile in profiles])]
+
+    else:
+        reached = [False] * len(profiles)
+
+    # END IF
+
+    ops = []
+
+    for profile, backward in zip(profiles, reached):
+        input_op   = tf.group(*[tensor.op for tensor in profile['inputs']]) if len(profile['inputs']) > 0 else tf.no_op()
+        forward_op = profile['output'].op
+
+        if backward:
+            gradients   = tf.gradients(profile['output'], profile['inputs'] + [var.value() for var in profile['variables']])
+            gradients   = [gradient for gradient in gradients if gradient is not None]
+            backward_op = tf.group(*gradients) if len(gradients) > 0 else None
+
+        else:
+            backward_op = None
+
+        # END IF
+
+        ops.append((input_op, forward_op, backward_op))
+
+    # END FOR
+
+    return ops
+
+
+def _median_time(sess, op, num_steps, warmup_steps):
+    for step in range(warmup_steps):
+        sess.run(op)
+
+    # END FOR
+
+    step_times = []
+
+    for step in range(num_steps):
+        start = time.time()
+        sess.run(op)
+        step_times.append(time.time() - start)
+
+    # END FOR
+
+    return np.median(step_times)
+
+
+def time_layers(sess, profiles, ops, num_steps, warmup_steps):
+    """
+    Measure the forward and backward time of every layer, as the difference of the median times of running the layer's inputs, its output and the gradients
+    of its output. Adds the keys forward_ms and backward_ms (None for layers without backward op) to profiles
+    Args:
+        :sess:         Tensorflow session with initialized variables
+        :profiles:     List returned by profile_layers
+        :ops:          List returned by timing_ops
+        :num_steps:    Number of timed runs of each op
+        :warmup_steps: Number of untimed runs of each op before timing
+    """
+    for profile, (input_op, forward_op, backward_op) in zip(profiles, ops):
+        input_time   = _median_time(sess, input_op, num_steps, warmup_steps)
+        forward_time = _median_time(sess, forward_op, num_steps, warmup_steps)
+
+        profile['forward_ms']  = (forward_time - input_time) * 1000
+        profile['backward_ms'] = None
+
+        if backward_op is not None:
+            profile['backward_ms'] = (_median_time(sess, backward_op, num_steps, warmup_steps) - forward_time) * 1000
+
+        # END IF
+
+    # END FOR
+
+
+def _format(value, fmt):
+    return '-' if value is None else fmt % value
+
+
+def print_profiles(profiles):
+    """
+    Print profiles as a table, followed by their totals
+    Args:
+        :profiles: List returned by profile_layers, optionally timed by time_layers
+    """
+    timed = 'forward_ms' in profiles[0] if len(profiles) > 0 else False
+
+    print "%-28s %-24s %12s %12s %12s %14s %10s %10s" % ('layer', 'output shape', 'params', 'MFLOPs', 'output (MB)', 'activations (MB)', 'fwd (ms)', 'bwd (ms)')
+
+    for profile in profiles:
+        print "%-28s %-24s %12d %12.1f %12.2f %14.2f %10s %10s" % (profile['name'], 'x'.join([str(dim) for dim in profile['shape']]), profile['params'],
+                                                                  profile['flops'] / 1e6, profile['output_bytes'] / 2.**20, profile['activation_bytes'] / 2.**20,
+                                                                  _format(profile.get('forward_ms'), '%.2f'), _format(profile.get('backward_ms'), '%.2f'))
+
+    # END FOR
+
+    totals = summarize_profiles(profiles)
+
+    print "%-28s %-24s %12d %12.1f %12.2f %14.2f %10s %10s" % ('total', '', totals['params'], totals['flops'] / 1e6, totals['output_bytes'] / 2.**20,
+                                                              totals['activation_bytes'] / 2.**20, _format(totals['forward_ms'] if timed else None, '%.2f'),
+                                                              _format(totals['backward_ms'] if timed else None, '%.2f'))
+
+
+def summarize_profiles(profiles):
+    """
+    Args:
+        :profiles: List returned by profile_layers, optionally timed by time_layers
+
+    Return:
+        Dictionary of the totals of params, flops, output_bytes, activation_bytes, forward_ms and backward_ms over every layer
+    """
+    totals = {}
+
+    for key in ['params', 'flops', 'output_bytes', 'activation_bytes', 'forward_ms', 'backward_ms']:
+        totals[key] = sum([profile[key] for profile in profiles if profile.get(key) is not None])
+
+    # END FOR
+
+    return totals
+
+
+def write_profiles(path, profiles, config):
+    """
+    Write profiles and their totals to a JSON file, which can be compared across models and configurations
+    Args:
+        :path:     Path of the JSON file
+        :profiles: List returned by profile_layers, optionally timed by time_layers
+        :config:   Dictionary describing the profiled model and inputs, written as is
+    """
+    layers = [dict((key, value) for key, value in profile.items() if key not in ['output', 'inputs', 'variables']) for profile in profiles]
+
+    with open(path, 'w') as f:
+        json.dump({'config': config, 'layers': layers, 'totals': summarize_profiles(profiles)}, f, indent=2, sort_keys=True)
+
+    # END WITH
@@ -0,0 +1,164 @@
+"""
+POST-TRAINING 8-BIT QUANTIZATION OF FROZEN INFERENCE GRAPHS (SEE utils/export_utils.py) WITH THE GRAPH TRANSFORM TOOL (TENSORFLOW >= 1.3).
+
+quantize_graph turns weights into 8-bit constants and Conv2D, MatMul, pooling, ReLU, etc. into their quantized version. The range of the 32-bit
+output of every quantized op is then computed at each run by a RequantizationRange op. calibrate_requantization_ranges records these ranges on
+calibration clips and freeze_requantization_ranges replaces the ops by constants, so that the activations are requantized to 8 bits with fixed ranges.
+Conv3D has no quantized kernel, 3D convolutions are quantized when built as 2D convolutions (see set_conv3d_as_conv2d in utils/layers_utils.py).
+"""
+
+import numpy      as np
+import tensorflow as tf
+
+
+# Transforms of the Graph Transform Tool quantizing a frozen graph
+QUANTIZE_TRANSFORMS = ['add_default_attributes', 'strip_unused_nodes', 'remove_nodes(op=Identity, op=CheckNumerics, op=StopGradient)',
+                       'fold_constants(ignore_errors=true)', 'fold_batch_norms', 'fold_old_batch_norms', 'quantize_weights', 'quantize_nodes',
+                       'strip_unused_nodes', 'sort_by_execution_order']
+
+# Transforms cleaning up a quantized graph once its requantization ranges are constants
+FREEZE_TRANSFORMS = ['fold_constants(ignore_errors=true)', 'strip_unused_nodes', 'sort_by_execution_order']
+
+
+def _transform_graph(graph_def, input_name, output_names, transforms):
+    try:
+        from tensorflow.tools.graph_transforms import TransformGraph
+
+    except ImportError:
+        raise ImportError("Quantization requires tensorflow.tools.graph_transforms (tensorflow >= 1.3)")
+
+    # END TRY
+
+    return TransformGraph(graph_def, [input_name], output_names, transforms)
+
+
+def quantize_graph(graph_def, input_name, output_names):
+    """
+    Args:
+        :graph_def:    Frozen float32 GraphDef
+        :input_name:   Name of the input placeholder
+        :output_names: List of names of the output ops
+
+    Return:
+        GraphDef with 8-bit weights and quantized ops, whose requantization ranges are still computed at each run
+    """
+    return _transform_graph(graph_def, input_name, output_names, QUANTIZE_TRANSFORMS)
+
+
+def calibrate_requantization_ranges(graph_def, input_name, batches, verbose=True):
+    """
+    Run a quantized graph on calibration inputs and record the range of the outputs of each of its RequantizationRange ops
+    Args:
+        :graph_def:  GraphDef returned by quantize_graph
+        :input_name: Name of the input placeholder
+        :batches:    List of input arrays
+        :verbose:    Boolean to indicate if all print statement should be procesed or not
+
+    Return:
+        Dictionary mapping the names of the RequantizationRange ops to the (min, max) of their outputs over all batches
+    """
+    graph = tf.Graph()
+
+    with graph.as_default():
+        tf.import_graph_def(graph_def, name='')
+
+    # END WITH
+
+    range_ops = [op for op in graph.get_operations() if op.type == 'RequantizationRange']
+    clips     = graph.get_tensor_by_name(input_name + ':0')
+    ranges    = {}
+
+    if verbose:
+        print "Calibrating %d requantization ranges on %d batches" % (len(range_ops), len(batches))
+
+    # END IF
+
+    # Quantized kernels are only available on the CPU
+    with tf.Session(graph=graph, config=tf.ConfigProto(device_count={'GPU': 0})) as sess:
+        for batch in batches:
+            values = sess.run([list(op.outputs) for op in range_ops], feed_dict={clips: batch})
+
+            for op, (range_min, range_max) in zip(range_ops, values):
+                if op.name in ranges:
+                    range_min = min(range_min, ranges[op.name][0])
+                    range_max = max(range_max, ranges[op.name][1])
+
+                # END IF
+
+                ranges[op.name] = (float(range_min), float(range_max))
+
+            # END FOR
+
+        # END FOR
+
+    # END WITH
+
+    return ranges
+
+
+def freeze_requantization_ranges(graph_def, input_name, output_names, ranges):
+    """
+    Replace the RequantizationRange ops of a quantized graph by constants, as the freeze_requantization_ranges transform of the Graph Transform Tool
+    does from a log file
+    Args:
+        :graph_def:    GraphDef returned by quantize_graph
+        :input_name:   Name of the input placeholder
+        :output_names: List of names of the output ops
+        :ranges:       Dictionary returned by calibrate_requantization_ranges
+
+    Return:
+        Quantized GraphDef with fixed requantization ranges
+    """
+    frozen = tf.GraphDef()
+    frozen.versions.CopyFrom(graph_def.versions)
+
+    for node in graph_def.node:
+        if node.name in ranges:
+            for suffix, value in zip(['min', 'max'], ranges[node.name]):
+                const        = frozen.node.add()
+                const.op     = 'Const'
+                const.name   = node.name + '/frozen_' + suffix
+                const.device = node.device
+                const.attr['dtype'].type = tf.float32.as_datatype_enum
+                const.attr['value'].tensor.CopyFrom(tf.make_tensor_proto(value, tf.float32))
+
+            # END FOR
+
+            continue
+
+        # END IF
+
+        copy = frozen.node.add()
+        copy.CopyFrom(node)
+
+        for idx, name in enumerate(copy.input):
+            control = name.startswith('^')
+            op_name = name.lstrip('^').split(':')[0]
+
+            if op_name in ranges:
+                # Output 0 of RequantizationRange is the minimum, output 1 the maximum
+                output_idx      = int(name.split(':')[1]) if ':' in name else 0
+                copy.input[idx] = ('^' if control else '') + op_name + '/frozen_' + ['min', 'max'][output_idx]
+
+            # END IF
+
+        # END FOR
+
+    # END FOR
+
+    return _transform_graph(frozen, input_name, output_names, FREEZE_TRANSFORMS)
+
+
+def agreement(reference, quantized):
+    """
+    Args:
+        :reference: Outputs of the float32 graph [clips, ..., classes]
+        :quantized: Outputs of the quantized graph for the same clips
+
+    Return:
+        Fraction of equal top-1 predictions and largest absolute difference
+    """
+    reference = np.asarray(reference)
+    quantized = np.asarray(quantized)
+
+    return np.mean(np.argmax(reference, -1) == np.argmax(quantized, -1)), np.abs(reference - quantized).max()
@@ -0,0 +1,97 @@
+"""
+GRADIENTS WITH RECOMPUTATION OF ACTIVATIONS (GRADIENT CHECKPOINTING). WITH set_recompute(True), MODELS STORE THE OUTPUT OF EACH OF THEIR RECOMPUTE
+BOUNDARIES BEHIND tf.stop_gradient (SEE LayerDict IN utils/layers_utils.py), SPLITTING THE FORWARD PASS INTO SEGMENTS. recompute_gradients
+BACKPROPAGATES THROUGH THE SEGMENTS ONE AT A TIME, FROM THE LAST ONE, RUNNING A COPY OF EACH SEGMENT AGAIN ONCE THE GRADIENT OF ITS OUTPUT IS AVAILABLE.
+THE ACTIVATIONS INSIDE THE SEGMENTS ARE THEN FREED DURING THE FORWARD PASS, AT THE COST OF A SECOND FORWARD PASS OF THE SEGMENTS.
+"""
+
+import tensorflow                        as tf
+import tensorflow.contrib.graph_editor   as ge
+
+
+def _sum(values):
+    values = [value for value in values if value is not None]
+
+    if len(values) == 0:
+        return None
+
+    # END IF
+
+    return values[0] if len(values) == 1 else tf.add_n(values)
+
+
+def recompute_gradients(loss, var_list, boundaries):
+    """
+    Args:
+        :loss:       Loss tensor
+        :var_list:   List of variables to differentiate the loss with respect to
+        :boundaries: List of (layer output, stopped layer output) pairs in the order in which they were built, from the RECOMPUTE_BOUNDARIES
+                     collection. Pairs of other towers are ignored.
+
+    Return:
+        List of (gradient, variable) pairs, as returned by compute_gradients of optimizers
+    """
+    # Boundaries of the model computing loss
+    ancestors  = set(ge.get_backward_walk_ops([loss.op], inclusive=True))
+    boundaries = [(output, stopped) for output, stopped in boundaries if stopped.op in ancestors]
+    stopped_ts = [stopped for _, stopped in boundaries]
+
+    # Ops depending on the variables, which are recomputed. The input pipeline and the reads of the variables are not.
+    var_ops   = set([var.op for var in var_list] + [var.value().op for var in var_list])
+    dependent = set(op for op in ge.get_forward_walk_ops([var.value().op for var in var_list], inclusive=False) if op not in var_ops)
+
+    var_grads     = dict((var, []) for var in var_list)
+    stopped_grads = [[] for _ in boundaries]
+
+    # Layers after the last boundary are not recomputed, so that random ops (e.g. dropout) match the forward pass
+    values = tf.gradients(loss, stopped_ts[-1:] + var_list)
+
+    if len(boundaries) > 0:
+        stopped_grads[-1].append(values[0])
+
+    # END IF
+
+    for var, value in zip(var_list, values[len(stopped_ts[-1:]):]):
+        var_grads[var].append(value)
+
+    # END FOR
+
+    for idx in reversed(range(len(boundaries))):
+        output      = boundaries[idx][0]
+        output_grad = _sum(stopped_grads[idx])
+
+        if output_grad is None:
+            continue
+
+        # END IF
+
+        # Copy of the segment, reading the kept outputs of the previous boundaries, run once the gradient of its output is available
+        segment_ops = [op for op in ge.get_backward_walk_ops([output.op], inclusive=True, stop_at_ts=stopped_ts) if op in dependent]
+
+        if len(segment_ops) == 0:
+            continue
+
+        # END IF
+
+        copied_sgv, info = ge.copy_with_input_replacements(ge.sgv(segment_ops), {})
+
+        for op in copied_sgv.ops:
+            ge.add_control_inputs(op, [output_grad.op])
+
+        # END FOR
+
+        values = tf.gradients(info.transformed(output), stopped_ts[:idx] + var_list, grad_ys=output_grad)
+
+        for previous_idx in range(idx):
+            stopped_grads[previous_idx].append(values[previous_idx])
+
+        # END FOR
+
+        for var, value in zip(var_list, values[idx:]):
+            var_grads[var].append(value)
+
+        # END FOR
+
+    # END FOR
+
+    return [(_sum(var_grads[var]), var) for var in var_list]
@@ -0,0 +1,242 @@
+"""
+TEMPORAL SAMPLING UTILITIES. PROVIDES PRECOMPUTED FRAME INDEX TABLES AND A SINGLE INTERFACE TO ALL RESAMPLING STRATEGIES (cvr, rr, sr)
+"""
+
+import numpy      as np
+import tensorflow as tf
+
+# Range of resampling factors used by random (rr) and sinusoidal (sr) resampling, the sinusoid oscillates around _SR_ALPHA
+_SR_ALPHA    = 1.6
+_UPPER_ALPHA = 3.0
+_LOWER_ALPHA = 0.2
+
+# Largest frame count covered by a precomputed index table when only sample_dims and alpha are known while building the graph
+_MAX_TABLE_FRAMES = 512
+
+# Memoized index vectors and tables, keyed by (frame_count, sample_dims, alpha) and (sample_dims, alpha, max_frames)
+_INDEX_CACHE = {}
+_TABLE_CACHE = {}
+
+# Draw every random temporal offset, segment index, crop and flip of the preprocessing at the lowest value of its range, see set_deterministic_draws
+_DETERMINISTIC_DRAWS = False
+
+
+def _static_value(value):
+    """
+    Return the python value of a number or constant tensor, None if it is only known at run time
+    Args:
+        :value: Python number or tensor
+
+    Return:
+        Python number or None
+    """
+    if isinstance(value, tf.Tensor) or isinstance(value, tf.Variable):
+        value = tf.contrib.util.constant_value(tf.convert_to_tensor(value))
+
+        if value is not None:
+            value = value.item()
+
+        # END IF
+
+    # END IF
+
+    return value
+
+
+def sampling_indices(frame_count, sample_dims, alpha=1.0):
+    """
+    Frame indices selected when sampling sample_dims frames from a video of frame_count frames at relative rate alpha.
+    Uses the same float32 arithmetic as the graph implementation and memoizes every result.
+    Args:
+        :frame_count: Total number of frames
+        :sample_dims: Number of frames to be provided as input to model
+        :alpha:       Relative sampling rate
+
+    Return:
+        Numpy int32 vector of length sample_dims
+    """
+    key = (int(frame_count), int(sample_dims), float(alpha))
+
+    if key not in _INDEX_CACHE:
+        r_alpha = np.float32(alpha) * np.float32(frame_count) / np.float32(sample_dims)
+        indices = np.arange(sample_dims, dtype=np.float32) * r_alpha
+        indices = np.clip(indices, np.float32(0.), np.float32(frame_count - 1))
+
+        _INDEX_CACHE[key] = indices.astype(np.int32)
+
+    # END IF
+
+    return _INDEX_CACHE[key]
+
+
+def sampling_index_table(sample_dims, alpha=1.0, max_frames=_MAX_TABLE_FRAMES):
+    """
+    Table whose row f holds the frame indices used to sample sample_dims frames from a video of f frames (row 0 is unused).
+    All rows are computed at once and the table is memoized.
+    Args:
+        :sample_dims: Number of frames to be provided as input to model
+        :alpha:       Relative sampling rate
+        :max_frames:  Largest frame count covered by the table
+
+    Return:
+        Numpy int32 array of shape [max_frames+1, sample_dims]
+    """
+    key = (int(sample_dims), float(alpha), int(max_frames))
+
+    if key not in _TABLE_CACHE:
+        frame_counts = np.arange(max_frames + 1, dtype=np.float32).reshape(-1, 1)
+        r_alpha      = np.float32(alpha) * frame_counts / np.float32(sample_dims)
+        indices      = np.arange(sample_dims, dtype=np.float32).reshape(1, -1) * r_alpha
+        indices      = np.clip(indices, np.float32(0.), np.maximum(frame_counts - 1, 0))
+
+        _TABLE_CACHE[key] = indices.astype(np.int32)
+
+    # END IF
+
+    return _TABLE_CACHE[key]
+
+
+def _graph_indices(frame_count, sample_dims, alpha):
+    """
+    Index vector built from graph ops, used when sample_dims or alpha are only known at run time
+    Args:
+        :frame_count: Total number of frames
+        :sample_dims: Number of frames to be provided as input to model
+        :alpha:       Relative sampling rate
+
+    Return:
+        Int32 index tensor of length sample_dims
+    """
+    sample_dims = tf.cast(sample_dims, tf.float32)
+    r_alpha     = alpha * tf.cast(frame_count, tf.float32) / sample_dims
+    indices     = tf.range(start=0., limit=sample_dims, delta=1., dtype=tf.float32) * r_alpha
+    indices     = tf.clip_by_value(indices, 0., tf.cast(frame_count-1, tf.float32))
+
+    return tf.cast(indices, tf.int32)
+
+
+def temporal_indices(frame_count, sample_dims, alpha=1.0):
+    """
+    Return the frame indices used to resample a video, taken from the precomputed tables whenever the inputs allow it
+    Args:
+        :frame_count: Total number of frames (python integer or int32 tensor)
+        :sample_dims: Number of frames to be provided as input to model (python integer or int32 tensor)
+        :alpha:       Relative sampling rate (python float or float32 tensor)
+
+    Return:
+        Int32 index tensor of length sample_dims
+    """
+    static_frames = _static_value(frame_count)
+    static_dims   = _static_value(sample_dims)
+    static_alpha  = _static_value(alpha)
+
+    if (static_dims is None) or (static_alpha is None):
+        return _graph_indices(frame_count, sample_dims, alpha)
+
+    # END IF
+
+    if static_frames is not None:
+        return tf.constant(sampling_indices(static_frames, static_dims, static_alpha))
+
+    # END IF
+
+    # Only the frame count is dynamic: look up its row in the table, falling back to graph ops for very long videos
+    table = tf.constant(sampling_index_table(static_dims, static_alpha))
+
+    return tf.cond(tf.less_equal(frame_count, _MAX_TABLE_FRAMES),
+                   lambda: tf.gather(table, frame_count),
+                   lambda: _graph_indices(frame_count, static_dims, static_alpha))
+
+
+def resampling_alpha(method, alpha=1.0, tracker=None):
+    """
+    Return the resampling factor used by a resampling strategy
+    Args:
+        :method:  'cvr' (constant value), 'rr' (random, drawn from [0.2, 3.0] for every clip) or 'sr'/'sinusoidal'
+        :alpha:   Resampling factor used by cvr
+        :tracker: Number of videos that have been loaded in total during training, required by sr
+
+    Return:
+        Python float or float32 scalar tensor
+    """
+    if method == 'cvr':
+        return alpha
+
+    elif method == 'rr':
+        return tf.random_uniform([], minval=_LOWER_ALPHA, maxval=_UPPER_ALPHA, dtype=tf.float32)
+
+    elif method in ['sr', 'sinusoidal']:
+        # Sinusoidal variation with _SR_ALPHA being the DC offset
+        return _SR_ALPHA + (_UPPER_ALPHA - _LOWER_ALPHA) / 2.0 * tf.sin(tf.cast(tracker, tf.float32))
+
+    else:
+        raise ValueError('Unknown resampling method: ' + str(method))
+
+    # END IF
+
+
+def temporal_resample(video, sample_dims, frame_count, alpha=1.0, method='cvr', tracker=None):
+    """
+    Resample a video along time using one of the available strategies
+    Args:
+        :video:       Video tensor of shape [frames, height, width, channels]
+        :sample_dims: Number of frames to be provided as input to model
+        :frame_count: Total number of frames
+        :alpha:       Relative sampling rate, used by cvr
+        :method:      Resampling strategy ('cvr', 'rr', 'sr' or 'sinusoidal')
+        :tracker:     Number of videos that have been loaded in total during training, required by sr
+
+    Return:
+        Resampled video and the resampling factor that was used
+    """
+    alpha        = resampling_alpha(method, alpha, tracker)
+    static_alpha = _static_value(alpha)
+    static_dims  = _static_value(sample_dims)
+
+    # Sampling every frame at rate 1 is the identity, skip the gather entirely
+    if static_alpha == 1.0:
+        if (sample_dims is frame_count) or ((static_dims is not None) and (static_dims == _static_value(frame_count))):
+            return video, alpha
+
+        # END IF
+
+    # END IF
+
+    return tf.gather(video, temporal_indices(frame_count, sample_dims, alpha)), alpha
+
+
+def set_deterministic_draws(enabled):
+    """
+    Enable or disable (default) deterministic draws in the tensorflow preprocessing built afterwards and in the NumPy preprocessing.
+    Every random draw then takes the lowest value of its range (no offset, first segment frame, no flip), identical in both backends,
+    used to compare their outputs (see benchmark_preprocessing.py)
+    Args:
+        :enabled: Boolean
+    """
+    global _DETERMINISTIC_DRAWS
+    _DETERMINISTIC_DRAWS = enabled
+
+
+def deterministic_draws():
+    """ Return: Boolean indicating whether random draws take the lowest value of their range, see set_deterministic_draws """
+    return _DETERMINISTIC_DRAWS
+
+
+def random_draw(shape, minval, maxval, dtype=tf.float32):
+    """
+    tf.random_uniform, or minval in every element when deterministic draws are enabled
+    Args:
+        :shape:  Shape of the output
+        :minval: Lower bound of the range (inclusive)
+        :maxval: Upper bound of the range (exclusive)
+        :dtype:  Type of the output
+
+    Return:
+        Tensor of the given shape and dtype
+    """
+    if _DETERMINISTIC_DRAWS:
+        return tf.fill(shape, tf.cast(minval, dtype))
+
+    # END IF
+
+    return tf.random_uniform(shape, minval=minval, maxval=maxval, dtype=dtype)
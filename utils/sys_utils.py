@@ -1,8 +1,12 @@
 import os
+import contextlib
 
 import numpy      as np
 import tensorflow as tf
 
+# XLA JIT compilation of the graphs built and run afterwards, see set_xla
+_XLA = 'none'
+
 
 def make_dir(path):
     """ Create a directory if there isn't one already. """
@@ -10,3 +14,64 @@ def make_dir(path):
         os.mkdir(path)
     except OSError:
         pass
+
+
+def set_xla(mode):
+    """
+    Select the XLA JIT compilation of graphs built and sessions created afterwards, used by train.py, test.py and benchmark_models.py
+    Args:
+        :mode: 'none' (default), 'global' (every op of the session that XLA supports) or 'scoped' (the ops of the models built inside jit_scope)
+    """
+    assert(mode in ['none', 'global', 'scoped'])
+
+    global _XLA
+    _XLA = mode
+
+
+def session_config(**kwargs):
+    """
+    Args:
+        :kwargs: Arguments of tf.ConfigProto
+
+    Return:
+        Session configuration enabling global JIT compilation when set_xla('global') was called
+    """
+    config = tf.ConfigProto(**kwargs)
+
+    if _XLA == 'global':
+        config.graph_options.optimizer_options.global_jit_level = tf.OptimizerOptions.ON_1
+
+    # END IF
+
+    return config
+
+
+@contextlib.contextmanager
+def _no_scope():
+    yield
+
+
+def jit_scope():
+    """
+    Return: Context in which the ops created, and their gradients, are compiled by XLA when set_xla('scoped') was called, does nothing otherwise.
+            XLA compiles every input shape separately, inputs should have a static shape (see check_static_shape)
+    """
+    if _XLA == 'scoped':
+        return tf.contrib.compiler.jit.experimental_jit_scope()
+
+    # END IF
+
+    return _no_scope()
+
+
+def check_static_shape(tensor, name):
+    """
+    Print a notice when XLA is enabled and the shape of an input of the models is not fully known when the graph is built
+    Args:
+        :tensor: Input tensor of the models
+        :name:   Name of the input in the notice
+    """
+    if _XLA != 'none' and not tensor.get_shape().is_fully_defined():
+        print "Notice: " + name + " has a dynamic shape " + str(tensor.get_shape().as_list()) + ", XLA compiles the model again for every new shape"
+
+    # END IF